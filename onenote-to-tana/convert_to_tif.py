@@ -1,53 +1,151 @@
 import argparse
+import copy
 import pywintypes
 import win32com.client as win32
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 from xml.etree import ElementTree
 
+from onenote.catalogue import PageCatalogue
+from onenote.filters import PageFilter, hierarchy_time
+from onenote.onenote import ConvertOptions, HierarchyScope
 from onenote.notebooks import find_notebooks, get_notebooks, ui_handle_notebooks
 from onenote.sections import find_sections, get_sections, ui_handle_sections
 from onenote.pages import find_pages, handle_pages_all, ui_handle_pages
+from onenote.prefetch import PrefetchingApp
+from tanatypes.output import COMPRESSIONS, FORMATS
+from utilities.logs import setup_logging
 
 
-def ui_handle_elements(element_name: str, dictionary: Dict[str, ElementTree.Element], outfile: str, handler: Callable) -> bool:
+def ui_handle_elements(element_name: str, dictionary: Dict[str, ElementTree.Element], options: ConvertOptions, handler: Callable) -> bool:
     if dictionary:
         print(f'] {len(dictionary)} {element_name}')
-        handler(onenote_app, dictionary, outfile)
+        handler(onenote_app, dictionary, options)
         return True
     else:
         print(f'] no {element_name}')
         return False
 
+def shard_type(value: str) -> Tuple[int, int]:
+    try:
+        shard, shards = (int(number) for number in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'"{value}" is not of the form i/n')
+    if not 0 <= shard < shards:
+        raise argparse.ArgumentTypeError(f'shard {shard} is not within 0 to {shards - 1}')
+    return shard, shards
+
+def time_type(value: str) -> str:
+    try:
+        return hierarchy_time(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'"{value}" is not an ISO date, e.g. 2024-03-01 or 2024-03-01T12:00')
+
 def ui_handle_onenote_elements(onenote_app: Any, notebooks: Dict[str, ElementTree.Element], 
                                sections: Optional[Dict[str, ElementTree.Element]] = None, 
                                pages: Optional[Dict[str, ElementTree.Element]] = None,
-                               outfile: str = None):
-    if ui_handle_elements('pages', pages, outfile, ui_handle_pages): return
-    if ui_handle_elements('sections', sections, outfile, ui_handle_sections): return
-    if ui_handle_elements('notebooks', notebooks, outfile, ui_handle_notebooks): return
+                               options: ConvertOptions = None):
+    if ui_handle_elements('pages', pages, options, ui_handle_pages): return
+    if ui_handle_elements('sections', sections, options, ui_handle_sections): return
+    if ui_handle_elements('notebooks', notebooks, options, ui_handle_notebooks): return
 
 if __name__ == "__main__":
     narrowed = None
-    parser = argparse.ArgumentParser(description='Convert some notes from OneNote for Tana to import.')
+    onenote_app = None
+    parser = argparse.ArgumentParser(description='Convert some notes from OneNote for Tana to import.',
+                                     epilog="Names are selected by substring, by glob pattern (e.g. 'Meeting*'), "
+                                            "or by regular expression prefixed with 're:' (e.g. 're:^2024-').")
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('-u', '--user', action='store_true', help='Interactively select pages for conversion')
     group.add_argument('-a', '--all', action='store_true', help='Automatically select all pages found for conversion')
+    group.add_argument('--assemble', nargs='+', metavar='DIR', help='Merge the page fragments in DIR(s) into one TIF, see --fragments')
+    group.add_argument('--estimate', type=float, nargs='?', const=0.05, metavar='FRACTION',
+                       help='Estimate the time, size, and node counts of converting the selected pages from a sample of them (default: 0.05 of them)')
+    group.add_argument('--analyze', action='store_true',
+                       help='Profile the selected pages (tags, nesting, tables, images, costliest pages, constructs not converted) without converting them')
+    group.add_argument('--report', type=str, metavar='DB', help='Show throughput trends, slowest pages, and regressions recorded in the run history DB, see --history')
+    group.add_argument('--watch', type=str, metavar='OUTBOX', help='Keep running and write the pages changed in OneNote as small TIFs to OUTBOX')
     parser.add_argument('-o', '--output', type=str, metavar='FILE', help='Write to file instead of stdout')
     parser.add_argument('-n', '--notebook', type=str, help='Define the notebook (case sensitive)')
     parser.add_argument('-s', '--section', type=str, help='Define the section (case sensitive)')
     parser.add_argument('-p', '--page', nargs='+', help='Define one or multiple pages (case sensitive)')
+    parser.add_argument('--created-since', type=time_type, metavar='DATE', help='Only pages created on or after DATE (ISO, e.g. 2024-03-01)')
+    parser.add_argument('--created-before', type=time_type, metavar='DATE', help='Only pages created before DATE')
+    parser.add_argument('--modified-since', type=time_type, metavar='DATE', help='Only pages modified on or after DATE')
+    parser.add_argument('--modified-before', type=time_type, metavar='DATE', help='Only pages modified before DATE')
+    parser.add_argument('--max-level', type=int, metavar='N', help='Only pages up to page level N, 1 leaves out all subpages')
+    parser.add_argument('--path', action='append', metavar='SELECTOR', help='Only pages whose path "Notebook/Section Group/Section/Page" matches SELECTOR (repeatable)')
+    parser.add_argument('--exclude', action='append', metavar='SELECTOR', help='Leave out pages whose path matches SELECTOR, e.g. "*/Archive/*" (repeatable)')
+    parser.add_argument('--images', type=str, metavar='DIR', help='Store page images in DIR, each distinct image once')
+    parser.add_argument('--image-url', type=str, metavar='URL', help='Base URL DIR is served from, used for the image nodes (default: file URLs)')
+    parser.add_argument('--journal', type=str, metavar='FILE', help='Checkpoint converted pages to FILE (default: the output file with ".journal" appended)')
+    parser.add_argument('--resume', action='store_true', help='Skip the pages already converted in the journal and retry the failed ones')
+    parser.add_argument('--max-page-mb', type=int, default=1024, metavar='MB', help='Memory a single page may take to convert (default: %(default)s)')
+    parser.add_argument('--oversized', choices=['plain', 'skip'], default='plain', help='Convert pages exceeding --max-page-mb as plain text, or skip them (default: %(default)s)')
+    parser.add_argument('--dedup', action='store_true', help='Emit repeated content (e.g. from page templates) once, later occurrences as references')
+    parser.add_argument('--dedup-min-chars', type=int, default=32, metavar='N', help='Only deduplicate content of at least N characters (default: %(default)s)')
+    parser.add_argument('--drop-boilerplate', action='append', metavar='REGEX', help='Drop nodes whose text matches REGEX, e.g. "^Created with OneNote\\.$" (repeatable)')
+    parser.add_argument('--format', choices=FORMATS, default='pretty', help='pretty or compact JSON, or ndjson with one page per line (default: %(default)s)')
+    parser.add_argument('--compress', choices=COMPRESSIONS, help='Compress the output (default: by the extension of the output file, .gz or .xz)')
+    parser.add_argument('--fragments', type=str, metavar='DIR', help='Write one fragment file per page to DIR instead of a TIF (--resume skips existing ones)')
+    parser.add_argument('--shard', type=shard_type, metavar='I/N', help='Convert only share I (0 to N-1) of the selected pages, for spreading the work over N runs')
+    parser.add_argument('--interval', type=float, default=60, metavar='SECONDS', help='Seconds between checks for changes with --watch (default: %(default)s)')
+    parser.add_argument('--temp-dir', type=str, metavar='DIR', help='Publish the pages to DIR while converting (default: the temporary directory)')
+    parser.add_argument('--temp-quota-mb', type=int, metavar='MB', help='Fail pages that take the published pages above MB, before publishing them if their size is known from --stats')
+    parser.add_argument('--ram-dir', type=str, metavar='DIR', help='Publish pages expected to fit within --ram-quota-mb to DIR on a RAM disk (e.g. /dev/shm)')
+    parser.add_argument('--ram-quota-mb', type=int, default=256, metavar='MB', help='Space the pages may take in --ram-dir (default: %(default)s)')
+    parser.add_argument('--engine', choices=['mht', 'xml'], default='mht',
+                        help='Convert pages from their published HTML (mht), or directly from their OneNote XML, keeping outlines, tags, and links to headings (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=1, metavar='N', help='Convert pages in N processes in parallel (default: %(default)s)')
+    parser.add_argument('--stats', type=str, metavar='FILE', help='Keep the time each page takes in FILE, to convert the slowest pages first next time and weigh the ETA by it')
+    parser.add_argument('--history', type=str, metavar='DB', help='Record the run and the time taken by each page in the SQLite database DB')
+    parser.add_argument('--no-bulk', dest='bulk', action='store_false', help='Publish each page on its own, even where most pages of a section are converted')
+    parser.add_argument('--no-progress', dest='progress', action='store_false', help='Do not report the progress (pages/s, ETA) of the conversion. Without --stats the ETA counts pages')
+    parser.add_argument('-v', '--verbose', action='count', default=0, help='Log more details, e.g. each unsupported tag')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Log warnings and errors only')
     args = parser.parse_args()
+    setup_logging(-1 if args.quiet else args.verbose)
+    page_filter = None
+    if any((args.created_since, args.created_before, args.modified_since, args.modified_before, args.max_level, args.path, args.exclude)):
+        page_filter = PageFilter(args.created_since, args.created_before, args.modified_since, args.modified_before,
+                                 args.max_level, args.path, args.exclude)
+    options = ConvertOptions(outfile=args.output, image_dir=args.images, image_url=args.image_url, journal=args.journal, resume=args.resume,
+                             max_page_mb=args.max_page_mb, oversized=args.oversized,
+                             dedup=args.dedup, dedup_min_chars=args.dedup_min_chars, drop_boilerplate=args.drop_boilerplate,
+                             format=args.format, compress=args.compress, fragments_dir=args.fragments,
+                             shard=args.shard, progress=args.progress,
+                             temp_dir=args.temp_dir, temp_quota_mb=args.temp_quota_mb, ram_dir=args.ram_dir, ram_quota_mb=args.ram_quota_mb,
+                             page_filter=page_filter, workers=args.workers, stats=args.stats,
+                             history=args.history, engine=args.engine, bulk=args.bulk)
+
+    if args.assemble:
+        # Needs no OneNote
+        from onenote.convert import assemble_pages_all
+        assemble_pages_all(args.assemble, options)
+        exit()
+    if args.report:
+        from utilities.history import report
+        report(args.report)
+        exit()
+
 
     try:
         onenote_app = win32.gencache.EnsureDispatch("OneNote.Application.12")
+        if args.user:
+            # Load what the user may select next while they are typing
+            onenote_app = PrefetchingApp(onenote_app, lambda: win32.gencache.EnsureDispatch("OneNote.Application.12"))
         # Get the hierarchy of the notebooks, sections, and pages
-        hierarchy = onenote_app.GetHierarchy("", win32.constants.hsNotebooks, "")
+        hierarchy = onenote_app.GetHierarchy("", int(HierarchyScope.hsNotebooks), "")
         # Parse the XML
         onenote_elements = ElementTree.fromstring(hierarchy)
+        # All pages keyed by ID, from a single call, unless the user
+        # selects them level by level
+        catalogue = None
+        if not args.user or args.notebook or args.section or args.page:
+            catalogue = PageCatalogue.from_hierarchy(onenote_app)
 
         # first check for any arguments that narrow the search
         if args.notebook:
-            pages, notebooks = find_notebooks(onenote_app, onenote_elements, args.notebook)
+            pages, notebooks = find_notebooks(onenote_app, onenote_elements, args.notebook, catalogue)
             if not notebooks:
                 print(f'Provided notebook did not match.')
                 raise KeyError
@@ -62,7 +160,7 @@ if __name__ == "__main__":
 
         if args.section:
             print(f'Section: {args.section}')
-            pages, sections = find_sections(onenote_app, notebooks, args.section)
+            pages, sections = find_sections(onenote_app, notebooks, args.section, catalogue)
             if not sections:
                 print(f'Provided section did not match.')
                 raise KeyError
@@ -73,7 +171,7 @@ if __name__ == "__main__":
             sections = get_sections(onenote_app, notebooks)
 
         if args.page:
-            pages = find_pages(onenote_app, onenote_elements, args.page)
+            pages = find_pages(onenote_app, onenote_elements, args.page, catalogue)
             if not pages:
                 print(f'Provided pages did not match.')
                 raise KeyError
@@ -83,22 +181,49 @@ if __name__ == "__main__":
 
         if args.user:
             if not narrowed:    # search is not narrowed
-                ui_handle_notebooks(onenote_app, notebooks, outfile=args.output)
+                ui_handle_notebooks(onenote_app, notebooks, options)
             else:               # search is narrowed
                 if 'notebook' == narrowed:
-                    ui_handle_onenote_elements(onenote_app, notebooks, outfile=args.output)
+                    ui_handle_onenote_elements(onenote_app, notebooks, options=options)
                 elif 'sections' == narrowed:
-                    ui_handle_onenote_elements(onenote_app, notebooks, sections, outfile=args.output)
+                    ui_handle_onenote_elements(onenote_app, notebooks, sections, options=options)
                 elif 'pages' == narrowed:
-                    ui_handle_onenote_elements(onenote_app, notebooks, sections, pages, outfile=args.output)
+                    ui_handle_onenote_elements(onenote_app, notebooks, sections, pages, options=options)
                 else:
                     print(f'Somehow we ended up here. Giving up.')
                     exit()
         elif args.all:
-            pages, _ = find_notebooks(onenote_app, onenote_elements, '')
-            handle_pages_all(onenote_app, pages, args.output)
+            pages = catalogue.labelled(catalogue.ids)
+            handle_pages_all(onenote_app, pages, options, catalogue)
+        elif args.estimate is not None:
+            from onenote.estimate import estimate_pages_all
+            if not narrowed:
+                pages = catalogue.labelled(catalogue.ids)
+            estimate_pages_all(onenote_app, pages, options, args.estimate, catalogue=catalogue)
+        elif args.analyze:
+            from onenote.analyze import analyze_pages_all
+            if not narrowed:
+                pages = catalogue.labelled(catalogue.ids)
+            analyze_pages_all(onenote_app, pages, options, catalogue=catalogue)
+        elif args.watch:
+            from onenote.convert import convert_pages_all
+            from onenote.watch import watch
+
+            def convert_changes(pages, catalogue, outfile):
+                changes_options = copy.copy(options)
+                changes_options.outfile = outfile
+                changes_options.page_filter = changes_options.shard = None   # applied by watch
+                convert_pages_all(onenote_app, pages, changes_options, catalogue)
+            scope = None
+            if narrowed:
+                narrowed_to = {'notebook': notebooks, 'sections': sections, 'pages': pages}[narrowed]
+                scope = {element.get('ID') for element in narrowed_to.values()}
+            watch(onenote_app, args.watch, convert_changes, args.interval, options=options, scope=scope)
 
     except pywintypes.com_error as e:
         print(f'ERROR: {e}. Make sure the OneNote application is open.')
     except KeyError:
         print(f'Error: User selection failed. Element not found.')
+    finally:
+        if isinstance(onenote_app, PrefetchingApp):
+            onenote_app.close()
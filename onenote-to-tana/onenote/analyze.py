@@ -0,0 +1,277 @@
+# Profile the contents of the pages before converting them
+
+import heapq
+import statistics
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Tuple
+
+from onenote.bulk import BulkPublisher
+from onenote.catalogue import PageCatalogue
+from onenote.convert import LIST_TAG_HANDLERS, TAG_HANDLERS, select_pages
+from onenote.estimate import format_bytes, format_seconds
+from onenote.onenote import ConvertOptions
+from onenote.pages import process_page
+from utilities.logs import logger
+from utilities.storage import TempStorage
+
+# Characters of HTML that take about as long to convert as a tag
+CHARS_PER_TAG = 64
+# Tags without an end tag
+VOID_TAGS = ('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr')
+# Tags whose handler converts all their descendants, see 'TAG_HANDLERS'
+CONSUMING_TAGS = ('p', 'table', 'ul', 'ol')
+
+class ImageCounter():
+    """
+    Stands in for an 'ImageStore': the images are decoded and counted,
+    but not stored.
+    """
+    def __init__(self):
+        self.images = 0
+        self.bytes = 0
+
+    def writer(self, content_type: str) -> 'ImageCounter':
+        self.images += 1
+        return self
+
+    def write(self, data: bytes) -> None:
+        self.bytes += len(data)
+
+    def commit(self) -> str:
+        return ''
+
+    def discard(self) -> None:
+        pass
+
+class PageProfile():
+    """
+    What a page is made of: tag and attribute counts, the depth of each
+    tag, the size of its tables (rows, columns), the constructs the
+    converter does not handle, and an estimate of the work converting it.
+    """
+    def __init__(self, page_id: str, name: str, path: str, mht_bytes: int):
+        self.page_id = page_id
+        self.name = name
+        self.path = path
+        self.mht_bytes = mht_bytes
+        self.chars = 0
+        self.tags = Counter()
+        self.attributes = Counter()
+        self.depths = Counter()
+        self.tables: List[Tuple[int, int]] = []
+        self.findings = Counter()
+
+    @property
+    def max_depth(self) -> int:
+        return max(self.depths) if self.depths else 0
+
+    @property
+    def cost(self) -> float:
+        return self.tag_count + self.chars / CHARS_PER_TAG
+
+    @property
+    def tag_count(self) -> int:
+        return sum(self.depths.values())
+
+class TagProfiler(HTMLParser):
+    """
+    Streams the HTML of a page into a PageProfile without a parse tree,
+    keeping only the stack of open tags. Tags are reported as unsupported
+    where the converter would dispatch them and has no handler for them.
+    """
+    def __init__(self, profile: PageProfile):
+        super().__init__()
+        self.profile = profile
+        self.stack: List[str] = []
+        self.tables: List[List[int]] = []     # open tables: rows, most cells in a row, cells of the current row
+
+    def handle_starttag(self, tag, attrs):
+        profile = self.profile
+        stack = self.stack
+        profile.tags[tag] += 1
+        for name, _ in attrs:
+            profile.attributes[f'{tag}[{name}]'] += 1
+        profile.depths[len(stack)] += 1
+        if stack and stack[-1] in ('ul', 'ol'):
+            if tag not in LIST_TAG_HANDLERS:
+                profile.findings[f'<ul>/<{tag}>'] += 1
+        elif tag not in TAG_HANDLERS and not any(open_tag in CONSUMING_TAGS for open_tag in stack):
+            profile.findings[f'unsupported <{tag}>'] += 1
+        if tag == 'table':
+            if 'table' in stack:
+                profile.findings['<table> in <table>'] += 1
+            if 'ul' in stack or 'ol' in stack:
+                profile.findings['<table> in a list'] += 1
+            self.tables.append([0, 0, 0])
+        elif tag == 'tr' and self.tables:
+            table = self.tables[-1]
+            table[0] += 1
+            table[2] = 0
+        elif tag == 'td' and self.tables:
+            table = self.tables[-1]
+            table[2] += 1
+            table[1] = max(table[1], table[2])
+        if tag not in VOID_TAGS:
+            stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag not in self.stack:
+            return
+        # Tags left open are closed along with their parent
+        while self.stack.pop() != tag:
+            pass
+        if tag == 'table' and self.tables:
+            rows, columns, _ = self.tables.pop()
+            self.profile.tables.append((rows, columns))
+
+    def handle_data(self, data):
+        self.profile.chars += len(data)
+        if self.stack and self.stack[-1] == 'div' and data.strip():
+            self.profile.findings['<div> with text'] += 1
+
+def profile_page(page_id: str, name: str, path: str, mht_bytes: int, html: str) -> PageProfile:
+    profile = PageProfile(page_id, name, path, mht_bytes)
+    profiler = TagProfiler(profile)
+    for start in range(0, len(html), 1 << 16):
+        profiler.feed(html[start:start + (1 << 16)])
+    profiler.close()
+    return profile
+
+class CorpusProfile():
+    """
+    The totals over all pages profiled, the 'top' costliest pages, and the
+    pages that could not be published or profiled.
+    """
+    def __init__(self, top: int = 20):
+        self.top = top
+        self.pages = 0
+        self.failed: List[Tuple[str, str, str]] = []    # path, name, error
+        self.mht_bytes = 0
+        self.tags = Counter()
+        self.attributes = Counter()
+        self.depths = Counter()
+        self.max_depths = Counter()
+        self.tables: List[Tuple[int, int]] = []
+        self.findings = Counter()
+        self.finding_pages = Counter()
+        self.costliest: List[Tuple[float, int, PageProfile]] = []     # heap
+
+    def add(self, profile: PageProfile) -> None:
+        self.pages += 1
+        self.mht_bytes += profile.mht_bytes
+        self.tags.update(profile.tags)
+        self.attributes.update(profile.attributes)
+        self.depths.update(profile.depths)
+        self.max_depths[profile.max_depth] += 1
+        self.tables += profile.tables
+        self.findings.update(profile.findings)
+        self.finding_pages.update(profile.findings.keys())
+        # Only the counts needed for the report are kept of the page
+        profile.tags = profile.attributes = profile.findings = None
+        entry = (profile.cost, self.pages, profile)
+        if len(self.costliest) < self.top:
+            heapq.heappush(self.costliest, entry)
+        else:
+            heapq.heappushpop(self.costliest, entry)
+
+    def fail(self, name: str, path: str, error: Exception) -> None:
+        logger.warning('Page "%s" could not be analysed: %r', name, error)
+        self.failed.append((path, name, repr(error)))
+
+    def report(self, images: ImageCounter, seconds: float) -> None:
+        print(f'Analysed {self.pages:,} pages, {format_bytes(self.mht_bytes)} of MHT, in {format_seconds(seconds)}'
+              f'{f", {len(self.failed)} pages failed" if self.failed else ""}.')
+        print(f'  images           {images.images:>10,}   {format_bytes(images.bytes)}')
+        print('Tags:')
+        for tag, count in self.tags.most_common(self.top):
+            print(f'  <{tag}>{"":<{14 - len(tag)}} {count:>10,}')
+        print('Attributes:')
+        for attribute, count in self.attributes.most_common(self.top):
+            print(f'  {attribute:<16} {count:>10,}')
+        print('Nesting depth (pages by their deepest tag):')
+        for depth in sorted(self.max_depths):
+            print(f'  {depth:>3} {self.max_depths[depth]:>10,}')
+        if self.tables:
+            rows = [table[0] for table in self.tables]
+            columns = [table[1] for table in self.tables]
+            cells = [table[0] * table[1] for table in self.tables]
+            print(f'Tables: {len(self.tables):,}, rows median {statistics.median(rows):g} max {max(rows):,}, '
+                  f'columns median {statistics.median(columns):g} max {max(columns):,}, cells overall {sum(cells):,}')
+        if self.findings:
+            print('Constructs the converter does not handle:')
+            for finding, count in self.findings.most_common():
+                print(f'  {finding:<24} {count:>8,}x in {self.finding_pages[finding]:,} pages')
+        print('Costliest pages to convert (tags + characters / 64):')
+        for cost, _, profile in sorted(self.costliest, reverse=True):
+            print(f'  {cost:>10,.0f}  {format_bytes(profile.mht_bytes):>9}  depth {profile.max_depth:>3}  '
+                  f'{len(profile.tables):>3} tables  {profile.path}/{profile.name}')
+        if self.failed:
+            print('Pages that failed:')
+            for path, name, error in self.failed:
+                print(f'  {path}/{name}: {error}')
+
+def analyze_pages_all(onenote_app: Any, pages: Dict, options: ConvertOptions, top: int = 20, catalogue: Optional[PageCatalogue] = None) -> None:
+    """
+    Publish and profile the pages (in 'options.workers' processes) and
+    print what they are made of, see 'CorpusProfile'. No nodes are built
+    and nothing is written. A page that cannot be published or profiled
+    is reported as failed, the others are profiled nonetheless.
+    """
+    started = time.perf_counter()
+    if catalogue is None:
+        catalogue = PageCatalogue.from_hierarchy(onenote_app)
+    pages = select_pages(pages, options, catalogue)
+    corpus = CorpusProfile(top)
+    images = ImageCounter()
+    with tempfile.TemporaryDirectory(dir=options.temp_dir) as directory:
+        storage = TempStorage(directory, options.temp_quota_mb * 1024 * 1024 if options.temp_quota_mb else None)
+        bulk = BulkPublisher(onenote_app, directory, catalogue, list(pages.values()), images, storage) if options.bulk else None
+
+        def published():
+            for page in pages.values():
+                entry = catalogue[page.get('ID')] if page.get('ID') in catalogue else None
+                try:
+                    page_data = bulk.publish(page) if bulk else process_page(onenote_app, directory, page, images, catalogue, storage)
+                except Exception as e:
+                    corpus.fail(page.get('name'), entry.path if entry else '', e)
+                    continue
+                yield page_data.pageId, page_data.pageName, entry.path if entry else page_data.sectionName, page_data.mhtSize, page_data.html_string or ''
+                page_data.release()
+
+        def profile(args: Tuple) -> None:
+            try:
+                corpus.add(profile_page(*args))
+            except Exception as e:
+                corpus.fail(args[1], args[2], e)
+
+        if options.workers > 1:
+            # This process publishes, the workers profile
+            with ProcessPoolExecutor(options.workers) as executor:
+                running: Dict[Any, Tuple[str, str]] = {}    # future -> page name, path
+
+                def collect(futures) -> None:
+                    for future in futures:
+                        name, path = running.pop(future)
+                        try:
+                            corpus.add(future.result())
+                        except Exception as e:
+                            corpus.fail(name, path, e)
+
+                for args in published():
+                    if len(running) >= 2 * options.workers:
+                        collect(wait(running, return_when=FIRST_COMPLETED).done)
+                    try:
+                        running[executor.submit(profile_page, *args)] = args[1], args[2]
+                    except BrokenProcessPool:
+                        # A worker died, the rest is profiled here
+                        profile(args)
+                collect(wait(running).done)
+        else:
+            for args in published():
+                profile(args)
+    corpus.report(images, time.perf_counter() - started)
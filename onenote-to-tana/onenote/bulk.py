@@ -0,0 +1,183 @@
+# Publishing whole sections at once
+
+import os
+import re
+import time
+from html import unescape
+from typing import Any, Dict, List, Optional
+from xml.etree import ElementTree
+
+from onenote.catalogue import PageCatalogue
+from onenote.onenote import OneNotePageData, PublishFormat
+from onenote.pages import process_page
+from utilities.images import ImageStore
+from utilities.logs import logger
+from utilities.mht import split_mht_pages
+from utilities.storage import TempStorage
+from utilities.utils import safe_str
+
+# A section is published at once if at least this share of its pages,
+# and at least 'BULK_MIN_PAGES' of them, are to be converted
+BULK_FRACTION = 0.5
+BULK_MIN_PAGES = 4
+# HTML of the pages published along with others kept in memory until they
+# are asked for, the HTML of further pages is kept in files meanwhile
+PENDING_BYTES = 32 * 1024 * 1024
+
+# The first paragraph of a page holds its title
+TITLE = re.compile(r'<p\b[^>]*>(.*?)</p>', re.IGNORECASE | re.DOTALL)
+TAG = re.compile(r'<[^>]+>')
+
+def section_pages(section: ElementTree.Element) -> List[ElementTree.Element]:
+    """
+    The pages of a section, in the order OneNote publishes them.
+    """
+    return [page for page in section if page.get('name') is not None]
+
+def html_title(html: str) -> str:
+    """
+    The title of a page published as HTML, as the hierarchy names it.
+    """
+    match = TITLE.search(html)
+    return ' '.join(unescape(TAG.sub('', match.group(1))).split()) if match else ''
+
+class BulkPublisher():
+    """
+    Publishes the pages to convert section by section: a section of which
+    most pages are to be converted is published as one MHT with a single
+    'Publish' call, and split into the pages' data in one pass. The pages
+    are matched by their title with the section's pages in the hierarchy
+    (pages sharing a title in order), whose attributes (dates, subpage) are
+    used as for a page published alone. The data of the other pages of the
+    section is kept until they are asked for, their HTML in memory up to
+    'pending_bytes', beyond that in files in 'directory'. Other pages, the
+    pages not matched, and the pages of a section that could not be split,
+    are published one by one.
+    """
+    def __init__(self, onenote_app: Any, directory: str, catalogue: PageCatalogue, pages: List[ElementTree.Element],
+                 image_store: Optional[ImageStore] = None, storage: Optional[TempStorage] = None, pending_bytes: int = PENDING_BYTES):
+        self.onenote_app = onenote_app
+        self.directory = directory
+        self.catalogue = catalogue
+        self.image_store = image_store
+        self.storage = storage
+        self.pending_bytes = pending_bytes
+        self.pending: Dict[str, OneNotePageData] = {}
+        self.spilled: Dict[str, str] = {}       # page ID -> file holding the HTML of a pending page
+        self.pending_used = 0                   # bytes of HTML of the pending pages in memory
+        self.sections: Dict[str, set] = {}      # section ID -> IDs of its pages to convert
+        self.published = 0
+        selected: Dict[str, set] = {}
+        for page in pages:
+            page_id = page.get('ID')
+            if page_id in catalogue:
+                selected.setdefault(catalogue[page_id].section.get('ID'), set()).add(page_id)
+        for section_id, page_ids in selected.items():
+            total = len(section_pages(catalogue[next(iter(page_ids))].section))
+            if len(page_ids) >= BULK_MIN_PAGES and len(page_ids) >= BULK_FRACTION * total:
+                self.sections[section_id] = page_ids
+
+    def publish(self, page: ElementTree.Element) -> OneNotePageData:
+        page_id = page.get('ID')
+        if page_id not in self.pending and page_id in self.catalogue:
+            section = self.catalogue[page_id].section
+            if section.get('ID') in self.sections:
+                self.publish_section(section, self.sections.pop(section.get('ID')))
+        if page_id in self.pending:
+            page_data = self.take(page_id)
+            logger.info('%s> Page: "%s", from "%s" notebook section "%s"', '\t' if page_data.isSubPage else '',
+                        page_data.pageName, page_data.nodebookName, page_data.sectionName)
+            return page_data
+        return process_page(self.onenote_app, self.directory, page, self.image_store, self.catalogue, self.storage)
+
+    def keep(self, page_data: OneNotePageData) -> None:
+        """
+        Keep the data of a page until it is asked for, its HTML in a file
+        if the pending pages take 'pending_bytes' already.
+        """
+        if self.pending_used + page_data.mhtSize > self.pending_bytes:
+            path = os.path.join(self.directory, f'{safe_str(page_data.pageId)}.html')
+            with open(path, 'w', encoding='utf-8', newline='') as html_file:
+                html_file.write(page_data.html_string)
+            page_data.html_string = None
+            self.spilled[page_data.pageId] = path
+        else:
+            self.pending_used += page_data.mhtSize
+        self.pending[page_data.pageId] = page_data
+
+    def take(self, page_id: str) -> OneNotePageData:
+        """
+        Remove the data of a pending page, with its HTML, and return it.
+        """
+        page_data = self.pending.pop(page_id)
+        if page_id in self.spilled:
+            path = self.spilled.pop(page_id)
+            with open(path, encoding='utf-8', newline='') as html_file:
+                page_data.html_string = html_file.read()
+            os.remove(path)
+        else:
+            self.pending_used -= page_data.mhtSize
+        return page_data
+
+    def publish_section(self, section: ElementTree.Element, page_ids: set) -> None:
+        section_id = section.get('ID')
+        pages = section_pages(section)
+        entry = self.catalogue[next(iter(page_ids))]
+        file_path = os.path.join(self.directory, f'{safe_str(section_id)}.mht')
+        images: Dict[str, str] = {}     # of all pages, shared by their data
+        kept: List[str] = []
+        unmatched = {}      # title -> pages with it not matched yet, in order
+        for page in pages:
+            unmatched.setdefault(' '.join(page.get('name').split()), []).append(page)
+        htmls = 0
+        try:
+            if self.storage:
+                # The section is known to take what its pages take, if all are known
+                sizes = [self.storage.expected.get(safe_str(page.get('ID'))) for page in pages]
+                file_path = self.storage.acquire(safe_str(section_id), sum(sizes) if None not in sizes else None, len(pages))
+            started = time.perf_counter()
+            self.onenote_app.Publish(section_id, file_path, int(PublishFormat.pfMHTML), "")
+            if self.storage:
+                self.storage.published(file_path, len(pages))
+            published = time.perf_counter()
+            # The pages are kept as they are read, not all at once
+            for html in split_mht_pages(file_path, images, self.image_store):
+                htmls += 1
+                same_title = unmatched.get(html_title(html))
+                page = same_title.pop(0) if same_title else None
+                if page is not None and page.get('ID') in page_ids:
+                    self.keep(OneNotePageData(
+                        entry.notebook.get('name'),
+                        section.get('name'),
+                        page.get('name'),
+                        page.get('dateTime'),
+                        page.get('lastModifiedTime'),
+                        page.get('isSubPage') == 'true',
+                        html,
+                        images,
+                        page.get('ID'),
+                        len(html.encode('utf-8'))
+                        ))
+                    kept.append(page.get('ID'))
+            extracted = time.perf_counter()
+        except Exception as e:
+            logger.warning('Section "%s" could not be published at once, publishing its pages one by one: %r', section.get('name'), e)
+            self.drop(kept)
+            return
+        finally:
+            if self.storage:
+                self.storage.release(file_path)
+            elif os.path.exists(file_path):
+                os.remove(file_path)
+        missing = len(page_ids) - len(kept)
+        if missing:
+            logger.warning('Section "%s": %d of its %d pages published could not be matched, publishing them one by one.', section.get('name'), missing, htmls)
+        self.published += 1
+        # The time taken is spread over the pages
+        for page_id in kept:
+            self.pending[page_id].publishSeconds = (published - started) / len(pages)
+            self.pending[page_id].extractSeconds = (extracted - published) / len(pages)
+
+    def drop(self, page_ids: List[str]) -> None:
+        for page_id in page_ids:
+            self.take(page_id)
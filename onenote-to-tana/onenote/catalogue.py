@@ -0,0 +1,192 @@
+# OneNote page catalogue
+
+import re
+import zlib
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from xml.etree import ElementTree
+
+from onenote.onenote import HierarchyScope
+from utilities.utils import is_glob, selector_matcher
+
+def unique_labels(elements: Iterable[Tuple[str, str, ElementTree.Element]]) -> Dict[str, ElementTree.Element]:
+    """
+    Map the elements, given as (name, context, element), to unique labels.
+    An element is labelled by its name, elements sharing a name
+    additionally by their context (e.g. the path of their section), and
+    if that is shared as well, by their ID.
+    """
+    elements = list(elements)
+    counts = {}
+    for name, _, _ in elements:
+        counts[name] = counts.get(name, 0) + 1
+    results = {}
+    for name, context, element in elements:
+        label = name
+        if counts[name] > 1:
+            label = f'{name} ({context})'
+            if label in results:
+                label = f'{label} {element.get("ID")}'
+        results[label] = element
+    return results
+
+class NameIndex():
+    """
+    Trigram index over names for fast substring, glob and regular
+    expression search (see 'selector_matcher' for the selector syntax).
+    Substrings and globs are narrowed down to candidates by the trigrams
+    of their literal text and then verified; regular expressions and
+    selectors shorter than a trigram are matched against all names.
+    """
+    def __init__(self):
+        self.names: List[str] = []
+        self.trigrams: Dict[str, Set[int]] = {}
+
+    def add(self, name: str) -> int:
+        index = len(self.names)
+        self.names.append(name)
+        for i in range(len(name) - 2):
+            self.trigrams.setdefault(name[i:i + 3], set()).add(index)
+        return index
+
+    def candidates(self, literal: str) -> Iterable[int]:
+        if len(literal) < 3:
+            return range(len(self.names))
+        postings = []
+        for i in range(len(literal) - 2):
+            posting = self.trigrams.get(literal[i:i + 3])
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+        return sorted(set.intersection(*postings))
+
+    def search(self, selector: str) -> List[int]:
+        """
+        Return the indices of all names matching 'selector', in the
+        order the names were added.
+        """
+        if selector.startswith('re:'):
+            literal = ''
+        elif is_glob(selector):
+            # the longest run of literal characters within the pattern
+            literal = max(re.split(r'[*?]|\[[^\]]*\]?', selector), key=len)
+        else:
+            literal = selector
+        matches = selector_matcher(selector)
+        names = self.names
+        return [index for index in self.candidates(literal) if matches(names[index])]
+
+class PageEntry():
+    def __init__(self, page: ElementTree.Element, notebook: ElementTree.Element, section: ElementTree.Element, section_groups: List[str], parent_id: Optional[str] = None):
+        self.page = page
+        self.notebook = notebook
+        self.section = section
+        self.section_groups = section_groups    # names of the enclosing section groups
+        self.parent_id = parent_id              # the superpage of a subpage
+        self.position = -1                      # position within the whole hierarchy
+
+    @property
+    def id(self) -> str:
+        return self.page.get('ID')
+
+    @property
+    def name(self) -> str:
+        return self.page.get('name')
+
+    @property
+    def path(self) -> str:
+        return '/'.join([self.notebook.get('name') or 'None', *self.section_groups, self.section.get('name') or 'None'])
+
+class PageCatalogue():
+    """
+    All pages of all open notebooks keyed by their OneNote ID, so pages
+    with the same name stay distinct, plus a name index for searching.
+    The catalogue is built from a single 'GetHierarchy' call.
+    """
+    def __init__(self):
+        self.entries: Dict[str, PageEntry] = {}
+        self.ids: List[str] = []
+        self.index = NameIndex()
+
+    @classmethod
+    def from_hierarchy(cls, onenote_app: Any) -> 'PageCatalogue':
+        hierarchy_xml = onenote_app.GetHierarchy("", int(HierarchyScope.hsPages), "")
+        return cls.from_elements(ElementTree.fromstring(hierarchy_xml))
+
+    @classmethod
+    def from_elements(cls, notebooks: ElementTree.Element) -> 'PageCatalogue':
+        catalogue = cls()
+        for notebook in notebooks:
+            catalogue.add_children(notebook, notebook, [])
+        return catalogue
+
+    def add_children(self, notebook: ElementTree.Element, parent: ElementTree.Element, section_groups: List[str]) -> None:
+        for child in parent:
+            if child.get('isRecycleBin') == 'true' or child.get('isInRecycleBin') == 'true':
+                continue
+            if child.tag.endswith('SectionGroup'):
+                self.add_children(notebook, child, section_groups + [child.get('name')])
+            elif child.tag.endswith('Section'):
+                superpage_id = None
+                for page in child:
+                    if page.get('name') is None:
+                        continue
+                    if page.get('isSubPage') == 'true':
+                        self.add(PageEntry(page, notebook, child, section_groups, superpage_id))
+                    else:
+                        superpage_id = page.get('ID')
+                        self.add(PageEntry(page, notebook, child, section_groups))
+
+    def add(self, entry: PageEntry) -> None:
+        if entry.id in self.entries:
+            return
+        entry.position = len(self.ids)
+        self.entries[entry.id] = entry
+        self.ids.append(entry.id)
+        self.index.add(entry.name)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, page_id: str) -> bool:
+        return page_id in self.entries
+
+    def __getitem__(self, page_id: str) -> PageEntry:
+        return self.entries[page_id]
+
+    def shard_of(self, page_id: str, shards: int) -> int:
+        """
+        The shard (0 to 'shards' - 1) a page belongs to, by a stable hash
+        of its ID. Subpages belong to the shard of their superpage.
+        """
+        entry = self.entries.get(page_id)
+        if entry and entry.parent_id:
+            page_id = entry.parent_id
+        return zlib.crc32(page_id.encode('utf-8')) % shards
+
+    def within(self, element_ids: Iterable[str]) -> List[str]:
+        """
+        Return the IDs of all pages within any of the notebooks or
+        sections with the given IDs, in hierarchy order.
+        """
+        element_ids = set(element_ids)
+        return [page_id for page_id in self.ids
+                if self.entries[page_id].notebook.get('ID') in element_ids or self.entries[page_id].section.get('ID') in element_ids]
+
+    def search(self, selectors: List[str]) -> List[str]:
+        """
+        Return the IDs of all pages whose name matches any of the
+        'selectors', in hierarchy order.
+        """
+        found = set()
+        for selector in selectors:
+            found.update(self.index.search(selector))
+        return [self.ids[index] for index in sorted(found)]
+
+    def labelled(self, page_ids: List[str]) -> Dict[str, ElementTree.Element]:
+        """
+        Map the pages to unique labels. A page is labelled by its name,
+        pages sharing a name additionally by their notebook and section.
+        """
+        return unique_labels((self.entries[page_id].name, self.entries[page_id].path, self.entries[page_id].page) for page_id in page_ids)
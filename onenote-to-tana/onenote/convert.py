@@ -1,22 +1,46 @@
-import json
-import locale
+import copy
+import errno
+import heapq
+import multiprocessing
 import os
-import pytz
 import re
+import shutil
 import sys
 import tempfile
 import time
+import traceback
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from itertools import count
 from bs4 import BeautifulSoup, NavigableString, Tag
-from datetime import datetime, timezone
 from snowflake import SnowflakeGenerator
-from typing import Any, Dict, List, Tuple, Union
+from html.parser import HTMLParser
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from xml.etree import ElementTree
 
-from onenote.onenote import OneNotePageData
-from onenote.pages import process_page
+from onenote.onenote import ConvertOptions, OneNotePageData, OneNoteTable, PublishFormat
+from onenote.bulk import BulkPublisher
+from onenote.catalogue import PageCatalogue
+from onenote.links import links
+from onenote.fragments import FragmentStore, Journal, PageFragment, assemble_fragments, read_fragments, used_supertags
+from onenote.pages import page_file_path, process_page
+from onenote.schedule import CostModel, lpt_order
+from tanatypes.dedup import Deduplicator
+from tanatypes.output import write_tif
 from tanatypes.tif import *     # TIF - Tana Intermediate Format
+from tanatypes.validate import TifValidator
+from utilities.images import ImageStore
+from utilities.logs import diagnostics, logger
+from utilities.history import RunHistory
+from utilities.progress import ProgressReporter
+from utilities.storage import TempStorage
+from utilities.mht import image_key
+from utilities.utils import BulkGC, safe_str
 
 DEBUG = False
 CHARSET = 'utf-8' 
+# Approximate memory used by a BeautifulSoup tree per character of HTML
+SOUP_MEMORY_FACTOR = 12
 TIMEZONE = 'Etc/GMT+1'
 
 # Initialize a snowflake generator
@@ -69,55 +93,70 @@ def process_child(child: NavigableString) -> str:
             text = text + f'{string}'
     return text
 
-def process_list(tag: NavigableString, list_nodes: list, createdAt: int, summary: TanaIntermediateSummary, level: int = 0) -> list:
-    if isinstance(tag, Tag):
-        tag_name = tag.name.casefold()
-        if tag_name == 'ul':
-            for child in tag.children:
-                if level == 0:
-                    list_child = list_nodes
-                else:
-                    try:
-                        list_child = list_nodes[-1].children
-                    except IndexError:
-                        list_child = list_nodes
-                process_list(child, list_child, createdAt, summary, level + 1)
+def make_node(name: str, createdAt: int, description: str = '') -> TanaIntermediateNode:
+    """
+    Create a plain node without children.
+    """
+    node = TanaIntermediateNode(
+        uid=str(next(uid)), 
+        name=name, 
+        description=description, 
+        children=[], 
+        refs=[], 
+        createdAt=createdAt, 
+        editedAt=int(time.time() * 1000.0), 
+        type=NodeType.NODE
+    )
+    links.record(node)
+    return node
 
-        elif tag_name in ('li', 'p', 'h1', 'h2', 'h3', 'h4', 'h5'):
-            text = str()
-            for list_item in tag.children:
-                text += process_child(list_item)
-            name = compress_text(text)
-            child_node = TanaIntermediateNode(
-                uid=str(next(uid)), 
-                name=name, 
-                description='', 
-                children=[], 
-                refs=[], 
-                createdAt=createdAt, 
-                editedAt=int(time.time() * 1000.0), 
-                type=NodeType.NODE
-            )
-            summary.leafNodes += 1
-            summary.totalNodes += 1
-            list_nodes.append(child_node)
+# List handlers, called with the tag, the nodes of the current list level,
+# the creation time, the summary, and the nesting level
+ListHandler = Callable[[Tag, list, int, TanaIntermediateSummary, int], None]
 
-        elif tag_name in ('div'):
-            # print(f'Ignore <ul> sub-tag: "{tag.name}"')
-            pass
+def list_handle_list(tag: Tag, list_nodes: list, createdAt: int, summary: TanaIntermediateSummary, level: int) -> None:
+    for child in tag.children:
+        if level == 0:
+            list_child = list_nodes
+        else:
+            try:
+                list_child = list_nodes[-1].children
+            except IndexError:
+                list_child = list_nodes
+        process_list(child, list_child, createdAt, summary, level + 1)
+
+def list_handle_item(tag: Tag, list_nodes: list, createdAt: int, summary: TanaIntermediateSummary, level: int) -> None:
+    text = str()
+    for list_item in tag.children:
+        text += process_child(list_item)
+    list_nodes.append(make_node(compress_text(text), createdAt))
+    summary.leafNodes += 1
+    summary.totalNodes += 1
 
-        elif tag_name in ('table', 'tr', 'td'):
-            print(f'Currently unsupported <ul> sub-tag: "{tag_name}"')
+def list_handle_ignore(tag: Tag, list_nodes: list, createdAt: int, summary: TanaIntermediateSummary, level: int) -> None:
+    pass
 
-        # Handle other tags
-        else:
-            # Handle unsupported tags gracefully
-            print(f'Unsupported <ul> sub-tag ({tag_name}): "{tag}" - {len(str(tag))}')
+def list_handle_unsupported(tag: Tag, list_nodes: list, createdAt: int, summary: TanaIntermediateSummary, level: int) -> None:
+    # Handle unsupported tags (e.g. tables in lists) gracefully
+    diagnostics.unsupported(tag, '<ul>/')
 
-    elif isinstance(tag, NavigableString):
-        # process the string
-        pass
+LIST_TAG_HANDLERS: Dict[str, ListHandler] = {
+    'ul': list_handle_list,
+    'li': list_handle_item,
+    'p': list_handle_item,
+    'h1': list_handle_item,
+    'h2': list_handle_item,
+    'h3': list_handle_item,
+    'h4': list_handle_item,
+    'h5': list_handle_item,
+    'div': list_handle_ignore,
+}
 
+def process_list(tag: NavigableString, list_nodes: list, createdAt: int, summary: TanaIntermediateSummary, level: int = 0) -> list:
+    # Strings in between the list items are skipped
+    if isinstance(tag, Tag):
+        handler = LIST_TAG_HANDLERS.get(tag.name.casefold(), list_handle_unsupported)
+        handler(tag, list_nodes, createdAt, summary, level)
     return list_nodes
 
 def process_list_and_convert_to_node(tag: NavigableString, createdAt: int, summary: TanaIntermediateSummary) -> Tuple[int, list, bool]:
@@ -141,25 +180,19 @@ def process_list_and_convert_to_node(tag: NavigableString, createdAt: int, summa
     return n, list_nodes, has_list_items
 
 
-def process_and_convert_table(tag: NavigableString) -> Tuple[int, str, list]:
-    table = []
-    title = tag["title"].strip()
-    if not title:
-        title="OneNote Table"
-    rows = tag.find_all('tr')
-    for row in rows:
-        cols = row.find_all('td')
-        row = []
-        for col in cols:
+def process_and_convert_table(tag: NavigableString) -> Tuple[int, OneNoteTable]:
+    table = OneNoteTable(tag.get('title', '').strip())
+    for row in tag.find_all('tr'):
+        cells = []
+        for col in row.find_all('td'):
             text = str()
             for child in col.children:
                 text += process_child(child)
-            text = compress_text(text)
-            row.append(text)
-        table.append(row)
+            cells.append(compress_text(text))
+        table.add_row(cells)
     simmer = tag.find_all(True)
     n = len(simmer) + 1
-    return n, title, table
+    return n, table
 
 def process_and_convert_paragraph(tag: NavigableString) -> Tuple[int, str, str]:
     text = str()
@@ -204,16 +237,7 @@ def image_alt_to_node(name: str, description: str, createdAt: int, summary: Tana
     for url in urls:
         # Replace the URL with its Tana equivalent
         name = name.replace(url, f'[{url}]({url})')
-    child_node = TanaIntermediateNode(
-        uid=str(next(uid)), 
-        name=name, 
-        description=description, 
-        children=[], 
-        refs=[], 
-        createdAt=createdAt, 
-        editedAt=int(time.time() * 1000.0), 
-        type=NodeType.NODE
-    )
+    child_node = make_node(name, createdAt, description)
     summary.leafNodes += 1
     summary.totalNodes += 1
     return child_node
@@ -221,9 +245,9 @@ def image_alt_to_node(name: str, description: str, createdAt: int, summary: Tana
 
 def process_image_and_convert_to_node(tag: NavigableString, images: Dict, createdAt: int, supertag: TanaIntermediateSupertag, summary: TanaIntermediateSummary) -> Tuple[int, List[TanaIntermediateNode], List[Dict[str, Union[str, int]]]]:
     alt = tag.get('alt')
-    # img_src = tag.get('src')
-    # found = img_src in images
-    # print(f'<IMAGE> source="{img_src}" found={found}, text=>>>\n{alt}\n<<<<')
+    img_src = tag.get('src') or ''
+    # The media URL of the image, if the image was stored
+    media_url = images.get(image_key(img_src))
 
     text = ' '
     potentially_corrupted = False
@@ -257,8 +281,6 @@ def process_image_and_convert_to_node(tag: NavigableString, images: Dict, create
                     image_description_node.append(image_alt_to_node(line, description, createdAt, summary))
                 else:
                     image_nodes.append(image_alt_to_node(line, description, createdAt, summary))
-                summary.leafNodes += 1
-                summary.totalNodes += 1
             continue
 
         # Skip empty lines
@@ -268,8 +290,6 @@ def process_image_and_convert_to_node(tag: NavigableString, images: Dict, create
                     image_description_node.append(image_alt_to_node(current_line.strip(), "Assumed image to text.", createdAt, summary))
                 else:
                     image_nodes.append(image_alt_to_node(current_line, '', createdAt, summary))
-                summary.leafNodes += 1
-                summary.totalNodes += 1
                 current_line = ""
         else:
             # If the current line is not empty,
@@ -282,84 +302,90 @@ def process_image_and_convert_to_node(tag: NavigableString, images: Dict, create
     if current_line:
         # image_nodes.append(image_alt_to_node(current_line, '', createdAt, summary))
         image_nodes.append(image_alt_to_node(current_line, '', -1, summary))
-        summary.leafNodes += 1
-        summary.totalNodes += 1
 
-    # add image as a node (unsupported)
-    child_node = TanaIntermediateNode(
-        uid=str(next(uid)), 
-        name=f"(Images are not supported) [Upvote #21](https://ideas.tana.inc/posts/21-tana-api-add-data-to-tana-and-access-it-with-api).", 
-        description=f'<i>Tana TIF currently does not support importing <u>inline</u> images.</i>', 
-        children=image_description_node, 
-        refs=[], 
-        createdAt=999999, # createdAt, 
-        editedAt=int(time.time() * 1000.0),
-        type=NodeType.NODE,
-        )
+    if media_url:
+        # add image as a node referring to the image store
+        child_node = TanaIntermediateNode(
+            uid=str(next(uid)), 
+            name=os.path.basename(img_src), 
+            description='', 
+            children=image_description_node, 
+            refs=[], 
+            createdAt=createdAt, 
+            editedAt=int(time.time() * 1000.0),
+            type=NodeType.IMAGE,
+            mediaUrl=media_url,
+            )
+    else:
+        # add image as a node (unsupported)
+        child_node = TanaIntermediateNode(
+            uid=str(next(uid)), 
+            name=f"(Images are not supported) [Upvote #21](https://ideas.tana.inc/posts/21-tana-api-add-data-to-tana-and-access-it-with-api).", 
+            description=f'<i>Tana TIF currently does not support importing <u>inline</u> images.</i>', 
+            children=image_description_node, 
+            refs=[], 
+            createdAt=999999, # createdAt, 
+            editedAt=int(time.time() * 1000.0),
+            type=NodeType.NODE,
+            )
     image_nodes.append(child_node)
     summary.leafNodes += 1
     summary.totalNodes += 1
 
     return 1, image_nodes, image_attributes
 
-def table_to_node(table: list, name: str, createdAt: int, supertag: TanaIntermediateSupertag, summary: TanaIntermediateSummary) -> Tuple[TanaIntermediateNode, List[Dict[str, Union[str, int]]]]:
+def table_to_node(table: OneNoteTable, createdAt: int, supertag: TanaIntermediateSupertag, summary: TanaIntermediateSummary) -> Tuple[TanaIntermediateNode, List[Dict[str, Union[str, int]]]]:
+    editedAt = int(time.time() * 1000.0)
     # Create table node
     table_node = TanaIntermediateNode(
         uid=str(next(uid)), 
         # Use "OneNote Table" if the first cell of the first row is empty or None
-        name="OneNote Table" if not table[0][0] else table[0][0],
+        name="OneNote Table" if not table.name else table.name,
         children=[], 
         createdAt=createdAt,
-        editedAt=int(time.time() * 1000.0),
+        editedAt=editedAt,
         type=NodeType.NODE,
         supertags=[supertag.uid]
         )
-    for i, row in enumerate(table):
-        if i == 0:  # Heading row
-            heading_nodes = []
-            for index, cell in enumerate(row[1:]):   # Start from the second cell
-                name = cell if cell != '' else str(index + 1)
-                node = TanaIntermediateNode(
-                    uid=str(next(uid)), 
-                    name=name, 
-                    createdAt=createdAt,
-                    editedAt=int(time.time() * 1000.0),
-                    type=NodeType.FIELD
-                )
-                heading_nodes.append(node)
-                summary.fields += 1
-        else:  # Data row
-            row_node = TanaIntermediateNode(
+    # The field names are known once per table (heading row)
+    fields = table.fields
+    summary.fields += len(fields)
+    columns = table.columns
+    rows = table_node.children
+    for i, row_name in enumerate(table.row_names):
+        row_node = TanaIntermediateNode(
+            uid=str(next(uid)), 
+            name=row_name if row_name != '' else chr(64 + i + 2),    # Use the first cell of the row as the name
+            children=[], 
+            createdAt=createdAt,
+            editedAt=editedAt,
+            type=NodeType.NODE
+        )
+        for j, field in enumerate(fields):
+            cell = columns[j][i]
+            if cell is None:    # the row has less cells than the table has fields
+                break
+            cell_node = TanaIntermediateNode(
                 uid=str(next(uid)), 
-                name=row[0] if row[0] != '' else chr(64 + i + 1),    # Use the first cell of the row as the name
-                children=[], 
+                name=cell, 
                 createdAt=createdAt,
-                editedAt=int(time.time() * 1000.0),
+                editedAt=editedAt,
                 type=NodeType.NODE
             )
-            for j, cell in enumerate(row[1:]):  # Start from the second cell
-                cell_node = TanaIntermediateNode(
-                    uid=str(next(uid)), 
-                    name=cell, 
-                    createdAt=createdAt,
-                    editedAt=int(time.time() * 1000.0),
-                    type=NodeType.NODE
-                )
-                summary.leafNodes += 1
-                summary.totalNodes += 1
-                heading_node = TanaIntermediateNode(
-                    uid=str(next(uid)), 
-                    name=heading_nodes[j].name, 
-                    children=[cell_node], 
-                    createdAt=createdAt,
-                    editedAt=int(time.time() * 1000.0),
-                    type=NodeType.FIELD)
-                row_node.children.append(heading_node)
-                summary.fields += 1
-            table_node.children.append(row_node)
-            summary.leafNodes += 1
-            summary.totalNodes += 1
-    attributes = [{"name": (name if name != '' else str(index + 1)), "count": 0} for index, name in enumerate(table[0][1:])]  # Start also from the second cell
+            links.record(cell_node)
+            field_node = TanaIntermediateNode(
+                uid=str(next(uid)), 
+                name=field, 
+                children=[cell_node], 
+                createdAt=createdAt,
+                editedAt=editedAt,
+                type=NodeType.FIELD)
+            row_node.children.append(field_node)
+        summary.leafNodes += len(row_node.children) + 1
+        summary.totalNodes += len(row_node.children) + 1
+        summary.fields += len(row_node.children)
+        rows.append(row_node)
+    attributes = [{"name": field, "count": 0} for field in fields]
     return table_node, attributes
 
 def process_beginnings(page_data: OneNotePageData, title_str: str, date_str: str, time_str: str) -> TanaIntermediateNode:
@@ -377,267 +403,645 @@ def process_beginnings(page_data: OneNotePageData, title_str: str, date_str: str
     )
     return node
 
-def convert_onenote_page(page_data: OneNotePageData, summary: TanaIntermediateSummary, nodes: List[TanaIntermediateNode], attributes: List[TanaIntermediateAttribute], supertags: List[TanaIntermediateSupertag], superpage: TanaIntermediateNode) -> Tuple[TanaIntermediateSummary, List[TanaIntermediateNode], List[TanaIntermediateAttribute], List[TanaIntermediateSupertag]]:
-    top_level_node = None
-    parent_node_current = None
-    parent_node_previous = None
+class PageState():
+    """
+    The state of the conversion of a page, shared by the tag handlers.
+    """
+    def __init__(self, page_data: OneNotePageData, summary: TanaIntermediateSummary, nodes: List[TanaIntermediateNode], attributes: List[TanaIntermediateAttribute], supertags: List[TanaIntermediateSupertag], superpage: Optional[TanaIntermediateNode]):
+        self.page_data = page_data
+        self.summary = summary
+        self.nodes = nodes
+        self.attributes = attributes
+        self.supertags = supertags
+        self.superpage = superpage
+        self.top_level_node: Optional[TanaIntermediateNode] = None
+        self.parent_node_current: Optional[TanaIntermediateNode] = None
+        self.parent_node_previous: Optional[TanaIntermediateNode] = None
+        # The first three paragraphs hold the title, date, and time of the page
+        self.paragraph = 1
+        self.title_str = str()
+        self.date_str = str()
+        self.time_str = str()
+
+    def append(self, node: TanaIntermediateNode, parent: Optional[TanaIntermediateNode] = None) -> None:
+        """
+        Append a leaf node to 'parent', by default the current parent node.
+        """
+        (parent or self.parent_node_current).children.append(node)
+        self.summary.leafNodes += 1
+        self.summary.totalNodes += 1
+
+    def add_attributes(self, attributes: List[Dict[str, Union[str, int]]]) -> None:
+        # Remove duplicates by name, preserving the last occurrence of each
+        self.attributes += attributes
+        self.attributes = list(dict((attr['name'], attr) for attr in self.attributes).values())
+
+# Tag handlers, called with the tag and the page state, return the number
+# of tags consumed, i.e. 1 + the descendants they handled themselves
+TagHandler = Callable[[Tag, PageState], int]
+
+def handle_div(tag: Tag, state: PageState) -> int:
+    # this will raise an exception if 'text' is not empty
+    n, _ = process_div(tag)
+    return n
+
+def handle_paragraph(tag: Tag, state: PageState) -> int:
+    n, language, text = process_and_convert_paragraph(tag)
+    # special treatment for the start of an OneNote
+    if state.paragraph in [1,2,3]:
+        if 1 == state.paragraph:
+            state.title_str = text
+        if 2 == state.paragraph:
+            state.date_str = text
+        if 3 == state.paragraph:
+            state.time_str = text
+            start_page(state)
+        state.paragraph += 1
+    elif 0 < len(text):
+        child_node = make_node(text, state.parent_node_current.createdAt)
+        # Add our tag line to the OneNote tag line
+        if "Created with OneNote." in text:
+            child_node.description = 'Imported into Tana with <b><i>onenote-to-tana</i></b>.'
+            state.append(child_node, state.top_level_node)
+        else:
+            state.append(child_node)
+    return n
+
+def start_page(state: PageState) -> None:
+    page_data = state.page_data
+    summary = state.summary
+    top_level_node = process_beginnings(page_data, state.title_str, state.date_str, state.time_str)
+    summary.totalNodes += 1
+    # Initialize the parent node
+    state.top_level_node = top_level_node
+    state.parent_node_current = top_level_node
+    state.parent_node_previous = top_level_node
+    # Append the Node object to the list of nodes
+    if page_data.isSubPage:
+        if state.superpage:
+            last_child = state.superpage.children[-1]  # Get the last child node
+            last_child.description = 'Imported into Tana with <b><i>onenote-to-tana</i></b>, including subpages below.'
+            last_child.children.append(top_level_node) 
+            summary.leafNodes += 1
+        else:
+            state.nodes.append(top_level_node)
+            summary.topLevelNodes += 1
+    else:
+        state.superpage = top_level_node
+        summary.topLevelNodes += 1
+        state.nodes.append(top_level_node)
+
+def handle_table(tag: Tag, state: PageState) -> int:
+    # Does currently not support tables inside of tables
+    n, table = process_and_convert_table(tag)
+    table_node, table_attributes = table_to_node(table, state.parent_node_current.createdAt, supertag_tbl, state.summary)
+    state.append(table_node)
+    state.add_attributes(table_attributes)
+    return n
+
+def handle_image(tag: Tag, state: PageState) -> int:
+    if not state.parent_node_current:
+        logger.debug('ERROR: parent node went missing.')
+        return 1
+    n, image_nodes, image_attributes = process_image_and_convert_to_node(tag, state.page_data.images, state.parent_node_current.createdAt, supertag_tbl, state.summary)
+    # Increment of the summary attribute already done in
+    # 'process_image_and_convert_to_node' method
+    state.parent_node_current.children.extend(image_nodes)
+    state.add_attributes(image_attributes)
+    return n
+
+def handle_heading(tag: Tag, state: PageState) -> int:
+    n, text = process_and_convert_heading(tag)
+    child_node = make_node(text, state.parent_node_current.createdAt)
+    state.append(child_node, state.parent_node_previous)
+    # Set the parent node to the heading node
+    state.parent_node_previous = state.parent_node_current
+    state.parent_node_current = child_node
+    return n
+
+def handle_list(tag: Tag, state: PageState) -> int:
+    # Increment of the summary attribute already done in 'process_list'
+    n, list_nodes, has_items = process_list_and_convert_to_node(tag, state.parent_node_current.createdAt, state.summary)
+    state.parent_node_current.children.extend(list_nodes)
+    return n
+
+def handle_span(tag: Tag, state: PageState) -> int:
+    state.append(make_node(compress_text(process_child(tag)), state.parent_node_current.createdAt))
+    return 1
+
+def handle_anchor(tag: Tag, state: PageState) -> int:
+    n, anchor = process_and_convert_anchor(tag)
+    state.append(make_node(compress_text(anchor), state.parent_node_current.createdAt))
+    return n
 
-    # Initialize the assumed creation date and time, and note title
-    date_str = str()
-    language = str()    # the language the date is encoded in
-    time_str = str()
-    title_str = str()
+def handle_ignore(tag: Tag, state: PageState) -> int:
+    return 1
+
+def handle_unsupported(tag: Tag, state: PageState) -> int:
+    # Handle unsupported tags gracefully
+    diagnostics.unsupported(tag)
+    return 1
+
+TAG_HANDLERS: Dict[str, TagHandler] = {
+    'div': handle_div,
+    'p': handle_paragraph,
+    'table': handle_table,
+    'img': handle_image,
+    'h1': handle_heading,
+    'h2': handle_heading,
+    'h3': handle_heading,
+    'h4': handle_heading,
+    'h5': handle_heading,
+    'ol': handle_list,
+    'ul': handle_list,
+    'span': handle_span,
+    'a': handle_anchor,
+    # breaks and no breaks
+    'br': handle_ignore,
+    'nobr': handle_ignore,
+    # head/non-body
+    'html': handle_ignore,
+    'head': handle_ignore,
+    'meta': handle_ignore,
+    'link': handle_ignore,
+    'body': handle_ignore,
+}
+
+def register_tag_handler(handler: Union[TagHandler, ListHandler], *tag_names: str, in_list: bool = False) -> None:
+    """
+    Convert the tags named 'tag_names' with 'handler', replacing the
+    handler in place, if any. With 'in_list', the handler is used for the
+    tags within (un)ordered lists, see 'LIST_TAG_HANDLERS'.
+    """
+    handlers = LIST_TAG_HANDLERS if in_list else TAG_HANDLERS
+    for tag_name in tag_names:
+        handlers[tag_name.casefold()] = handler
+
+def convert_onenote_page(page_data: OneNotePageData, summary: TanaIntermediateSummary, nodes: List[TanaIntermediateNode], attributes: List[TanaIntermediateAttribute], supertags: List[TanaIntermediateSupertag], superpage: TanaIntermediateNode) -> Tuple[TanaIntermediateSummary, List[TanaIntermediateNode], List[TanaIntermediateAttribute], List[TanaIntermediateSupertag]]:
+    state = PageState(page_data, summary, nodes, attributes, supertags, superpage)
 
     slurry = BeautifulSoup(page_data.html_string, 'html.parser')
     solids = slurry.find_all(True)
+    try:
+        # Iterate over all tags in the document, a handler
+        # may consume the descendants of its tag
+        handlers = TAG_HANDLERS
+        i = 0
+        while i < len(solids):
+            tag = solids[i]
+            i += handlers.get(tag.name.casefold(), handle_unsupported)(tag, state)
+    finally:
+        # Tear down the parse tree right away instead of leaving its
+        # reference cycles to the garbage collector, also if the page
+        # failed (the traceback would keep the tree alive)
+        solids.clear()
+        slurry.decompose()
 
-    p = 1 # paragraph <p> counter
-
-    i = 0
-    # Iterate over all tags in the document
-    while i < len(solids):
-        tag = solids[i]
-        tag_name = tag.name.casefold()
-
-        # Handle division or section
-        if tag_name == 'div':
-            # this will raise an exception if 'text' is not empty
-            n, text = process_div(tag)
-
-        # Handle paragraphs
-        elif tag_name == 'p':
-            n, language, text = process_and_convert_paragraph(tag)
-            # special treatment for the start of an OneNote
-            if p in [1,2,3]:
-                # print(f'[{p}] -> {text[1:]} <-')
-                if 1 == p:
-                    title_str = text
-                if 2 == p:
-                    date_str = text
-                if 3 == p:
-                    time_str = text
-                    top_level_node = process_beginnings(page_data, title_str, date_str, time_str)
-                    summary.totalNodes += 1
-                    # Initialize the parent node
-                    parent_node_current = top_level_node
-                    parent_node_previous = top_level_node
-                    # Append the Node object to the list of nodes
-                    if page_data.isSubPage:
-                        if superpage:
-                            last_child = superpage.children[-1]  # Get the last child node
-                            last_child.description = 'Imported into Tana with <b><i>onenote-to-tana</i></b>, including subpages below.'
-                            last_child.children.append(top_level_node) 
-                            summary.leafNodes += 1
-                        else:
-                            nodes.append(top_level_node)
-                            summary.topLevelNodes += 1
-                    else:
-                        superpage = top_level_node
-                        summary.topLevelNodes += 1
-                        nodes.append(top_level_node)
-                p += 1
-                i += n
-                continue
-            if 0 < len(text):
-                # Create a TanaIntermediateNode object from the <p> element
-                child_node = TanaIntermediateNode(
-                    uid=str(next(uid)), 
-                    name=text, 
-                    description="", 
-                    children=[], 
-                    refs=[], 
-                    createdAt=parent_node_current.createdAt, 
-                    editedAt=int(time.time() * 1000.0), 
-                    type=NodeType.NODE
-                )
-                # Add our tag line to the OneNote tag line
-                if "Created with OneNote." in text:
-                    child_node.description = 'Imported into Tana with <b><i>onenote-to-tana</i></b>.'
-                    top_level_node.children.append(child_node)
-                else:
-                    # Append the ChildNode object to the children of the parent node
-                    parent_node_current.children.append(child_node)
-                # Increment the summary attribute
-                summary.leafNodes += 1
-                summary.totalNodes += 1
-
-        # Handle tables
-        # Does currently not support tables inside of tables
-        elif tag_name == 'table':
-            n, title, table = process_and_convert_table(tag)
-            table_node, table_attributes = table_to_node(table, title, parent_node_current.createdAt, supertag_tbl, summary)
-            parent_node_current.children.append(table_node)
-            attributes += table_attributes
-            # Remove duplicates by converting each dictionary in the list to a tuple, 
-            # make a dict out of these, then convert it back to a list of dictionaries.
-            # Note: preserves the last occurrence of each duplicate.
-            #       If that is not intended, instead use:
-            # attributes = list(dict((attr['name'], attr) for attr in reversed(attributes)).values())[::-1]
-            attributes = list(dict((attr['name'], attr) for attr in attributes).values())
-            # Increment the summary attribute
-            summary.leafNodes += 1
-            summary.totalNodes += 1
+    return state.summary, state.nodes, state.attributes, state.supertags, state.superpage
+
+class PlainTextParser(HTMLParser):
+    """
+    Collects the text of the block elements of a page without building a
+    parse tree, for pages too large to be converted with BeautifulSoup.
+    """
+    BLOCKS = ('p', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'td', 'span', 'a')
 
-        # Handle images
-        elif tag_name == 'img':
-            image_nodes = []
-            if not parent_node_current:
-                n = 1
-                if DEBUG:
-                    print(f'ERROR: parent node went missing.')
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+        self.depth = 0
+        self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.BLOCKS:
+            if 0 == self.depth:
+                self.text = []
             else:
-                n, image_nodes, image_attributes = process_image_and_convert_to_node(tag, page_data.images, parent_node_current.createdAt, supertag_tbl, summary)
-                # as 'image_nodes' is a list and not a single node,
-                # use 'extend' instead of 'append' here
-                parent_node_current.children.extend(image_nodes)
-                attributes += image_attributes
-                # Remove duplicates by converting each dictionary in the list to a tuple, 
-                # make a dict out of these, then convert it back to a list of dictionaries.
-                # Note: preserves the last occurrence of each duplicate.
-                #       If that is not intended, instead use:
-                # attributes = list(dict((attr['name'], attr) for attr in reversed(attributes)).values())[::-1]
-                attributes = list(dict((attr['name'], attr) for attr in attributes).values())
-                # Increment of the summary attribute already done in
-                # 'process_image_and_convert_to_node' method, skipping
-
-        # Handle headlines
-        elif tag_name in ('h1', 'h2', 'h3', 'h4', 'h5'):
-            n, text = process_and_convert_heading(tag)
-            # Create a TanaIntermediateNode object from the <h2> element
-            child_node = TanaIntermediateNode(
-                uid=str(next(uid)), 
-                name=text, 
-                description="", 
-                children=[], 
-                refs=[], 
-                createdAt=parent_node_current.createdAt, 
-                editedAt=int(time.time() * 1000.0), 
-                type=NodeType.NODE
-            )
-            # Append the ChildNode object to the children of the Node object
-            parent_node_previous.children.append(child_node)
-            # Set the parent node to the heading ChildNode
-            parent_node_previous = parent_node_current
-            parent_node_current = child_node
-            # Increment the summary attribute
-            summary.leafNodes += 1
-            summary.totalNodes += 1
+                self.text.append(' ')
+            self.depth += 1
 
-        # Handle breaks and no breaks (not)
-        elif tag_name in ('br', 'nobr'):
-            n = 1
-
-        # Handle head/non-body (not)
-        elif tag_name in ('html', 'head', 'meta', 'link', 'body'):
-            n = 1
-
-        # Handle (un)ordered lists
-        elif tag_name in ('ol', 'ul'):
-            list_nodes = []
-            n, list_nodes, has_items = process_list_and_convert_to_node(tag, parent_node_current.createdAt, summary)
-            parent_node_current.children.extend(list_nodes)
-            # Increment of the summary attribute already done in
-            # 'process_unorder_list_and_convert_to_node' method.
-
-        # Handle generic inline container
-        elif tag_name == 'span':
-            text = process_child(tag)
-            name = compress_text(text)
-            child_node = TanaIntermediateNode(
-                uid=str(next(uid)), 
-                name=name, 
-                description='', 
-                children=[], 
-                refs=[], 
-                createdAt=parent_node_current.createdAt, 
-                editedAt=int(time.time() * 1000.0), 
-                type=NodeType.NODE
-            )
-            parent_node_current.children.append(child_node)
-            summary.leafNodes += 1
-            summary.totalNodes += 1
-            n = 1
+    def handle_endtag(self, tag):
+        if tag in self.BLOCKS and self.depth:
+            self.depth -= 1
+            if 0 == self.depth:
+                self.texts.append(compress_text(''.join(self.text)))
+
+    def handle_data(self, data):
+        if self.depth:
+            self.text.append(data)
 
-        # Handle URLs
-        elif tag_name == 'a':
-            n, anchor = process_and_convert_anchor(tag)
-            name = compress_text(anchor)
-            child_node = TanaIntermediateNode(
+def convert_page_plain(page_data: OneNotePageData) -> PageFragment:
+    """
+    Low-memory conversion of a page: the HTML is streamed through a parser
+    and the text of each block becomes a node below the page node.
+    Formatting, tables, and nesting are not preserved.
+    """
+    parser = PlainTextParser()
+    html = page_data.html_string
+    for start in range(0, len(html), 1 << 16):
+        parser.feed(html[start:start + (1 << 16)])
+    parser.close()
+    texts = parser.texts
+    title_str, date_str, time_str = (texts + ['', '', ''])[:3]
+    top_level_node = process_beginnings(page_data, title_str, date_str, time_str)
+    summary = TanaIntermediateSummary(0, 1, 1, 0, 0, 0)
+    editedAt = int(time.time() * 1000.0)
+    for text in texts[3:]:
+        if text:
+            top_level_node.children.append(TanaIntermediateNode(
                 uid=str(next(uid)), 
-                name=name, 
+                name=text, 
                 description='', 
                 children=[], 
                 refs=[], 
-                createdAt=parent_node_current.createdAt, 
-                editedAt=int(time.time() * 1000.0), 
+                createdAt=top_level_node.createdAt, 
+                editedAt=editedAt, 
                 type=NodeType.NODE
-            )
-            parent_node_current.children.append(child_node)
+            ))
             summary.leafNodes += 1
             summary.totalNodes += 1
+    top_level_node.description = f'{date_str}, {time_str} (converted as plain text, page too large)'
+    return PageFragment(page_data.pageId, page_data.isSubPage, [top_level_node], summary, [])
 
-        # Handle other tags
+def convert_page(page_data: OneNotePageData, max_memory: Optional[int] = None, oversized: str = 'plain') -> Optional[PageFragment]:
+    """
+    Convert a single page into a fragment, independent of all other pages.
+    A page whose parse tree is estimated to exceed 'max_memory' bytes is
+    either converted as plain text or skipped (None), see 'oversized'.
+    The page data is released afterwards.
+    """
+    diagnostics.begin_page(page_data.pageName)
+    links.begin_page()
+    try:
+        if page_data.xml_string is not None:
+            # Streamed, so the page XML needs no parse tree of its own
+            from onenote.pagexml import convert_page_xml
+            fragment = convert_page_xml(page_data)
+        elif max_memory and len(page_data.html_string) * SOUP_MEMORY_FACTOR > max_memory:
+            if oversized == 'skip':
+                return None
+            fragment = convert_page_plain(page_data)
         else:
-            # Handle unsupported tags gracefully
-            print(f"Unsupported tag: {tag_name}")
-            n = 1
-        i += n
-    
-    return summary, nodes, attributes, supertags, superpage
+            summary = TanaIntermediateSummary(0, 0, 0, 0, 0, 0)
+            summary, nodes, attributes, supertags, _ = convert_onenote_page(page_data, summary, [], [], [supertag_tbl], None)
+            fragment = PageFragment(page_data.pageId, page_data.isSubPage, nodes, summary, attributes, used_supertags(nodes, supertags))
+        # Links to this page resolve to its node
+        if fragment.nodes:
+            links.anchor(page_data.pageId, fragment.nodes[0].uid)
+        fragment.anchors, fragment.links = links.end_page()
+        return fragment
+    finally:
+        page_data.release()
+        diagnostics.end_page()
+
+def init_worker(instances: Any) -> None:
+    """
+    Set up a worker process: a snowflake instance of its own, so that the
+    uids of all processes are distinct, and the unsupported tags of a page
+    are handed back rather than logged.
+    """
+    global uid
+    with instances.get_lock():
+        instances.value += 1
+        instance = instances.value
+    uid = SnowflakeGenerator(instance)
+    diagnostics.deferred = True
+
+def convert_page_in_worker(page_data: OneNotePageData, max_memory: Optional[int], oversized: str) -> Tuple[Optional[PageFragment], float, Counter]:
+    started = time.perf_counter()
+    fragment = convert_page(page_data, max_memory, oversized)
+    return fragment, time.perf_counter() - started, diagnostics.last
 
-def convert_pages_all(onenote_app: Any, pages: Dict, outfile: str = None) -> None:
-    # Create summary
-    summary = TanaIntermediateSummary(0, 0, 0, 0, 0, 0)
+def convert_in_workers(pages: List[ElementTree.Element], workers: int, publish: Callable[[ElementTree.Element], OneNotePageData], cost_model: CostModel,
+                       max_memory: Optional[int], oversized: str,
+                       page_done: Callable[[ElementTree.Element, OneNotePageData, Optional[PageFragment], float], None],
+                       page_failed: Callable[[ElementTree.Element, Exception, Optional[OneNotePageData]], None]) -> None:
+    """
+    Convert the pages in 'workers' processes, while this process publishes
+    them. Pages are published longest estimated first (LPT), so that no
+    big page is left to hold up the end. Up to 'workers' published pages
+    wait for a worker; of these the one estimated to take longest, now
+    that its MHT size is known, goes first. 'page_done' and 'page_failed'
+    are called in the order the pages finish.
+    """
+    order = lpt_order(pages, cost_model.estimate)
+    instances = multiprocessing.Value('i', 29)
+    sequence = count()
+    ready = []      # heap of the published pages waiting for a worker
+    running = {}    # future -> (page, page data without its contents)
+    position = 0
+
+    def finished(future: Future) -> None:
+        page, page_data = running.pop(future)
+        try:
+            fragment, seconds, unsupported = future.result()
+        except Exception as e:
+            page_failed(page, e, page_data)
+            return
+        diagnostics.add_page(page.get('name'), unsupported)
+        page_done(page, page_data, fragment, seconds)
+
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(instances,)) as executor:
+        while position < len(order) or ready or running:
+            # Keep the workers busy, the biggest pages first
+            while ready and len(running) < workers:
+                _, _, page, page_data = heapq.heappop(ready)
+                # The page data is pickled (and dropped here) in the background,
+                # only a copy without the contents is kept
+                future = executor.submit(convert_page_in_worker, page_data, max_memory, oversized)
+                running[future] = (page, copy.copy(page_data))
+                running[future][1].release()
+            for future in [future for future in running if future.done()]:
+                finished(future)
+            if position < len(order) and len(ready) < workers:
+                page = order[position]
+                position += 1
+                try:
+                    page_data = publish(page)
+                except Exception as e:
+                    page_failed(page, e)
+                    continue
+                heapq.heappush(ready, (-cost_model.estimate(page, page_data.mhtSize), next(sequence), page, page_data))
+            elif running:
+                # Nothing left to publish for now, wait for a worker
+                for future in wait(running, return_when=FIRST_COMPLETED).done:
+                    finished(future)
+
+def quarantine_page(onenote_app: Any, directory: str, page: ElementTree.Element, quarantine_dir: str, error: str, publish: bool = True) -> None:
+    """
+    Keep the MHT of a page that failed to convert, along with the error,
+    for debugging. An MHT already deleted after parsing is published again,
+    unless not to 'publish' (e.g. a page refused for the temp quota).
+    """
+    os.makedirs(quarantine_dir, exist_ok=True)
+    name = safe_str(page.get('ID'))
+    file_path = page_file_path(directory, page)
+    if os.path.exists(file_path):
+        shutil.copyfile(file_path, os.path.join(quarantine_dir, f'{name}.mht'))
+    elif publish:
+        try:
+            onenote_app.Publish(page.get('ID'), os.path.join(quarantine_dir, f'{name}.mht'), int(PublishFormat.pfMHTML), "")
+        except Exception as e:
+            logger.debug('Could not publish page "%s" for the quarantine: %r', page.get('name'), e)
+    with open(os.path.join(quarantine_dir, f'{name}.txt'), 'w', encoding=CHARSET) as error_file:
+        error_file.write(f'Page: {page.get("name")}\n\n{error}')
+
+def select_pages(pages: Dict, options: ConvertOptions, catalogue: PageCatalogue) -> Dict:
+    """
+    The pages to convert: those matching the filters, of this node's shard.
+    """
+    # Leave out the pages not matching the filters before publishing any
+    if options.page_filter:
+        selected = len(pages)
+        pages = {key: page for key, page in pages.items()
+                 if options.page_filter.matches(page, catalogue[page.get('ID')].path if page.get('ID') in catalogue else None)}
+        logger.info('Filters: %d of %d pages.', len(pages), selected)
+
+    # Only convert this node's share of the pages
+    if options.shard:
+        shard, shards = options.shard
+        pages = {key: page for key, page in pages.items() if catalogue.shard_of(page.get('ID'), shards) == shard}
+        logger.info('Shard %d/%d: %d pages.', shard, shards, len(pages))
+    return pages
+
+def convert_pages_all(onenote_app: Any, pages: Dict, options: ConvertOptions, catalogue: Optional[PageCatalogue] = None) -> None:
+    outfile = options.outfile
+
+    # Store the page images, if requested
+    image_store = None
+    if options.image_dir:
+        image_store = ImageStore(options.image_dir, options.image_url)
 
     supertags = [supertag_tbl]
 
-    # Create attributes
-    attributes = []  # Initialize attributes as an empty list
+    # Locate all pages within the hierarchy at once
+    if catalogue is None:
+        catalogue = PageCatalogue.from_hierarchy(onenote_app)
 
-    # Create nodes
-    nodes = []
+    pages = select_pages(pages, options, catalogue)
+
+    # Either write each converted page to a fragment file, or
+    # checkpoint the converted pages, so that an interrupted or
+    # failed run can be resumed
+    journal = None
+    fragment_store = None
+    journal_path = None
+    if options.fragments_dir:
+        fragment_store = FragmentStore(options.fragments_dir)
+        quarantine_dir = f'{options.fragments_dir.rstrip(os.sep)}.quarantine'
+    else:
+        journal_path = options.journal or (f'{outfile}.journal' if outfile else None)
+        if journal_path:
+            journal = Journal(journal_path, supertags, options.resume)
+            # Continue to use the supertags the journaled fragments refer to
+            for supertag in supertags:
+                supertag.uid = journal.supertag_uids.get(supertag.name, supertag.uid)
+        if outfile or journal_path:
+            quarantine_dir = f'{outfile or journal_path}.quarantine'
+        else:
+            quarantine_dir = os.path.join(os.getcwd(), 'quarantine')
 
     # Establish a directory on the file system to store temporary files in
     if DEBUG:
         directory_name = os.path.join(os.getcwd(), "data")
         os.makedirs(directory_name, exist_ok=True)
     else:
-        temp_dir = tempfile.TemporaryDirectory()
+        temp_dir = tempfile.TemporaryDirectory(dir=options.temp_dir)
         directory_name = temp_dir.name
+    # Each MHT is deleted once parsed, publishing fails while over the quota
+    storage = TempStorage(directory_name, options.temp_quota_mb * 1024 * 1024 if options.temp_quota_mb else None,
+                          options.ram_dir, options.ram_quota_mb * 1024 * 1024, keep=DEBUG)
 
     # Within a temporary directory publish the OneNote pages as MHT,
     # process the MHT to extract the HTML and images from it
-    # and turn those into a collection of 'tanatypes'.
+    # and turn each page into a fragment of 'tanatypes'.
+    # A page that fails is quarantined and does not affect the others.
+    fragments = {}
+    failures = 0
+    skipped = []
+    max_memory = options.max_page_mb * 1024 * 1024 if options.max_page_mb else None
+    progress = ProgressReporter(len(pages)) if options.progress else None
+    # Estimates the pages' cost, to schedule them and for the ETA
+    cost_model = CostModel(options.stats) if options.stats or options.workers > 1 or progress else None
+    estimates: Dict[str, float] = {}
+    history = RunHistory(options.history) if options.history else None
+    if history:
+        history.start_run({key: value for key, value in vars(options).items() if value is not None})
+
+    def page_failed(page: ElementTree.Element, e: Exception, page_data: Optional[OneNotePageData] = None) -> None:
+        nonlocal failures
+        failures += 1
+        logger.error('ERROR: Page "%s" failed to convert: %r. Quarantined in "%s".', page.get("name"), e, quarantine_dir)
+        # A page refused for the temp quota would take the space again
+        over_quota = isinstance(e, OSError) and e.errno == errno.ENOSPC
+        quarantine_page(onenote_app, directory_name, page, quarantine_dir, traceback.format_exc(), not over_quota)
+        if journal:
+            journal.record_failure(page.get('ID'), repr(e))
+        if progress:
+            progress.page_done(work=estimates.get(page.get('ID'), 0.0))
+        if history:
+            history.record_page(page.get('ID'), page.get('name'), page_data.mhtSize if page_data else 0,
+                                page_data.publishSeconds if page_data else 0.0, page_data.extractSeconds if page_data else 0.0, error=repr(e))
+
+    def page_done(page: ElementTree.Element, page_data: OneNotePageData, fragment: Optional[PageFragment], seconds: float) -> None:
+        page_id = page.get('ID')
+        if progress:
+            progress.page_done(page_data.mhtSize, fragment.summary.totalNodes if fragment else 0, estimates.get(page_id, 0.0))
+        if cost_model:
+            cost_model.observe(page_id, seconds, page_data.mhtSize)
+        if fragment is None:
+            skipped.append(page.get('name'))
+        else:
+            if page_id in catalogue:
+                fragment.order = catalogue[page_id].position
+                fragment.parent_id = catalogue[page_id].parent_id
+            started = time.perf_counter()
+            if fragment_store:
+                fragment_store.write(fragment)
+            else:
+                fragments[page_id] = fragment
+                if journal:
+                    journal.record(fragment)
+                # The fragments live until the end, stop tracking them
+                bulk_gc.page_done()
+            serialise_seconds = time.perf_counter() - started
+        if history:
+            history.record_page(page_id, page.get('name'), page_data.mhtSize, page_data.publishSeconds, page_data.extractSeconds, seconds,
+                                serialise_seconds if fragment else 0.0,
+                                fragment.summary.totalNodes if fragment else 0, fragment.summary.fields if fragment else 0)
+
+    def publish(page: ElementTree.Element) -> OneNotePageData:
+        if bulk:
+            return bulk.publish(page)
+        return process_page(
+            onenote_app, 
+            directory_name, 
+            page,
+            image_store,
+            catalogue,
+            storage,
+            options.engine
+            )
+
+    bulk = None
+    bulk_gc = BulkGC()
+    bulk_gc.start()
     try:
-        superpage = None
+        # The pages left to convert, the others were converted by an earlier run
+        todo = []
         for page in pages.values():
-            page_data = process_page(
-                onenote_app, 
-                directory_name, 
-                page
-                )
-            summary, nodes, attributes, supertags, superpage = convert_onenote_page(
-                page_data, 
-                summary, 
-                nodes, 
-                attributes, 
-                supertags,
-                superpage
-                )
+            page_id = page.get('ID')
+            if journal and page_id in journal.fragments:
+                fragments[page_id] = journal.fragments[page_id]
+                if progress:
+                    progress.page_skipped()
+                continue
+            if fragment_store and options.resume and page_id in fragment_store:
+                if progress:
+                    progress.page_skipped()
+                continue
+            todo.append(page)
+
+        # The remaining time is estimated from the cost of the pages to do,
+        # known from earlier runs with --stats, else counted in pages: the
+        # size of a page is not known before it is published
+        if progress and cost_model.stats:
+            estimates = {page.get('ID'): cost_model.estimate(page) for page in todo}
+            progress.expect_work(sum(estimates.values()))
+        # The space the pages take when published, known from earlier runs
+        # with --stats, decides if they fit the quota and the RAM disk
+        if cost_model:
+            for page in todo:
+                mht_bytes = cost_model.mht_bytes(page.get('ID'))
+                if mht_bytes is not None:
+                    storage.expect(safe_str(page.get('ID')), mht_bytes)
+
+        # Sections of which most pages are to be converted are published at once
+        if options.bulk and 'mht' == options.engine:
+            bulk = BulkPublisher(onenote_app, directory_name, catalogue, todo, image_store, storage)
+
+        if options.workers > 1:
+            convert_in_workers(todo, options.workers, publish, cost_model, max_memory, options.oversized, page_done, page_failed)
+        else:
+            for page in todo:
+                page_data = None
+                try:
+                    page_data = publish(page)
+                    started = time.perf_counter()
+                    fragment = convert_page(page_data, max_memory, options.oversized)
+                except Exception as e:
+                    page_failed(page, e, page_data)
+                    continue
+                page_done(page, page_data, fragment, time.perf_counter() - started)
     finally:
+        bulk_gc.stop()
+        if progress:
+            progress.finish()
+        storage.cleanup()
         if not DEBUG:
             # Clean up the TemporaryDirectory
             temp_dir.cleanup()
+        if journal:
+            journal.close()
+        if cost_model:
+            cost_model.save()
 
-    # Create a Tana Intermediate File dictionary
-    tana_dictionary = TanaIntermediateFile(summary, nodes, attributes, supertags)
+    diagnostics.report()
+    if bulk and bulk.published:
+        logger.info('%d sections published at once.', bulk.published)
+    if image_store:
+        logger.info('%d images stored in "%s", %d duplicates skipped.', image_store.stored, image_store.directory, image_store.deduplicated)
+    if failures:
+        logger.error('%d pages failed to convert. Use --resume to retry them.', failures)
+    if skipped:
+        logger.warning('%d pages skipped, estimated to exceed %s MB of memory: %s', len(skipped), options.max_page_mb, ', '.join(skipped))
 
-    # Convert dictionary to a JSON string and write the JSON data to a file
-    if outfile:
-        try:
-            with open(outfile, 'w') as tif_json_file:
-                json.dump(tana_dictionary.to_dict(), tif_json_file, indent=3)
-        except IOError:
-            print(f"ERROR: Could not write to file: {outfile}")
-    else:
-        json.dump(tana_dictionary.to_dict(), sys.stdout, indent=3)
+    if fragment_store:
+        logger.info('Page fragments written to "%s".', fragment_store.directory)
+        if history:
+            history.finish_run()
+            history.close()
+        return
+
+    # Create a Tana Intermediate File dictionary, with the pages in their
+    # original order, whichever order they were converted in
+    ordered = [fragments[page.get('ID')] for page in pages.values() if page.get('ID') in fragments]
+    tana_dictionary = assemble_fragments(ordered, supertags)
+
+    # The journal is no longer needed once all pages made it into the output
+    started = time.perf_counter()
+    written = write_output(tana_dictionary, options)
+    if history:
+        history.finish_run(time.perf_counter() - started)
+        history.close()
+    if written and journal and not failures:
+        os.remove(journal_path)
+
+def assemble_pages_all(directories: List[str], options: ConvertOptions) -> None:
+    """
+    Merge the page fragments found in 'directories' into one TIF.
+    """
+    tana_dictionary = assemble_fragments(read_fragments(directories), [])
+    write_output(tana_dictionary, options)
+
+def write_output(tana_dictionary: TanaIntermediateFile, options: ConvertOptions) -> bool:
+    outfile = options.outfile
+
+    # Emit repeated content only once, if requested
+    if options.dedup or options.drop_boilerplate:
+        deduplicator = Deduplicator(uid, options.dedup_min_chars if options.dedup else sys.maxsize, options.drop_boilerplate)
+        deduplicator.run(tana_dictionary)
+        logger.info('%d repeated subtrees replaced by references, %d boilerplate nodes dropped.', deduplicator.replaced, deduplicator.dropped)
+
+    # Recompute the summary from the nodes and check the references
+    validator = TifValidator()
+    validator.run(tana_dictionary)
+    validator.report()
+
+    # Convert dictionary to JSON and write the JSON data to a file (or stdout)
+    try:
+        write_tif(tana_dictionary, outfile, options.format, options.compress)
+    except IOError:
+        logger.error('ERROR: Could not write to file: %s', outfile)
+        return False
+    return True
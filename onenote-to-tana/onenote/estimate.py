@@ -0,0 +1,135 @@
+# Estimate the time and size of a conversion from a sample of pages
+
+import json
+import math
+import random
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from onenote.catalogue import PageCatalogue
+from onenote.convert import convert_page, select_pages, supertag_tbl
+from onenote.onenote import ConvertOptions
+from onenote.pages import process_page
+from tanatypes.tif import TanaIntermediateFile, TanaIntermediateSummary
+from tanatypes.validate import TifValidator
+from utilities.logs import logger
+from utilities.storage import TempStorage
+
+# Normal quantile of a two-sided 95% confidence interval
+Z_95 = 1.96
+
+def extrapolate(values: List[float], population: int) -> Tuple[float, float]:
+    """
+    Extrapolate the sum over 'population' pages from the values of a
+    simple random sample of them. Returns the estimate and the half
+    width of its 95% confidence interval (with the finite population
+    correction, so a sample of all pages has none).
+    """
+    n = len(values)
+    if not n:
+        return 0.0, 0.0
+    total = population * statistics.fmean(values)
+    if n < 2 or population <= 1:
+        return total, 0.0
+    correction = math.sqrt(max(0.0, (population - n) / (population - 1)))
+    return total, Z_95 * population * statistics.stdev(values) / math.sqrt(n) * correction
+
+def format_seconds(seconds: float) -> str:
+    seconds = max(0, int(round(seconds)))
+    return f'{seconds // 3600}h {seconds // 60 % 60:02d}m {seconds % 60:02d}s'
+
+def format_bytes(size: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(size) < 1024 or unit == 'GB':
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+class PageSample():
+    """
+    The measurements of one sampled page.
+    """
+    def __init__(self, publish_seconds: float, convert_seconds: float, output_bytes: int, summary: TanaIntermediateSummary):
+        self.publish_seconds = publish_seconds
+        self.convert_seconds = convert_seconds
+        self.output_bytes = output_bytes
+        self.summary = summary
+
+def sample_page(onenote_app: Any, directory: str, page, catalogue: PageCatalogue, storage: TempStorage, options: ConvertOptions) -> Optional[PageSample]:
+    started = time.perf_counter()
+    page_data = process_page(onenote_app, directory, page, None, catalogue, storage, options.engine)
+    published = time.perf_counter()
+    max_memory = options.max_page_mb * 1024 * 1024 if options.max_page_mb else None
+    fragment = convert_page(page_data, max_memory, options.oversized)
+    converted = time.perf_counter()
+    if fragment is None:
+        return None
+    tif = TanaIntermediateFile(TanaIntermediateSummary(0, 0, 0, 0, 0, 0), fragment.nodes, fragment.attributes, [supertag_tbl])
+    summary = TifValidator(limit=0).run(tif)
+    if options.format == 'pretty':
+        encoded = [json.dumps(node.to_dict(), indent=3) for node in fragment.nodes]
+    else:
+        encoded = [json.dumps(node.to_dict(), separators=(',', ':')) for node in fragment.nodes]
+    return PageSample(published - started, converted - published, sum(len(text.encode('utf-8')) for text in encoded), summary)
+
+def estimate_pages_all(onenote_app: Any, pages: Dict, options: ConvertOptions, fraction: float = 0.05, min_sample: int = 20,
+                       catalogue: Optional[PageCatalogue] = None) -> None:
+    """
+    Publish and convert a random sample of the pages ('fraction' of them,
+    at least 'min_sample') and print the estimated time, output size, and
+    summary counts of converting all of them. Nothing is written.
+    """
+    if catalogue is None:
+        catalogue = PageCatalogue.from_hierarchy(onenote_app)
+    pages = select_pages(pages, options, catalogue)
+    population = list(pages.values())
+    if not population:
+        print('No pages to estimate.')
+        return
+    size = min(len(population), max(min_sample, math.ceil(fraction * len(population))))
+    sample = random.sample(population, size)
+
+    samples: List[PageSample] = []
+    failures = 0
+    with tempfile.TemporaryDirectory(dir=options.temp_dir) as directory:
+        storage = TempStorage(directory)
+        for page in sample:
+            try:
+                measured = sample_page(onenote_app, directory, page, catalogue, storage, options)
+            except Exception as e:
+                failures += 1
+                logger.warning('Page "%s" failed to convert: %r', page.get('name'), e)
+                continue
+            if measured:
+                samples.append(measured)
+    if not samples:
+        print('No sampled page could be converted.')
+        return
+
+    # Pages that fail or are skipped are estimated as taking nothing
+    def values(measure) -> List[float]:
+        return [measure(sample) for sample in samples] + [0.0] * (size - len(samples))
+
+    def line(name: str, estimate: Tuple[float, float], formatter=lambda value: f'{value:,.0f}') -> None:
+        total, half_width = estimate
+        print(f'  {name:<16} {formatter(total):>14}   ({formatter(total - half_width)} to {formatter(total + half_width)})')
+
+    count = len(population)
+    print(f'Estimate for {count} pages from a sample of {size} ({100 * size / count:.1f}%), with 95% confidence intervals:')
+    publish = extrapolate(values(lambda sample: sample.publish_seconds), count)
+    convert = extrapolate(values(lambda sample: sample.convert_seconds), count)
+    line('time', (publish[0] + convert[0], publish[1] + convert[1]), format_seconds)
+    if options.workers > 1:
+        # Publishing stays serial, converting is spread over the workers
+        line(f'  {options.workers} workers', (max(publish[0], convert[0] / options.workers), max(publish[1], convert[1] / options.workers)), format_seconds)
+    line('output size', extrapolate(values(lambda sample: sample.output_bytes), count), format_bytes)
+    top_level = sum(1 for page in population if page.get('isSubPage') != 'true')
+    print(f'  {"topLevelNodes":<16} {top_level:>14,}   (exact, from the hierarchy)')
+    total_nodes = extrapolate(values(lambda sample: sample.summary.totalNodes), count)
+    line('totalNodes', total_nodes)
+    line('leafNodes', (total_nodes[0] - top_level, total_nodes[1]))
+    for field in ('fields', 'calendarNodes'):
+        line(field, extrapolate(values(lambda sample: getattr(sample.summary, field)), count))
+    if failures:
+        print(f'  {failures} sampled pages failed to convert, they are estimated as empty.')
@@ -0,0 +1,61 @@
+# Page filters on the attributes of the hierarchy
+
+from datetime import datetime, timezone
+from typing import List, Optional
+from xml.etree import ElementTree
+
+from utilities.utils import selector_matcher
+
+def hierarchy_time(value: str) -> str:
+    """
+    Convert an ISO date (and time), e.g. "2024-03-01", to the format of
+    the hierarchy's time attributes, e.g. "2024-03-01T00:00:00.000Z", so
+    that times compare as strings. Times without a timezone are UTC.
+    """
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo:
+        moment = moment.astimezone(timezone.utc)
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+class PageFilter():
+    """
+    Tells whether a page is to be converted, judged by the attributes of
+    its hierarchy element alone, before it is published:
+    - created ('dateTime') or modified ('lastModifiedTime') since (inclusive)
+      or before (exclusive) a time in the format of 'hierarchy_time'
+    - a 'max_level' of 1 leaves out all subpages, 2 their subpages, ...
+    - 'paths' selects, 'exclude' leaves out pages whose path, e.g.
+      "Notebook/Section Group/Section/Page", matches any of the selectors
+      (substrings, globs, or 're:' regular expressions)
+    """
+    def __init__(self, created_since: Optional[str] = None, created_before: Optional[str] = None,
+                 modified_since: Optional[str] = None, modified_before: Optional[str] = None,
+                 max_level: Optional[int] = None, paths: Optional[List[str]] = None, exclude: Optional[List[str]] = None):
+        self.created_since = created_since
+        self.created_before = created_before
+        self.modified_since = modified_since
+        self.modified_before = modified_before
+        self.max_level = max_level
+        self.paths = [selector_matcher(selector) for selector in paths or []]
+        self.exclude = [selector_matcher(selector) for selector in exclude or []]
+
+    def matches(self, page: ElementTree.Element, section_path: Optional[str] = None) -> bool:
+        created = page.get('dateTime') or ''
+        if self.created_since and created < self.created_since:
+            return False
+        if self.created_before and created >= self.created_before:
+            return False
+        modified = page.get('lastModifiedTime') or ''
+        if self.modified_since and modified < self.modified_since:
+            return False
+        if self.modified_before and modified >= self.modified_before:
+            return False
+        if self.max_level and int(page.get('pageLevel') or 1) > self.max_level:
+            return False
+        if self.paths or self.exclude:
+            path = f'{section_path}/{page.get("name")}' if section_path else page.get('name') or ''
+            if self.paths and not any(matches(path) for matches in self.paths):
+                return False
+            if any(matches(path) for matches in self.exclude):
+                return False
+        return True
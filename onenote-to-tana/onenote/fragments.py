@@ -0,0 +1,273 @@
+# Converted page fragments and the checkpoint journal
+
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from onenote.links import LinkIndex
+from tanatypes.tif import *     # TIF - Tana Intermediate Format
+from utilities.utils import safe_str
+
+class PageFragment():
+    """
+    The conversion result of a single page: its top-level node(s), the
+    summary counts, attributes, and supertags contributed by the page.
+    'order' is the position of the page within the hierarchy, 'parent_id'
+    the ID of the superpage of a subpage. Subpages are attached to their
+    superpage only when the fragments are assembled, just as the links to
+    other pages are resolved then: 'anchors' maps the OneNote GUIDs of the
+    page (and its headings) to uids, 'links' are the nodes linking to OneNote.
+    """
+    def __init__(self, page_id: str, is_subpage: bool, nodes: List[TanaIntermediateNode], summary: TanaIntermediateSummary, attributes: List[Dict],
+                 supertags: Optional[List[Dict]] = None, order: int = -1, parent_id: Optional[str] = None,
+                 anchors: Optional[Dict[str, str]] = None, links: Optional[List[TanaIntermediateNode]] = None):
+        self.page_id = page_id
+        self.is_subpage = is_subpage
+        self.nodes = nodes
+        self.summary = summary
+        self.attributes = attributes
+        self.supertags = supertags or []
+        self.order = order
+        self.parent_id = parent_id
+        self.anchors = anchors or {}
+        self.links = links or []
+
+    def header(self) -> dict:
+        return {
+            'page_id': self.page_id,
+            'is_subpage': self.is_subpage,
+            'order': self.order,
+            'parent_id': self.parent_id,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            **self.header(),
+            'nodes': [node.to_dict() for node in self.nodes],
+            'summary': self.summary.to_dict(),
+            'attributes': self.attributes,
+            'supertags': self.supertags,
+            'anchors': self.anchors,
+            'links': [node.uid for node in self.links],
+        }
+
+    @classmethod
+    def from_dict(cls, fragment: dict) -> 'PageFragment':
+        nodes = [TanaIntermediateNode.from_dict(node) for node in fragment['nodes']]
+        return cls(
+            fragment['page_id'],
+            fragment['is_subpage'],
+            nodes,
+            TanaIntermediateSummary.from_dict(fragment['summary']),
+            fragment['attributes'],
+            fragment.get('supertags'),
+            fragment.get('order', -1),
+            fragment.get('parent_id'),
+            fragment.get('anchors'),
+            find_nodes(nodes, fragment.get('links')),
+        )
+
+def find_nodes(nodes: List[TanaIntermediateNode], uids: Optional[List[str]]) -> List[TanaIntermediateNode]:
+    """
+    The nodes with the given uids, in the order of 'uids'.
+    """
+    if not uids:
+        return []
+    wanted = set(uids)
+    found = {}
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if node.uid in wanted:
+            found[node.uid] = node
+        stack.extend(node.children or [])
+    return [found[uid] for uid in uids if uid in found]
+
+def used_supertags(nodes: List[TanaIntermediateNode], supertags: List[TanaIntermediateSupertag]) -> List[Dict]:
+    """
+    The supertags out of 'supertags' the nodes are tagged with.
+    """
+    used = set()
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if node.supertags:
+            used.update(node.supertags)
+        stack.extend(node.children or [])
+    return [supertag.to_dict() for supertag in supertags if supertag.uid in used]
+
+def remap_supertags(nodes: List[TanaIntermediateNode], remapped: Dict[str, str]) -> None:
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if node.supertags:
+            node.supertags = [remapped.get(supertag, supertag) for supertag in node.supertags]
+        stack.extend(node.children or [])
+
+def assemble_fragments(fragments: Iterable[PageFragment], supertags: List[TanaIntermediateSupertag]) -> TanaIntermediateFile:
+    """
+    Merge the page fragments, in page order, into a Tana Intermediate File.
+    A subpage is attached to the last child of its superpage, or, if its
+    superpage is unknown, of the preceding superpage. Fragments converted
+    by different runs may use different uids for the same supertag, these
+    are unified by the supertag's name. Links between the pages are
+    resolved last, see 'LinkIndex'.
+    """
+    summary = TanaIntermediateSummary(0, 0, 0, 0, 0, 0)
+    nodes = []
+    attributes = []
+    supertags = list(supertags)
+    supertag_uids = {supertag.name: supertag.uid for supertag in supertags}
+    superpages = {}
+    superpage = None
+    link_index = LinkIndex()
+    for fragment in fragments:
+        summary.add(fragment.summary)
+        link_index.add(fragment.anchors, fragment.links)
+        attributes += fragment.attributes
+        remapped = {}
+        for supertag in fragment.supertags:
+            if supertag['name'] not in supertag_uids:
+                supertag_uids[supertag['name']] = supertag['uid']
+                supertags.append(TanaIntermediateSupertag(supertag['uid'], supertag['name']))
+            elif supertag_uids[supertag['name']] != supertag['uid']:
+                remapped[supertag['uid']] = supertag_uids[supertag['name']]
+        if remapped:
+            remap_supertags(fragment.nodes, remapped)
+        if fragment.is_subpage and fragment.parent_id:
+            parent = superpages.get(fragment.parent_id)
+        else:
+            parent = superpage
+        for node in fragment.nodes:
+            if fragment.is_subpage and parent:
+                if parent.children:
+                    last_child = parent.children[-1]  # Get the last child node
+                    last_child.description = 'Imported into Tana with <b><i>onenote-to-tana</i></b>, including subpages below.'
+                    last_child.children.append(node)
+                else:
+                    parent.children.append(node)
+                summary.topLevelNodes -= 1
+                summary.leafNodes += 1
+            else:
+                if not fragment.is_subpage:
+                    superpage = node
+                    superpages[fragment.page_id] = node
+                nodes.append(node)
+    # Remove duplicates, preserves the last occurrence of each duplicate.
+    attributes = list(dict((attr['name'], attr) for attr in attributes).values())
+    summary.brokenRefs += link_index.resolve()
+    return TanaIntermediateFile(summary, nodes, attributes, supertags)
+
+class FragmentStore():
+    """
+    A directory holding one fragment file per page. Each file consists
+    of two lines: the fragment's header (see 'PageFragment.header'), so
+    that fragments can be ordered without loading them, and the fragment.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, page_id: str) -> str:
+        return os.path.join(self.directory, f'{safe_str(page_id)}.json')
+
+    def __contains__(self, page_id: str) -> bool:
+        return os.path.exists(self.path(page_id))
+
+    def write(self, fragment: PageFragment) -> None:
+        path = self.path(fragment.page_id)
+        with open(f'{path}.part', 'w', encoding='utf-8') as fragment_file:
+            fragment_file.write(json.dumps(fragment.header()) + '\n')
+            fragment_file.write(json.dumps(fragment.to_dict(), separators=(',', ':')) + '\n')
+        os.replace(f'{path}.part', path)
+
+    def headers(self) -> Iterator[Tuple[dict, str]]:
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                with open(entry.path, encoding='utf-8') as fragment_file:
+                    yield json.loads(fragment_file.readline()), entry.path
+
+def read_fragments(directories: List[str]) -> Iterator[PageFragment]:
+    """
+    Read the fragments of any number of fragment directories, one at a
+    time, in page order. A page found in several directories is taken
+    from the directory given last.
+    """
+    headers = {}
+    for directory in directories:
+        for header, path in FragmentStore(directory).headers():
+            headers[header['page_id']] = (header['order'], path)
+    for _, path in sorted(headers.values()):
+        with open(path, encoding='utf-8') as fragment_file:
+            fragment_file.readline()
+            yield PageFragment.from_dict(json.loads(fragment_file.readline()))
+
+class Journal():
+    """
+    Append-only checkpoint journal (JSON lines) of converted page fragments.
+    The first line records the supertags the fragments refer to, every
+    following line is either a converted page or a failed page. With
+    'resume' an existing journal is loaded and continued, otherwise it
+    is started afresh. The uids of the supertags the loaded fragments
+    refer to are in 'supertag_uids' (name -> uid), for the caller to use.
+    """
+    def __init__(self, path: str, supertags: List[TanaIntermediateSupertag], resume: bool = False):
+        self.path = path
+        self.fragments: Dict[str, PageFragment] = {}
+        self.failures: Dict[str, str] = {}
+        self.supertag_uids: Dict[str, str] = {}
+        if resume and os.path.exists(path):
+            self.supertag_uids = self.load()
+            self.file = open(path, 'a', encoding='utf-8')
+            if not self.supertag_uids:
+                # Interrupted before the supertags were written
+                self.write({'supertags': [supertag.to_dict() for supertag in supertags]})
+        else:
+            self.file = open(path, 'w', encoding='utf-8')
+            self.write({'supertags': [supertag.to_dict() for supertag in supertags]})
+
+    def load(self) -> Dict[str, str]:
+        """
+        Load the journal, return the uids of its supertags by name. The
+        last line of an interrupted run, written in part, is cut off, so
+        that the next entry starts on a line of its own.
+        """
+        supertag_uids = {}
+        end = 0     # of the last complete line
+        with open(self.path, 'rb') as journal_file:
+            for line in journal_file:
+                if not line.endswith(b'\n'):
+                    break
+                end += len(line)
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if 'supertags' in entry:
+                    supertag_uids = {supertag['name']: supertag['uid'] for supertag in entry['supertags']}
+                elif 'fragment' in entry:
+                    self.fragments[entry['page_id']] = PageFragment.from_dict(entry['fragment'])
+                    self.failures.pop(entry['page_id'], None)
+                elif 'error' in entry:
+                    self.failures[entry['page_id']] = entry['error']
+        with open(self.path, 'r+b') as journal_file:
+            journal_file.truncate(end)
+        return supertag_uids
+
+    def write(self, entry: dict) -> None:
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+
+    def record(self, fragment: PageFragment) -> None:
+        self.fragments[fragment.page_id] = fragment
+        self.failures.pop(fragment.page_id, None)
+        self.write({'page_id': fragment.page_id, 'fragment': fragment.to_dict()})
+
+    def record_failure(self, page_id: str, error: str) -> None:
+        self.failures[page_id] = error
+        self.write({'page_id': page_id, 'error': error})
+
+    def close(self, remove: Optional[bool] = False) -> None:
+        self.file.close()
+        if remove:
+            os.remove(self.path)
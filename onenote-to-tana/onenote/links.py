@@ -0,0 +1,116 @@
+# Links between OneNote pages
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+from tanatypes.tif import TanaIntermediateNode
+
+# The first GUID of a hierarchy ID, e.g. the page GUID of a page ID
+GUID = re.compile(r'\{[^{}]*\}')
+# The objects of a page share a GUID, told apart by their number
+OBJECT_ID = re.compile(r'(\{[^{}]*\})\{(\d+)\}')
+# The page and object (e.g. heading) a OneNote link points to
+LINK_TARGET = re.compile(r'(page-id|object-id)=(\{[^{}&]*\})(?:&(\w+)(?=&))?')
+# A markdown link to OneNote within a node name: [text](onenote:...&end)
+LINK = re.compile(r'\]\((onenote:(?:.*?&end(?=\))|[^)\s]*))\)')
+
+def onenote_guid(onenote_id: str) -> Optional[str]:
+    """
+    The GUID a OneNote link uses for an object with the given hierarchy
+    (or object) ID, e.g. "{A1B2...}" for "{A1B2...}{1}{E19...}".
+    """
+    match = GUID.match(onenote_id or '')
+    return match.group(0).upper() if match else None
+
+def object_key(object_id: str) -> Optional[str]:
+    """
+    The key a OneNote link uses for an object (e.g. a heading) with the
+    given object ID, e.g. "{A1B2...}&21" for "{A1B2...}{21}{B0}".
+    """
+    match = OBJECT_ID.match(object_id or '')
+    return f'{match.group(1).upper()}&{match.group(2)}' if match else None
+
+def link_targets(href: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    The GUID of the page and the key of the object a OneNote link points to.
+    """
+    targets = {name: f'{guid.upper()}&{number}' if number else guid.upper() for name, guid, number in LINK_TARGET.findall(href)}
+    return targets.get('page-id'), targets.get('object-id')
+
+class LinkRecorder():
+    """
+    Collects, while a page is converted, the OneNote IDs of its page and
+    headings with the uids of their nodes (anchors), and the nodes whose
+    name links to OneNote. Like 'diagnostics', used one page at a time.
+    """
+    def __init__(self):
+        self.anchors: Dict[str, str] = {}
+        self.nodes: List[TanaIntermediateNode] = []
+
+    def begin_page(self) -> None:
+        self.anchors = {}
+        self.nodes = []
+
+    def anchor(self, onenote_id: str, uid: str) -> None:
+        guid = onenote_guid(onenote_id)
+        if guid:
+            self.anchors[guid] = uid
+
+    def anchor_object(self, object_id: str, uid: str) -> None:
+        key = object_key(object_id)
+        if key:
+            self.anchors[key] = uid
+            # For links to the GUID alone, the first object with it
+            self.anchors.setdefault(key.split('&')[0], uid)
+
+    def record(self, node: TanaIntermediateNode) -> None:
+        if node.name and '](onenote:' in node.name:
+            self.nodes.append(node)
+
+    def end_page(self) -> Tuple[Dict[str, str], List[TanaIntermediateNode]]:
+        anchors, nodes = self.anchors, self.nodes
+        self.begin_page()
+        return anchors, nodes
+
+links = LinkRecorder()
+
+class LinkIndex():
+    """
+    The anchors of all pages (OneNote GUID or object key -> uid) and the nodes linking to
+    OneNote. Once all pages are known, 'resolve' rewrites each link into an
+    alias reference, "[text]([[uid]])", visiting just the linking nodes.
+    """
+    def __init__(self):
+        self.anchors: Dict[str, str] = {}
+        self.nodes: List[TanaIntermediateNode] = []
+        self.resolved = 0
+        self.broken = 0
+
+    def add(self, anchors: Dict[str, str], nodes: List[TanaIntermediateNode]) -> None:
+        self.anchors.update(anchors)
+        self.nodes.extend(nodes)
+
+    def target(self, href: str) -> Optional[str]:
+        page, target_object = link_targets(href)
+        if target_object and target_object in self.anchors:
+            return self.anchors[target_object]
+        return self.anchors.get((target_object or '').split('&')[0]) or self.anchors.get(page)
+
+    def resolve(self) -> int:
+        """
+        Rewrite the links, return the number of links left unresolved.
+        """
+        for node in self.nodes:
+            refs = node.refs if node.refs is not None else []
+            def rewrite(match):
+                uid = self.target(match.group(1))
+                if uid is None:
+                    self.broken += 1
+                    return match.group(0)
+                self.resolved += 1
+                if uid not in refs:
+                    refs.append(uid)
+                return f']([[{uid}]])'
+            node.name = LINK.sub(rewrite, node.name)
+            node.refs = refs
+        return self.broken
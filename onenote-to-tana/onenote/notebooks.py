@@ -1,28 +1,27 @@
 # OneNote Notebooks functions
 
-from prompt_toolkit import prompt
-from prompt_toolkit.completion import WordCompleter
 from typing import Any, Dict, Optional, Tuple
 from xml.etree import ElementTree
 
-from onenote.sections import get_sections_xml, ui_handle_sections
+from onenote.catalogue import PageCatalogue
+from onenote.onenote import ConvertOptions
+from onenote.sections import get_sections, ui_handle_sections
 from onenote.pages import get_pages, handle_pages_all
-from utilities.utils import check_substring_in_keys
+from utilities.completion import prompt_name
+from utilities.utils import select_in_keys
 
 def ui_select_notebook(notebooks: Dict[str, ElementTree.Element], all: Optional[bool] = False) -> str:
     """
     Interactively select a notebook from the available notebooks.
     """
-    print("Available notebooks:", ', '.join(notebooks.keys()))
     all_notebooks = False
     if all:
         # check for a notebook called 'All' (not)
         all_notebooks = 'All' not in notebooks
         if all_notebooks:
             notebooks["All"] = None
-    notebook_completer = WordCompleter(notebooks.keys(), ignore_case=True)
     prompt_str = "To select a notebook type in its name or 'All' to select all: " if all_notebooks else "Select one notebook by typing in its name: "
-    selected_notebook = prompt(prompt_str, completer=notebook_completer)
+    selected_notebook = prompt_name(prompt_str, notebooks.keys(), 'Available notebooks')
     if all_notebooks and selected_notebook == "All":
         selected_notebook = None
     else:
@@ -30,39 +29,35 @@ def ui_select_notebook(notebooks: Dict[str, ElementTree.Element], all: Optional[
     notebooks.pop("All", None)
     return selected_notebook, all_notebooks
 
-def ui_handle_notebooks(onenote_app: Any, notebooks: Dict[str, ElementTree.Element], outfile: str):
+def ui_handle_notebooks(onenote_app: Any, notebooks: Dict[str, ElementTree.Element], options: ConvertOptions):
     selected_notebook, all_notebooks = ui_select_notebook(notebooks, True)
     if not all_notebooks:
         notebooks = {selected_notebook: notebooks[selected_notebook]}
-    sections = {}
-    for notebook in notebooks.values():
-        notebook_sections = get_sections_xml(onenote_app, notebook)
-        sections.update(notebook_sections)
+    sections = get_sections(onenote_app, notebooks)
 
     if all_notebooks:
-        pages = {}
-        for section in sections.values():
-            section_pages = get_pages(onenote_app, section)
-            pages.update(section_pages)
-        handle_pages_all(onenote_app, pages, outfile)
+        pages = get_pages(onenote_app, sections.values())
+        handle_pages_all(onenote_app, pages, options)
     else:
-        ui_handle_sections(onenote_app, sections, outfile)
+        ui_handle_sections(onenote_app, sections, options)
 
-def find_notebooks(onenote_app: Any, onenote_elements: ElementTree.Element, notebooks_to_find: str) -> Tuple[Dict, Dict]:
+def find_notebooks(onenote_app: Any, onenote_elements: ElementTree.Element, notebooks_to_find: str, catalogue: Optional[PageCatalogue] = None) -> Tuple[Dict, Dict]:
+    """
+    Find the notebooks whose name matches 'notebooks_to_find' and their
+    pages, located in the 'catalogue'. Pages sharing a name are kept
+    apart, their keys are extended with the notebook and section.
+    """
     notebooks = get_notebooks(onenote_elements)
     if str:
-        matches = check_substring_in_keys(notebooks, notebooks_to_find)
+        matches = select_in_keys(notebooks, notebooks_to_find)
         if 0 == len(matches):
             raise KeyError
     else:
         matches = notebooks.copy()
 
-    results = {}
-    for notebook in matches.values():
-        sections = get_sections_xml(onenote_app, notebook)
-        for section in sections.values():
-            pages = get_pages(onenote_app, section)
-            results.update(pages)
+    if catalogue is None:
+        catalogue = PageCatalogue.from_hierarchy(onenote_app)
+    results = catalogue.labelled(catalogue.within(notebook.get('ID') for notebook in matches.values()))
     return results, matches
 
 def get_notebooks(elements: ElementTree.Element) -> Dict[str, ElementTree.Element]:
@@ -1,7 +1,35 @@
-from typing import Dict
+import sys
+from enum import IntEnum
+from typing import Any, Dict, List, Optional, Tuple
+
+class HierarchyScope(IntEnum):
+    """
+    The scopes of 'GetHierarchy', usable without the COM type library.
+    """
+    hsSelf = 0
+    hsChildren = 1
+    hsNotebooks = 2
+    hsSections = 3
+    hsPages = 4
+
+class PublishFormat(IntEnum):
+    """
+    The formats of 'Publish' used here, usable without the COM type library.
+    """
+    pfMHTML = 2
+
+class PageInfo(IntEnum):
+    """
+    What 'GetPageContent' includes in the page XML, see 'PublishFormat'.
+    """
+    piBasic = 0         # images are referenced by callback ID
+
+class XMLSchema(IntEnum):
+    xs2013 = 2
 
 class OneNotePageData():
-    def __init__(self, nodebookName: str, sectionName: str, pageName: str, createdAt: str, editedAt: str, isSubPage: bool, html_string: str, images: Dict[str, str]):
+    def __init__(self, nodebookName: str, sectionName: str, pageName: str, createdAt: str, editedAt: str, isSubPage: bool, html_string: str, images: Dict[str, str], pageId: Optional[str] = None, mhtSize: int = 0,
+                 publishSeconds: float = 0.0, extractSeconds: float = 0.0, xml_string: Optional[str] = None):
         self.nodebookName = nodebookName
         self.sectionName = sectionName
         self.pageName = pageName
@@ -10,3 +38,82 @@ class OneNotePageData():
         self.isSubPage = isSubPage
         self.html_string = html_string
         self.images = images
+        self.pageId = pageId
+        self.mhtSize = mhtSize
+        self.publishSeconds = publishSeconds
+        self.extractSeconds = extractSeconds
+        self.xml_string = xml_string    # the page XML, converted instead of 'html_string' if given
+
+    def release(self) -> None:
+        """
+        Drop the page contents once the page is converted.
+        """
+        self.html_string = None
+        self.xml_string = None
+        self.images = {}
+
+class ConvertOptions():
+    def __init__(self, outfile: Optional[str] = None, image_dir: Optional[str] = None, image_url: Optional[str] = None, journal: Optional[str] = None, resume: bool = False, max_page_mb: Optional[int] = None, oversized: str = 'plain',
+                 dedup: bool = False, dedup_min_chars: int = 32, drop_boilerplate: Optional[List[str]] = None,
+                 format: str = 'pretty', compress: Optional[str] = None, fragments_dir: Optional[str] = None,
+                 shard: Optional[Tuple[int, int]] = None, progress: bool = False,
+                 temp_dir: Optional[str] = None, temp_quota_mb: Optional[int] = None, ram_dir: Optional[str] = None, ram_quota_mb: int = 256,
+                 page_filter: Optional[Any] = None, workers: int = 1, stats: Optional[str] = None,
+                 history: Optional[str] = None, engine: str = 'mht', bulk: bool = True):
+        self.outfile = outfile        # write the TIF to this file instead of stdout
+        self.image_dir = image_dir    # store page images in this directory
+        self.image_url = image_url    # base URL the image directory is served from
+        self.journal = journal        # checkpoint journal, default: next to 'outfile'
+        self.resume = resume          # reuse the pages converted in the journal
+        self.max_page_mb = max_page_mb  # memory a page may take to convert
+        self.oversized = oversized    # 'plain' or 'skip' pages above 'max_page_mb'
+        self.dedup = dedup            # replace repeated subtrees by references
+        self.dedup_min_chars = dedup_min_chars  # smallest subtree (in characters) to replace
+        self.drop_boilerplate = drop_boilerplate or []  # drop nodes matching these regular expressions
+        self.format = format          # 'pretty', 'compact', or 'ndjson'
+        self.compress = compress      # 'gzip' or 'xz', default: by the extension of 'outfile'
+        self.fragments_dir = fragments_dir  # write one fragment per page here instead of a TIF
+        self.shard = shard            # (i, n): convert only the i-th of n shares of the pages
+        self.progress = progress      # report the progress of the conversion
+        self.temp_dir = temp_dir      # where pages are published to, default: the system's temporary directory
+        self.temp_quota_mb = temp_quota_mb  # disk space the published pages may take at once
+        self.ram_dir = ram_dir        # e.g. a RAM disk, for published pages up to 'ram_quota_mb' at once
+        self.ram_quota_mb = ram_quota_mb
+        self.page_filter = page_filter  # PageFilter, convert only the pages matching it
+        self.workers = workers        # processes converting pages in parallel
+        self.stats = stats            # file keeping the conversion time per page, for scheduling
+        self.history = history        # SQLite database to record the run and its pages in
+        self.engine = engine          # 'mht' (published HTML) or 'xml' (page XML) pages are converted from
+        self.bulk = bulk              # publish sections at once, where most of their pages are converted
+
+class OneNoteTable():
+    """
+    Column-oriented representation of an OneNote table, with its 'title'
+    (the title attribute of the HTML table, if any). The first row
+    provides the table name and the field names (interned once per table),
+    the first column of each other row provides the row name and the
+    remaining cells are kept per field in 'columns'.
+    """
+    def __init__(self, title: str):
+        self.title = title
+        self.name = ''
+        self.has_heading = False
+        self.fields: List[str] = []
+        self.row_names: List[str] = []
+        self.columns: List[List[Optional[str]]] = []
+
+    def add_row(self, cells: List[str]) -> None:
+        if not self.has_heading:
+            # Heading row
+            self.has_heading = True
+            self.name = cells[0] if cells else ''
+            self.fields = [sys.intern(cell) if cell != '' else str(index + 1) for index, cell in enumerate(cells[1:])]
+            self.columns = [[] for _ in self.fields]
+            return
+        for index in range(len(self.fields), len(cells) - 1):
+            # More cells than headings, add the missing fields
+            self.fields.append(str(index + 1))
+            self.columns.append([None] * len(self.row_names))
+        self.row_names.append(cells[0] if cells else '')
+        for index, column in enumerate(self.columns):
+            column.append(cells[index + 1] if index + 1 < len(cells) else None)
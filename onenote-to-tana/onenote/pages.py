@@ -1,34 +1,43 @@
 # OneNote Pages functions
 
-import win32com.client as win32
+import binascii
+import re
+import time
 
-from prompt_toolkit import prompt
-from prompt_toolkit.completion import WordCompleter
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from xml.etree import ElementTree
 
-from onenote.onenote import OneNotePageData
-from utilities.utils import safe_str, extract_mht_contents
+from onenote.catalogue import PageCatalogue, unique_labels
+from onenote.onenote import ConvertOptions, HierarchyScope, OneNotePageData, PageInfo, PublishFormat, XMLSchema
+from utilities.completion import prompt_name
+from utilities.images import ImageStore, image_content_type
+from utilities.logs import logger
+from utilities.mht import extract_mht_contents
+from utilities.storage import TempStorage
+from utilities.utils import safe_str
 
-def get_pages(onenote_app: Any, section: ElementTree.Element) -> Dict[str, ElementTree.Element]:
+# The images of page XML are referenced by callback ID
+CALLBACK_ID = re.compile(r'callbackID="([^"]+)"')
+
+def get_pages(onenote_app: Any, sections: Iterable[ElementTree.Element]) -> Dict[str, ElementTree.Element]:
     """
-    Get the names of all pages in the selected section.
+    Get all pages in the selected sections, keyed by their name. Pages
+    sharing a name are kept apart, their keys are extended with the
+    section (see 'unique_labels').
     """
-    children = onenote_app.GetHierarchy(section.attrib['ID'], win32.constants.hsPages, "")
-    return {page.get('name'): page for page in ElementTree.fromstring(children) if page.get('name') is not None}
+    pages = []
+    for section in sections:
+        children = onenote_app.GetHierarchy(section.attrib['ID'], int(HierarchyScope.hsPages), "")
+        pages += [(page.get('name'), section.get('name'), page) for page in ElementTree.fromstring(children) if page.get('name') is not None]
+    return unique_labels(pages)
 
 def select_page(pages: Dict[str, ElementTree.Element], section_name: str) -> Tuple[str, bool]:
-    pages_str = ', '.join(pages.keys())
-    if section_name:
-        print(f'Available pages in section "{section_name}": {pages_str}')
-    else:
-        print(f'Available pages in section: {pages_str}')
     all_pages = 'All' not in pages
     if all_pages:
         pages["All"] = None
     prompt_str = "To select a page type in its name or 'All' to select all: " if all_pages else "Type in the name of one page to select: "
-    page_completer = WordCompleter(pages.keys(), ignore_case=True)
-    selected_page = prompt(prompt_str, completer=page_completer)
+    heading = f'Available pages in section "{section_name}"' if section_name else 'Available pages in section'
+    selected_page = prompt_name(prompt_str, pages.keys(), heading)
     if all_pages and selected_page == "All":
         selected_page = None
     else:
@@ -36,17 +45,17 @@ def select_page(pages: Dict[str, ElementTree.Element], section_name: str) -> Tup
     pages.pop("All", None)
     return selected_page, all_pages
 
-def ui_handle_pages(onenote_app: Any, pages: Dict[str, ElementTree.Element], outfile: str):
+def ui_handle_pages(onenote_app: Any, pages: Dict[str, ElementTree.Element], options: ConvertOptions):
     # print(f'Available pages: {", ".join(pages.keys())}')
     selected_page, all_pages = select_page(pages, None)
     if not all_pages:
         pages = {selected_page: pages[selected_page]}
     # for page in pages.values():
     #    process_page(onenote_app, page)
-    handle_pages_all(onenote_app, pages, outfile)
+    handle_pages_all(onenote_app, pages, options)
 
 def handle_pages(onenote_app: Any, section: ElementTree.Element, all_sections: bool):
-    pages = get_pages(onenote_app, section)
+    pages = get_pages(onenote_app, [section])
     if not pages:
         print(f'Section "{section.get("name")}" has no pages. Skipping.')
         return None
@@ -57,27 +66,18 @@ def handle_pages(onenote_app: Any, section: ElementTree.Element, all_sections: b
             pages = {selected_page: pages[selected_page]}
     return pages
 
-def find_pages(onenote_app: Any, onenote_elements: ElementTree.Element, pages_to_find: List[str]) -> Dict:
-    from onenote.notebooks import get_notebooks
-    from onenote.sections import get_sections_xml
-    from utilities.utils import check_substring_in_keys
-
-    results = {}
-    notebooks = get_notebooks(onenote_elements)
-    for notebook_name, notebook in notebooks.items():
-        sections = get_sections_xml(onenote_app, notebook)
-        for section_name, section in sections.items():
-            pages = get_pages(onenote_app, section)
-
-            for substring in pages_to_find:
-                matches = check_substring_in_keys(pages, substring)
-                if not matches:
-                    continue
-                results.update(matches)
-    return results
+def find_pages(onenote_app: Any, onenote_elements: ElementTree.Element, pages_to_find: List[str], catalogue: Optional[PageCatalogue] = None) -> Dict:
+    """
+    Find the pages matching any of the 'pages_to_find' selectors (substrings,
+    globs, or 're:' prefixed regular expressions). Pages sharing a name are
+    kept apart, their keys are extended with the notebook and section.
+    """
+    if catalogue is None:
+        catalogue = PageCatalogue.from_hierarchy(onenote_app)
+    return catalogue.labelled(catalogue.search(pages_to_find))
 
 def find_page_in_notebook(onenote_app: Any, page_id: str) -> Tuple[ElementTree.Element, ElementTree.Element]:
-    hierarchy_xml = onenote_app.GetHierarchy("", win32.constants.hsPages, "")
+    hierarchy_xml = onenote_app.GetHierarchy("", int(HierarchyScope.hsPages), "")
     notebooks = ElementTree.fromstring(hierarchy_xml)
     for notebook in notebooks:
         for section in notebook:
@@ -86,19 +86,42 @@ def find_page_in_notebook(onenote_app: Any, page_id: str) -> Tuple[ElementTree.E
                     return notebook, section
     return None, None
 
-def process_page(onenote_app: Any, directory: str, page: ElementTree.Element) -> OneNotePageData:
+def page_file_path(directory: str, page: ElementTree.Element) -> str:
+    """
+    The file a page is published to within 'directory', named after the
+    page ID, since page names need not be unique.
+    """
+    import os
+    return os.path.join(directory, f'{safe_str(page.get("ID"))}.mht')
+
+def fetch_page_images(onenote_app: Any, page_id: str, xml_string: str, image_store: Optional[ImageStore] = None) -> Dict[str, str]:
+    """
+    Store the images the page XML references by callback ID in the
+    'image_store'. Returns the media URL of each callback ID, an empty
+    string for each when no 'image_store' is given, as 'extract_mht_contents'.
+    """
+    images = {}
+    for callback_id in CALLBACK_ID.findall(xml_string):
+        if image_store is None:
+            images[callback_id] = ''
+        elif callback_id not in images:
+            data = binascii.a2b_base64(onenote_app.GetBinaryPageContent(page_id, callback_id))
+            writer = image_store.writer(image_content_type(data))
+            writer.write(data)
+            images[callback_id] = writer.commit()
+    return images
+
+def process_page(onenote_app: Any, directory: str, page: ElementTree.Element, image_store: Optional[ImageStore] = None, catalogue: Optional[PageCatalogue] = None, storage: Optional[TempStorage] = None,
+                 engine: str = 'mht') -> OneNotePageData:
     import os
 
     # print(f'page attributes: {page.attrib}')
     page_id = page.get("ID")
-    sub_page = False
-    try:
-        if (page.attrib['isSubPage'] == 'true'):
-            sub_page = True
-            print("\t", end="")
-    except:
-        pass
-    notebook, section = find_page_in_notebook(onenote_app, page_id)
+    sub_page = page.get('isSubPage') == 'true'
+    if catalogue and page_id in catalogue:
+        notebook, section = catalogue[page_id].notebook, catalogue[page_id].section
+    else:
+        notebook, section = find_page_in_notebook(onenote_app, page_id)
 
     notebook_name = notebook.get('name')
     section_name = section.get('name')
@@ -107,18 +130,39 @@ def process_page(onenote_app: Any, directory: str, page: ElementTree.Element) ->
     created_at = page.get("dateTime")
     edited_at = page.get("lastModifiedTime")
 
-    # Create a file in the directory
-    file_name = f'{safe_str(page_name)}.mht'
-    file_path = os.path.join(directory, file_name)
-
-    # print(f'  > {page_name}, created at: {created_at}, edited at: {edited_at}, {notebook_name}/{section_name} {file_path}')
-    print(f'> Page: "{page_name}", from "{notebook_name}" notebook section "{section_name}"')
-
-    # Get the content of the page, as MHT
-    onenote_app.Publish(page_id, file_path, win32.constants.pfMHTML, "")
-
-    # Extract the contents of the Microsoft Hypertext Archive (MHT) file. 
-    html, images = extract_mht_contents(file_path)
+    # print(f'  > {page_name}, created at: {created_at}, edited at: {edited_at}, {notebook_name}/{section_name}')
+    logger.info('%s> Page: "%s", from "%s" notebook section "%s"', '\t' if sub_page else '', page_name, notebook_name, section_name)
+
+    html = xml_string = None
+    if 'xml' == engine:
+        # Get the content of the page as XML, converted as is, the images
+        # it references are fetched one by one
+        started = time.perf_counter()
+        xml_string = onenote_app.GetPageContent(page_id, "", int(PageInfo.piBasic), int(XMLSchema.xs2013))
+        published = time.perf_counter()
+        images = fetch_page_images(onenote_app, page_id, xml_string, image_store)
+        extracted = time.perf_counter()
+        mht_size = len(xml_string)
+    else:
+        # Create a file in the directory, or in the storage if it has room
+        file_path = storage.acquire(safe_str(page_id)) if storage else page_file_path(directory, page)
+
+        # Get the content of the page, as MHT
+        try:
+            started = time.perf_counter()
+            onenote_app.Publish(page_id, file_path, int(PublishFormat.pfMHTML), "")
+            if storage:
+                storage.published(file_path)
+            published = time.perf_counter()
+
+            # Extract the contents of the Microsoft Hypertext Archive (MHT) file. 
+            mht_size = os.path.getsize(file_path)
+            html, images = extract_mht_contents(file_path, image_store)
+            extracted = time.perf_counter()
+        finally:
+            # The MHT is not needed once parsed
+            if storage:
+                storage.release(file_path)
 
     page_data = OneNotePageData(
         notebook_name, 
@@ -128,10 +172,15 @@ def process_page(onenote_app: Any, directory: str, page: ElementTree.Element) ->
         edited_at,
         sub_page,
         html,
-        images
+        images,
+        page_id,
+        mht_size,
+        published - started,
+        extracted - published,
+        xml_string
         )
     return page_data
 
-def handle_pages_all(onenote_app: Any, pages: Dict, outfile: str) -> None:
+def handle_pages_all(onenote_app: Any, pages: Dict, options: ConvertOptions, catalogue: Optional[PageCatalogue] = None) -> None:
     from onenote.convert import convert_pages_all
-    convert_pages_all(onenote_app, pages, outfile)
+    convert_pages_all(onenote_app, pages, options, catalogue)
@@ -0,0 +1,296 @@
+# Conversion of OneNote's page XML, without publishing the page as MHT
+
+from datetime import timezone
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from onenote import convert
+from onenote.convert import PageState, compress_text, make_node, process_image_and_convert_to_node, start_page, supertag_tbl, table_to_node
+from onenote.fragments import PageFragment, used_supertags
+from onenote.links import links
+from onenote.onenote import OneNotePageData, OneNoteTable
+from tanatypes.tif import *     # TIF - Tana Intermediate Format
+from utilities.logs import diagnostics
+from utilities.utils import iso8601
+
+# Characters of page XML handed to the parser at once
+CHUNK_SIZE = 1 << 16
+# Quick styles converted to headings, see 'handle_heading' of the HTML
+HEADINGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+# Elements converted once complete, along with their descendants
+PASSIVE = ('Title', 'Table', 'PageSettings')
+# Elements of the page XML that need no conversion of their own, or that
+# are converted along with their parent element
+KNOWN = {
+    'Page', 'Meta', 'MediaPlaylist', 'TagDef', 'QuickStyleDef', 'Title',
+    'Outline', 'Position', 'Size', 'Indents', 'Indent', 'OEChildren', 'OE', 'T', 'Tag', 'List', 'Bullet', 'Number',
+    'Table', 'Columns', 'Column', 'Row', 'Cell', 'Image', 'CallbackID', 'Data', 'OCRData', 'OCRText', 'OCRToken',
+}
+
+def local_name(tag: str) -> str:
+    """
+    The name of an element without its namespace, e.g. "OE" for
+    "{http://schemas.microsoft.com/office/onenote/2013/onenote}OE".
+    """
+    return tag.rsplit('}', 1)[-1]
+
+class RichTextParser(HTMLParser):
+    """
+    Turns the rich text of a OneNote text run, HTML with styled spans and
+    links, into the text of a Tana node, just like 'process_child'.
+    """
+    STYLES = (('font-weight:bold', 'b'), ('background', 'mark'), ('font-style:italic', 'i'),
+              ('line-through', 'strike'), ('underline', 'u'))
+
+    def __init__(self):
+        super().__init__()
+        self.text = []
+        self.closing = []
+        self.link: Optional[List[str]] = None
+        self.href = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'a':
+            self.link = []
+            self.href = attrs.get('href')
+        elif tag == 'br':
+            self.text.append(' ')
+        elif tag == 'span':
+            style = (attrs.get('style') or '').replace(' ', '')
+            names = [name for key, name in self.STYLES if key in style]
+            self.text.append(''.join(f'<{name}>' for name in names))
+            self.closing.append(''.join(f'</{name}>' for name in reversed(names)))
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self.link is not None:
+            self.text.append(f'[{"".join(self.link)}]({self.href})')
+            self.link = None
+        elif tag == 'span' and self.closing:
+            self.text.append(self.closing.pop())
+
+    def handle_data(self, data):
+        (self.text if self.link is None else self.link).append(data)
+
+def rich_text(text: Optional[str]) -> str:
+    if not text:
+        return ''
+    if '<' not in text and '&' not in text:
+        return compress_text(text)
+    parser = RichTextParser()
+    parser.feed(text)
+    parser.close()
+    return compress_text(''.join(parser.text))
+
+def element_text(element: ElementTree.Element) -> str:
+    """
+    The text of all text runs within 'element', e.g. of a table cell.
+    """
+    texts = [rich_text(child.text) for child in element.iter() if local_name(child.tag) == 'T']
+    return ' '.join(text for text in texts if text)
+
+class OutlineElement():
+    """
+    An OE (outline element) being parsed: its text, tags, and the nodes
+    of its content (table, images) and of its nested outline elements.
+    """
+    def __init__(self, element: ElementTree.Element):
+        self.object_id = element.get('objectID')
+        self.quick_style = element.get('quickStyleIndex')
+        self.text = ''
+        self.tags: List[ElementTree.Element] = []
+        self.content: List[TanaIntermediateNode] = []
+        self.children: List[TanaIntermediateNode] = []
+
+class PageXmlConverter():
+    """
+    Converts the XML of a page ('GetPageContent') while it is parsed, with
+    no parse tree beyond the outline element at hand: each outline element
+    (OE) becomes a node, its nested outline elements its children. As with
+    the HTML, the outline elements following a heading become its children.
+    To-do tags become the node's to-do state, other OneNote tags supertags.
+    Tables and titles are converted once their element is complete.
+    """
+    def __init__(self, page_data: OneNotePageData):
+        self.page_data = page_data
+        self.state = PageState(page_data, TanaIntermediateSummary(0, 0, 0, 0, 0, 0), [], [], [supertag_tbl], None)
+        self.quick_styles: Dict[str, str] = {}     # index -> name, e.g. "h1"
+        self.tag_defs: Dict[str, ElementTree.Element] = {}
+        self.tag_supertags: Dict[str, TanaIntermediateSupertag] = {}
+        self.outline: List[OutlineElement] = []     # the enclosing outline elements
+        self.levels: List[List[Tuple[TanaIntermediateNode, bool]]] = []    # nodes of the enclosing OEChildren, is heading
+        self.passive = 0    # within a title, table, or the page settings
+        self.images = 0
+
+    def convert(self) -> PageFragment:
+        parser = ElementTree.XMLPullParser(events=('start', 'end'))
+        xml = self.page_data.xml_string
+        for start in range(0, len(xml), CHUNK_SIZE):
+            parser.feed(xml[start:start + CHUNK_SIZE])
+            self.handle_events(parser)
+        parser.close()
+        self.handle_events(parser)
+        self.page_node()
+        state = self.state
+        supertags = state.supertags + list(self.tag_supertags.values())
+        return PageFragment(self.page_data.pageId, self.page_data.isSubPage, state.nodes, state.summary, state.attributes,
+                            used_supertags(state.nodes, supertags))
+
+    def handle_events(self, parser: ElementTree.XMLPullParser) -> None:
+        for event, element in parser.read_events():
+            name = local_name(element.tag)
+            if event == 'start':
+                if name in PASSIVE:
+                    self.passive += 1
+                elif self.passive:
+                    pass
+                elif name == 'OE':
+                    self.outline.append(OutlineElement(element))
+                elif name == 'OEChildren':
+                    self.levels.append([])
+            else:
+                self.handle_end(name, element)
+
+    def handle_end(self, name: str, element: ElementTree.Element) -> None:
+        if name in PASSIVE:
+            self.passive -= 1
+            if name == 'Title':
+                self.state.title_str = element_text(element)
+                self.page_node()
+            elif name == 'Table' and not self.passive:
+                self.content(self.table_node(element))
+            if not self.passive:
+                element.clear()
+        elif self.passive:
+            pass
+        elif name == 'T':
+            if self.outline:
+                self.outline[-1].text += rich_text(element.text)
+        elif name == 'Tag':
+            if self.outline:
+                self.outline[-1].tags.append(element)
+        elif name == 'Image':
+            self.content(*self.image_nodes(element))
+            element.clear()
+        elif name == 'OE':
+            self.outline_element(self.outline.pop())
+            element.clear()
+        elif name == 'OEChildren':
+            nodes = self.nest(self.levels.pop())
+            if self.outline:
+                self.outline[-1].children += nodes
+            else:
+                self.page_node().children.extend(nodes)
+            element.clear()
+        elif name == 'Outline':
+            element.clear()
+        elif name == 'QuickStyleDef':
+            self.quick_styles[element.get('index')] = element.get('name')
+        elif name == 'TagDef':
+            self.tag_defs[element.get('index')] = element
+        elif name not in KNOWN:
+            diagnostics.unsupported(element)
+
+    def page_node(self) -> TanaIntermediateNode:
+        """
+        The top-level node of the page, created from the title once known.
+        """
+        state = self.state
+        if state.top_level_node is None:
+            created = iso8601(self.page_data.createdAt).replace(tzinfo=timezone.utc).astimezone()
+            state.date_str = created.strftime('%A, %d %B %Y')
+            state.time_str = created.strftime('%H:%M')
+            start_page(state)
+        return state.top_level_node
+
+    def content(self, *nodes: TanaIntermediateNode) -> None:
+        """
+        Nodes of a table or images, within the current outline element or
+        directly below the page (e.g. an image placed on the page).
+        """
+        if self.outline:
+            self.outline[-1].content += nodes
+        else:
+            self.page_node().children.extend(nodes)
+
+    def outline_element(self, oe: OutlineElement) -> None:
+        summary = self.state.summary
+        heading = self.quick_styles.get(oe.quick_style) in HEADINGS
+        nodes = list(oe.content)
+        if oe.text:
+            node = make_node(oe.text, self.page_node().createdAt)
+            summary.leafNodes += 1
+            summary.totalNodes += 1
+            self.tag(node, oe.tags)
+            node.children.extend(oe.children)
+            nodes.insert(0, node)
+        else:
+            # Without text of its own, e.g. an empty line, the nested
+            # outline elements take its place
+            heading = False
+            nodes += oe.children
+        if not nodes:
+            return
+        # Links to the outline element (e.g. a heading) resolve to its node
+        if oe.object_id and (oe.text or oe.content):
+            links.anchor_object(oe.object_id, nodes[0].uid)
+        level = self.levels[-1] if self.levels else None
+        for index, node in enumerate(nodes):
+            if level is None:
+                self.page_node().children.append(node)
+            else:
+                level.append((node, heading and 0 == index))
+
+    def nest(self, level: List[Tuple[TanaIntermediateNode, bool]]) -> List[TanaIntermediateNode]:
+        nodes = []
+        heading = None
+        for node, is_heading in level:
+            if is_heading:
+                heading = node
+                nodes.append(node)
+            elif heading:
+                heading.children.append(node)
+            else:
+                nodes.append(node)
+        return nodes
+
+    def tag(self, node: TanaIntermediateNode, tags: List[ElementTree.Element]) -> None:
+        for tag in tags:
+            tag_def = self.tag_defs.get(tag.get('index'))
+            tag_name = tag_def.get('name') if tag_def is not None else None
+            if tag.get('completed') == 'true':
+                node.todoState = 'done'
+            elif tag_def is not None and (tag_def.get('symbol') == '3' or (tag_name or '').casefold() == 'to do'):
+                node.todoState = 'todo'
+            elif tag_name:
+                if tag_name not in self.tag_supertags:
+                    self.tag_supertags[tag_name] = TanaIntermediateSupertag(str(next(convert.uid)), tag_name)
+                node.supertags = (node.supertags or []) + [self.tag_supertags[tag_name].uid]
+
+    def table_node(self, element: ElementTree.Element) -> TanaIntermediateNode:
+        table = OneNoteTable('')
+        for row in element:
+            if local_name(row.tag) == 'Row':
+                table.add_row([element_text(cell) for cell in row if local_name(cell.tag) == 'Cell'])
+        table_node, table_attributes = table_to_node(table, self.page_node().createdAt, supertag_tbl, self.state.summary)
+        self.state.summary.leafNodes += 1
+        self.state.summary.totalNodes += 1
+        self.state.add_attributes(table_attributes)
+        return table_node
+
+    def image_nodes(self, element: ElementTree.Element) -> List[TanaIntermediateNode]:
+        # Images are referenced by the callback ID they were fetched with
+        callback = next((child.get('callbackID') for child in element if local_name(child.tag) == 'CallbackID'), None)
+        self.images += 1
+        name = f'image{self.images:03d}.{element.get("format") or "png"}'
+        image = {'src': name, 'alt': element.get('alt')}
+        _, nodes, _ = process_image_and_convert_to_node(image, {name: self.page_data.images.get(callback, '')},
+                                                        self.page_node().createdAt, supertag_tbl, self.state.summary)
+        return nodes
+
+def convert_page_xml(page_data: OneNotePageData) -> PageFragment:
+    """
+    Convert a page from its XML ('xml_string'), see 'PageXmlConverter'.
+    """
+    return PageXmlConverter(page_data).convert()
@@ -0,0 +1,141 @@
+# Background loading of the OneNote hierarchy for interactive sessions
+
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future
+from itertools import count
+from typing import Any, Callable, Dict, Tuple
+from xml.etree import ElementTree
+
+from onenote.onenote import HierarchyScope, PublishFormat
+from utilities.logs import logger
+from utilities.utils import safe_str
+
+class PrefetchingApp():
+    """
+    Wraps the OneNote app for interactive sessions: while the user is
+    typing, a background thread with its own connection to OneNote (made
+    by 'app_factory') loads the next level of the hierarchy: the sections
+    of the notebooks listed, the pages of the sections listed, and
+    speculatively publishes up to 'max_publish' pages of the sections
+    listed. 'GetHierarchy' and 'Publish' take the results if available (or
+    being loaded), everything else goes to the wrapped app directly.
+    """
+    HIERARCHY = 0   # priorities, hierarchy levels before publishing
+    PUBLISH = 1
+
+    def __init__(self, onenote_app: Any, app_factory: Callable[[], Any], max_publish: int = 32):
+        self.onenote_app = onenote_app
+        self.app_factory = app_factory
+        self.max_publish = max_publish
+        self.published = 0
+        self.hierarchies: Dict[Tuple[str, int], Future] = {}
+        self.publishes: Dict[str, Future] = {}
+        self.spool = tempfile.mkdtemp(prefix='onenote-to-tana-')
+        self.tasks = queue.PriorityQueue()
+        self.sequence = count()
+        self.thread = threading.Thread(target=self.work, name='prefetch', daemon=True)
+        self.thread.start()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.onenote_app, name)
+
+    def work(self) -> None:
+        try:
+            import pythoncom
+            pythoncom.CoInitialize()
+        except ImportError:
+            pythoncom = None
+        try:
+            app = self.app_factory()
+            while True:
+                _, _, future, function = self.tasks.get()
+                if future is None:
+                    break
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(function(app))
+                except Exception as e:
+                    future.set_exception(e)
+        except Exception as e:
+            logger.debug('Prefetching stopped: %r', e)
+        finally:
+            if pythoncom:
+                pythoncom.CoUninitialize()
+
+    def submit(self, priority: int, function: Callable[[Any], Any]) -> Future:
+        future = Future()
+        self.tasks.put((priority, next(self.sequence), future, function))
+        return future
+
+    def prefetch_hierarchy(self, start: str, scope: HierarchyScope) -> None:
+        key = (start, int(scope))
+        if key not in self.hierarchies:
+            self.hierarchies[key] = self.submit(self.HIERARCHY, lambda app: app.GetHierarchy(start, int(scope), ""))
+
+    def prefetch_page(self, page_id: str) -> None:
+        if page_id in self.publishes or self.published >= self.max_publish:
+            return
+        self.published += 1
+        file_path = os.path.join(self.spool, f'{safe_str(page_id)}.mht')
+        def publish(app):
+            app.Publish(page_id, file_path, int(PublishFormat.pfMHTML), "")
+            return file_path
+        self.publishes[page_id] = self.submit(self.PUBLISH, publish)
+
+    def prefetch_below(self, start: str, scope: int, hierarchy: str) -> None:
+        # The next level below the elements just listed
+        root = ElementTree.fromstring(hierarchy)
+        if scope == HierarchyScope.hsNotebooks:
+            for notebook in root:
+                self.prefetch_hierarchy(notebook.get('ID'), HierarchyScope.hsChildren)
+        elif scope == HierarchyScope.hsChildren and root.tag.endswith('Notebook'):
+            for section in root.iter(root.tag.replace('Notebook', 'Section')):
+                self.prefetch_hierarchy(section.get('ID'), HierarchyScope.hsPages)
+        elif scope == HierarchyScope.hsPages and root.tag.endswith('Section'):
+            for page in root:
+                self.prefetch_page(page.get('ID'))
+
+    def GetHierarchy(self, start: str, scope: int, xml: str = "") -> str:
+        future = self.hierarchies.get((start, int(scope)))
+        hierarchy = None
+        if future and not future.cancel():
+            try:
+                hierarchy = future.result()
+            except Exception as e:
+                logger.debug('Prefetching "%s" failed: %r', start, e)
+        if hierarchy is None:
+            hierarchy = self.onenote_app.GetHierarchy(start, scope, xml)
+            self.hierarchies[(start, int(scope))] = completed(hierarchy)
+        self.prefetch_below(start, int(scope), hierarchy)
+        return hierarchy
+
+    def Publish(self, page_id: str, file_path: str, format: int, xml: str = "") -> None:
+        future = self.publishes.pop(page_id, None)
+        if future and int(format) == PublishFormat.pfMHTML and not future.cancel():
+            try:
+                # The spool may be on another device than 'file_path'
+                shutil.move(future.result(), file_path)
+                return
+            except Exception as e:
+                logger.debug('Prefetching page "%s" failed: %r', page_id, e)
+        self.onenote_app.Publish(page_id, file_path, format, xml)
+
+    def close(self) -> None:
+        """
+        Stop the background thread and remove the pages published in vain.
+        """
+        for future in list(self.hierarchies.values()) + list(self.publishes.values()):
+            future.cancel()
+        self.tasks.put((-1, -1, None, None))
+        self.thread.join(timeout=10)
+        shutil.rmtree(self.spool, ignore_errors=True)
+
+def completed(result: Any) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
@@ -0,0 +1,106 @@
+# Scheduling of the page conversions over several worker processes
+
+import heapq
+import json
+import os
+import random
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+from xml.etree import ElementTree
+
+class CostModel():
+    """
+    Estimates the seconds a page takes to convert from cheap signals: the
+    time observed for the page by earlier runs (kept in the stats file at
+    'path'), else its MHT size once published times the seconds per byte
+    observed overall, else the mean time per page observed overall.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.stats: Dict[str, List[float]] = {}     # page ID -> [seconds, MHT bytes]
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as stats_file:
+                self.stats = json.load(stats_file)
+        self.update_rates()
+
+    def update_rates(self) -> None:
+        seconds = sum(entry[0] for entry in self.stats.values())
+        size = sum(entry[1] for entry in self.stats.values())
+        self.mean_seconds = seconds / len(self.stats) if self.stats else 1.0
+        self.seconds_per_byte = seconds / size if size else None
+
+    def estimate(self, page: ElementTree.Element, mht_bytes: Optional[int] = None) -> float:
+        entry = self.stats.get(page.get('ID'))
+        if entry:
+            return entry[0]
+        if mht_bytes and self.seconds_per_byte:
+            return mht_bytes * self.seconds_per_byte
+        return self.mean_seconds
+
+    def mht_bytes(self, page_id: str) -> Optional[int]:
+        """
+        The MHT size of the page observed by earlier runs, if any.
+        """
+        entry = self.stats.get(page_id)
+        return int(entry[1]) if entry else None
+
+    def observe(self, page_id: str, seconds: float, mht_bytes: int) -> None:
+        self.stats[page_id] = [round(seconds, 4), mht_bytes]
+
+    def save(self) -> None:
+        if self.path:
+            with open(f'{self.path}.part', 'w', encoding='utf-8') as stats_file:
+                json.dump(self.stats, stats_file)
+            os.replace(f'{self.path}.part', self.path)
+
+def lpt_order(keys: Sequence, cost: Callable[..., float]) -> List:
+    """
+    Longest processing time first: the keys by decreasing cost, keys of
+    equal cost in their original order.
+    """
+    return sorted(keys, key=cost, reverse=True)
+
+def makespan(costs: Sequence[float], workers: int) -> float:
+    """
+    The time 'workers' take for jobs of the given costs, each job going
+    to the first worker free, in the order given.
+    """
+    finish = [0.0] * workers
+    for cost in costs:
+        heapq.heapreplace(finish, finish[0] + cost)
+    return max(finish)
+
+def synthetic_corpora(pages: int, seed: int = 1) -> Dict[str, List[float]]:
+    """
+    Page costs (seconds) of skewed synthetic corpora, in hierarchy order.
+    """
+    rng = random.Random(seed)
+    return {
+        'uniform': [rng.uniform(0.05, 0.15) for _ in range(pages)],
+        'pareto': [0.05 * rng.paretovariate(1.2) for _ in range(pages)],
+        'giant last': [rng.uniform(0.05, 0.15) for _ in range(pages - 1)] + [0.1 * pages / 8],
+        'heavy section': [rng.uniform(2.0, 4.0) if pages * 3 // 4 <= i else rng.uniform(0.05, 0.15) for i in range(pages)],
+    }
+
+def benchmark(pages: int = 2000, workers: int = 8, seed: int = 1) -> None:
+    """
+    Compare the wall time of converting skewed synthetic corpora with
+    'workers' processes (simulated) in hierarchy order, in LPT order by
+    estimates off by up to 50% (as from a stats file), and in LPT order by
+    the exact costs, against the lower bound.
+    """
+    rng = random.Random(seed)
+    print(f'{pages} pages, {workers} workers, simulated seconds:')
+    print(f'{"corpus":<15} {"hierarchy":>10} {"LPT est.":>10} {"LPT":>10} {"bound":>10} {"gain":>7}')
+    for name, costs in synthetic_corpora(pages, seed).items():
+        in_order = makespan(costs, workers)
+        estimates = [cost * rng.uniform(0.5, 1.5) for cost in costs]
+        estimated = makespan([costs[i] for i in lpt_order(range(len(costs)), estimates.__getitem__)], workers)
+        started = time.perf_counter()
+        lpt = makespan([costs[i] for i in lpt_order(range(len(costs)), costs.__getitem__)], workers)
+        elapsed = time.perf_counter() - started
+        bound = max(sum(costs) / workers, max(costs))
+        print(f'{name:<15} {in_order:>10.1f} {estimated:>10.1f} {lpt:>10.1f} {bound:>10.1f} {in_order / estimated:>6.2f}x  (scheduled in {elapsed * 1000:.1f} ms)')
+
+if __name__ == '__main__':
+    benchmark()
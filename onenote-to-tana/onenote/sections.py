@@ -1,39 +1,45 @@
 # OneNote Sections function
 
-import win32com.client as win32
-
-from prompt_toolkit import prompt
-from prompt_toolkit.completion import WordCompleter
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from xml.etree import ElementTree
 
+from onenote.catalogue import PageCatalogue, unique_labels
+from onenote.onenote import ConvertOptions, HierarchyScope
 from onenote.pages import get_pages, ui_handle_pages, handle_pages_all
-from utilities.utils import check_substring_in_keys
+from utilities.completion import prompt_name
+from utilities.utils import selector_matcher
+
+def notebook_sections(onenote_app: Any, notebook: ElementTree.Element) -> List[ElementTree.Element]:
+    """
+    Get all sections in the selected notebook.
+    """
+    children = onenote_app.GetHierarchy(notebook.attrib['ID'], int(HierarchyScope.hsChildren), "")
+    return [section for section in ElementTree.fromstring(children)
+            if section.get('name') is not None and not section.tag.endswith('SectionGroup')]
 
 def get_sections_xml(onenote_app: Any, notebook: ElementTree.Element) -> Dict[str, ElementTree.Element]:
     """
     Get the names of all sections in the selected notebook.
     """
-    children = onenote_app.GetHierarchy(notebook.attrib['ID'], win32.constants.hsChildren, "")
-    return {section.get('name'): section for section in ElementTree.fromstring(children) 
-            if section.get('name') is not None and not section.tag.endswith('SectionGroup')}
+    return {section.get('name'): section for section in notebook_sections(onenote_app, notebook)}
 
 def get_sections(onenote_app: Any, notebooks: Dict[str, ElementTree.Element]) -> Dict[str, ElementTree.Element]:
-    results = {}
+    """
+    Get all sections in the selected notebooks, keyed by their name.
+    Sections sharing a name are kept apart, their keys are extended with
+    the notebook (see 'unique_labels').
+    """
+    sections = []
     for notebook in notebooks.values():
-        sections = get_sections_xml(onenote_app, notebook)
-        results.update(sections)
-    return results
+        sections += [(section.get('name'), notebook.get('name'), section) for section in notebook_sections(onenote_app, notebook)]
+    return unique_labels(sections)
 
 def select_section(sections: Dict[str, ElementTree.Element], section_name: str) -> Tuple[str, bool]:
-    sections_str = ', '.join(sections.keys())
-    print(f'Selectable sections: {sections_str}')
     all_sections = 'All' not in sections
     if all_sections:
         sections["All"] = None
     prompt_str = "To select a section type in its name or 'All' to select all: " if all_sections else "Type in the name of one section to select: "
-    section_completer = WordCompleter(sections.keys(), ignore_case=True)
-    selected_section = prompt(prompt_str, completer=section_completer)
+    selected_section = prompt_name(prompt_str, sections.keys(), 'Selectable sections')
     if all_sections and selected_section == "All":
         selected_section = None
     else:
@@ -41,19 +47,16 @@ def select_section(sections: Dict[str, ElementTree.Element], section_name: str)
     sections.pop("All", None)
     return selected_section, all_sections
 
-def ui_handle_sections(onenote_app: Any, sections: Dict[str, ElementTree.Element], outfile: str):
+def ui_handle_sections(onenote_app: Any, sections: Dict[str, ElementTree.Element], options: ConvertOptions):
     # print(f'Available section: {", ".join(sections.keys())}')
     selected_section, all_sections = select_section(sections, "notebooook")
     if not all_sections:
         sections = {selected_section: sections[selected_section]}
-    pages = {}
-    for section in sections.values():
-        section_pages = get_pages(onenote_app, section)
-        pages.update(section_pages)
+    pages = get_pages(onenote_app, sections.values())
     if all_sections:
-        handle_pages_all(onenote_app, pages, outfile)
+        handle_pages_all(onenote_app, pages, options)
     else:
-        ui_handle_pages(onenote_app, pages, outfile)
+        ui_handle_pages(onenote_app, pages, options)
 
 def ui_select_section(notebook: str, sections: Dict[str, ElementTree.Element]) -> Tuple[str, bool]:
     """
@@ -68,8 +71,7 @@ def ui_select_section(notebook: str, sections: Dict[str, ElementTree.Element]) -
         prompt_str = "To select a section type in its name or 'All' to select all: "
     else:
         prompt_str = "Type in the name of one section to select: "
-    section_completer = WordCompleter(sections.keys(), ignore_case=True)
-    selected_section = prompt(prompt_str, completer=section_completer)
+    selected_section = prompt_name(prompt_str, sections.keys())
     if all_sections and selected_section == "All":
         selected_section = None
     else:
@@ -85,16 +87,18 @@ def handle_sections(onenote_app, notebook, notebook_name: str):
         sections = {selected_section: sections[selected_section]}
     return sections, all_sections
 
-def find_sections(onenote_app: Any, notebooks: Dict[str, ElementTree.Element], sections_to_find: str) -> Tuple[Dict[str, ElementTree.Element], Dict[str, ElementTree.Element]]:
-    results_pages = {}
-    results_sections = {}
+def find_sections(onenote_app: Any, notebooks: Dict[str, ElementTree.Element], sections_to_find: str, catalogue: Optional[PageCatalogue] = None) -> Tuple[Dict[str, ElementTree.Element], Dict[str, ElementTree.Element]]:
+    """
+    Find the sections of the 'notebooks' whose name matches 'sections_to_find'
+    and their pages, located in the 'catalogue'. Pages (and sections)
+    sharing a name are kept apart, see 'unique_labels'.
+    """
+    if catalogue is None:
+        catalogue = PageCatalogue.from_hierarchy(onenote_app)
+    matches = selector_matcher(sections_to_find)
+    sections = []
     for notebook in notebooks.values():
-        sections = get_sections_xml(onenote_app, notebook)
-        matches = check_substring_in_keys(sections, sections_to_find)
-        if not matches:
-            continue
-        results_sections.update(matches)
-        for section in matches.values():
-            pages = get_pages(onenote_app, section)
-            results_pages.update(pages)
-    return results_pages, results_sections
+        sections += [(section.get('name'), notebook.get('name'), section) for section in notebook_sections(onenote_app, notebook)
+                     if matches(section.get('name'))]
+    pages = catalogue.labelled(catalogue.within(section.get('ID') for _, _, section in sections))
+    return pages, unique_labels(sections)
@@ -0,0 +1,152 @@
+# Converter session, the API for embedding the conversion
+
+import copy
+import tempfile
+import time
+from typing import Any, Iterable, Iterator, List, Optional
+
+from onenote.catalogue import PageCatalogue
+from onenote.convert import convert_page, select_pages, supertag_tbl, write_output
+from onenote.fragments import PageFragment, assemble_fragments
+from onenote.onenote import ConvertOptions
+from onenote.pages import process_page
+from tanatypes.tif import TanaIntermediateFile, TanaIntermediateNode, TanaIntermediateSummary
+from utilities.images import ImageStore
+from utilities.logs import logger
+from utilities.storage import TempStorage
+
+class PageResult():
+    """
+    The outcome of converting one page: the fragment holding its node
+    subtree and summary counts (None if the page failed or was skipped as
+    oversized, see 'error'), its MHT size, and the seconds spent on each step.
+    """
+    def __init__(self, page_id: str, name: str, path: str, fragment: Optional[PageFragment] = None, mht_bytes: int = 0,
+                 publish_seconds: float = 0.0, extract_seconds: float = 0.0, convert_seconds: float = 0.0, error: Optional[Exception] = None):
+        self.page_id = page_id
+        self.name = name
+        self.path = path              # "Notebook/Section Group/Section"
+        self.fragment = fragment
+        self.mht_bytes = mht_bytes
+        self.publish_seconds = publish_seconds
+        self.extract_seconds = extract_seconds
+        self.convert_seconds = convert_seconds
+        self.error = error
+
+    @property
+    def nodes(self) -> List[TanaIntermediateNode]:
+        return self.fragment.nodes if self.fragment else []
+
+    @property
+    def summary(self) -> Optional[TanaIntermediateSummary]:
+        return self.fragment.summary if self.fragment else None
+
+class ConverterSession():
+    """
+    Converts pages on behalf of a long-lived process. The session owns the
+    OneNote app (created unless given), the page catalogue, the image store,
+    and the temporary storage, and keeps them across calls to 'convert',
+    which yields a PageResult per page as soon as it is converted. Nothing
+    is printed and the process is never exited; a page that fails is
+    returned with its error. Use as a context manager, or call 'close'.
+
+        with ConverterSession(options=ConvertOptions(image_dir='images')) as session:
+            for result in session.convert(session.find(['Meeting*'])):
+                ...
+    """
+    def __init__(self, onenote_app: Any = None, options: Optional[ConvertOptions] = None):
+        if onenote_app is None:
+            import win32com.client as win32
+            onenote_app = win32.gencache.EnsureDispatch("OneNote.Application.12")
+        self.onenote_app = onenote_app
+        self.options = options or ConvertOptions()
+        self.catalogue: Optional[PageCatalogue] = None
+        self.image_store = ImageStore(self.options.image_dir, self.options.image_url) if self.options.image_dir else None
+        self.temp_dir = tempfile.TemporaryDirectory(dir=self.options.temp_dir)
+        self.storage = TempStorage(self.temp_dir.name, self.options.temp_quota_mb * 1024 * 1024 if self.options.temp_quota_mb else None,
+                                   self.options.ram_dir, self.options.ram_quota_mb * 1024 * 1024)
+
+    def __enter__(self) -> 'ConverterSession':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def pages(self) -> PageCatalogue:
+        """
+        The catalogue of all pages, loaded on first use, see 'refresh'.
+        """
+        if self.catalogue is None:
+            self.refresh()
+        return self.catalogue
+
+    def refresh(self) -> None:
+        """
+        Reload the catalogue, e.g. after pages were added in OneNote.
+        """
+        self.catalogue = PageCatalogue.from_hierarchy(self.onenote_app)
+
+    def find(self, selectors: Optional[List[str]] = None) -> List[str]:
+        """
+        The IDs of the pages whose name matches any of the 'selectors'
+        (all pages if None), narrowed by the filters and shard of the options.
+        """
+        catalogue = self.pages()
+        page_ids = catalogue.search(selectors) if selectors is not None else list(catalogue.ids)
+        selected = select_pages({page_id: catalogue[page_id].page for page_id in page_ids}, self.options, catalogue)
+        return list(selected)
+
+    def convert(self, page_ids: Iterable[str]) -> Iterator[PageResult]:
+        """
+        Publish and convert the pages one at a time, yielding the result of
+        each. Pages unknown to the catalogue are refreshed once, then failed.
+        """
+        catalogue = self.pages()
+        max_memory = self.options.max_page_mb * 1024 * 1024 if self.options.max_page_mb else None
+        for page_id in page_ids:
+            if page_id not in catalogue:
+                self.refresh()
+                catalogue = self.catalogue
+            if page_id not in catalogue:
+                yield PageResult(page_id, None, None, error=KeyError(page_id))
+                continue
+            entry = catalogue[page_id]
+            result = PageResult(page_id, entry.name, entry.path)
+            try:
+                page_data = process_page(self.onenote_app, self.temp_dir.name, entry.page, self.image_store, catalogue, self.storage,
+                                         self.options.engine)
+                result.mht_bytes = page_data.mhtSize
+                result.publish_seconds = page_data.publishSeconds
+                result.extract_seconds = page_data.extractSeconds
+                started = time.perf_counter()
+                result.fragment = convert_page(page_data, max_memory, self.options.oversized)
+                result.convert_seconds = time.perf_counter() - started
+            except Exception as e:
+                logger.error('ERROR: Page "%s" failed to convert: %r', entry.name, e)
+                result.error = e
+            if result.fragment:
+                result.fragment.order = entry.position
+                result.fragment.parent_id = entry.parent_id
+            yield result
+
+    def to_tif(self, results: Iterable[PageResult]) -> TanaIntermediateFile:
+        """
+        Assemble the converted pages into one TIF, subpages attached to
+        their superpages and the links between the pages resolved.
+        """
+        return assemble_fragments((result.fragment for result in results if result.fragment), [supertag_tbl])
+
+    def write(self, results: Iterable[PageResult], outfile: Optional[str] = None) -> bool:
+        """
+        Assemble the converted pages and write them as TIF to 'outfile',
+        by default the output file of the options (or stdout).
+        """
+        options = self.options
+        if outfile:
+            options = copy.copy(self.options)
+            options.outfile = outfile
+        return write_output(self.to_tif(results), options)
+
+    def close(self) -> None:
+        self.storage.cleanup()
+        self.temp_dir.cleanup()
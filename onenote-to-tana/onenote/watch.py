@@ -0,0 +1,155 @@
+# Watch OneNote for changed pages
+
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+from xml.etree import ElementTree
+
+from onenote.catalogue import PageCatalogue, PageEntry
+from onenote.onenote import ConvertOptions, HierarchyScope
+from utilities.logs import logger
+
+class HierarchyWatcher():
+    """
+    Keeps the OneNote hierarchy in memory and finds the pages changed since
+    the last poll. Only the notebooks list is fetched on every poll; the
+    sections of a notebook are fetched only if its 'lastModifiedTime'
+    changed, and the pages of a section only if the section's changed.
+    Works with any object providing 'GetHierarchy' like the OneNote app.
+    """
+    def __init__(self, onenote_app: Any):
+        self.onenote_app = onenote_app
+        self.notebooks: Dict[str, str] = {}     # ID -> lastModifiedTime
+        self.sections: Dict[str, str] = {}
+        self.pages: Dict[str, str] = {}
+        self.section_pages: Dict[str, Set[str]] = {}    # section ID -> IDs of its pages
+        self.notebook_sections: Dict[str, Set[str]] = {}    # notebook ID -> IDs of its sections
+        self.changed: List[str] = []    # IDs of the pages changed since the last poll
+        self.deleted: List[str] = []    # IDs of the pages deleted since the last poll
+        self.polls = 0
+
+    def hierarchy(self, start: str, scope: HierarchyScope) -> ElementTree.Element:
+        return ElementTree.fromstring(self.onenote_app.GetHierarchy(start, int(scope), ""))
+
+    def poll(self) -> PageCatalogue:
+        """
+        Return the pages created or modified since the last poll (none on
+        the first poll, which only takes stock). Pages of the changed
+        sections are all included in the returned catalogue for their
+        superpages to be known, use 'changed' for the changed pages and
+        'deleted' for the pages gone from the changed sections, or with
+        the sections gone from the changed notebooks.
+        """
+        first = 0 == self.polls
+        self.polls += 1
+        catalogue = PageCatalogue()
+        self.changed = []
+        self.deleted = []
+        for notebook in self.hierarchy("", HierarchyScope.hsNotebooks):
+            notebook_id = notebook.get('ID')
+            modified = notebook.get('lastModifiedTime')
+            if modified and self.notebooks.get(notebook_id) == modified:
+                continue
+            self.notebooks[notebook_id] = modified
+            section_ids = set()
+            self.poll_sections(notebook, self.hierarchy(notebook_id, HierarchyScope.hsSections), [], catalogue, first, section_ids)
+            for section_id in self.notebook_sections.get(notebook_id, set()) - section_ids:
+                self.sections.pop(section_id, None)
+                for page_id in self.section_pages.pop(section_id, set()):
+                    self.pages.pop(page_id, None)
+                    self.deleted.append(page_id)
+            self.notebook_sections[notebook_id] = section_ids
+        return catalogue
+
+    def poll_sections(self, notebook: ElementTree.Element, parent: ElementTree.Element, section_groups: List[str], catalogue: PageCatalogue, first: bool,
+                      section_ids: Set[str]) -> None:
+        for child in parent:
+            if child.get('isRecycleBin') == 'true' or child.get('isInRecycleBin') == 'true':
+                continue
+            if child.tag.endswith('SectionGroup'):
+                self.poll_sections(notebook, child, section_groups + [child.get('name')], catalogue, first, section_ids)
+            elif child.tag.endswith('Section'):
+                section_id = child.get('ID')
+                section_ids.add(section_id)
+                modified = child.get('lastModifiedTime')
+                if modified and self.sections.get(section_id) == modified:
+                    continue
+                self.sections[section_id] = modified
+                self.poll_pages(notebook, self.hierarchy(section_id, HierarchyScope.hsPages), section_groups, catalogue, first)
+
+    def poll_pages(self, notebook: ElementTree.Element, section: ElementTree.Element, section_groups: List[str], catalogue: PageCatalogue, first: bool) -> None:
+        superpage_id = None
+        page_ids = set()
+        for page in section:
+            page_id = page.get('ID')
+            if page.get('name') is None or page_id is None:
+                continue
+            page_ids.add(page_id)
+            if page.get('isSubPage') == 'true':
+                entry = PageEntry(page, notebook, section, section_groups, superpage_id)
+            else:
+                superpage_id = page_id
+                entry = PageEntry(page, notebook, section, section_groups)
+            catalogue.add(entry)
+            modified = page.get('lastModifiedTime')
+            if self.pages.get(page_id) != modified:
+                self.pages[page_id] = modified
+                if not first:
+                    self.changed.append(page_id)
+        for page_id in self.section_pages.get(section.get('ID'), set()) - page_ids:
+            self.pages.pop(page_id, None)
+            self.deleted.append(page_id)
+        self.section_pages[section.get('ID')] = page_ids
+
+def select_changes(watcher: HierarchyWatcher, catalogue: PageCatalogue, options: Optional[ConvertOptions] = None,
+                   scope: Optional[Set[str]] = None) -> Dict[str, ElementTree.Element]:
+    """
+    The changed pages to convert: those within 'scope' (IDs of notebooks,
+    sections, or pages, e.g. as narrowed with -n/-s/-p) that pass the
+    filters of 'options', see 'select_pages'. The superpage of a changed
+    subpage comes along, for the subpage to be attached to it.
+    """
+    from onenote.convert import select_pages
+    pages = {}
+    for page_id in watcher.changed:
+        entry = catalogue[page_id]
+        if scope is None or scope & {entry.notebook.get('ID'), entry.section.get('ID'), page_id}:
+            pages[page_id] = entry.page
+    if options:
+        pages = select_pages(pages, options, catalogue)
+    selected = {}
+    for page_id, page in pages.items():
+        parent_id = catalogue[page_id].parent_id
+        if parent_id and parent_id not in pages and parent_id in catalogue:
+            selected[parent_id] = catalogue[parent_id].page
+        selected[page_id] = page
+    return selected
+
+def watch(onenote_app: Any, outbox: str, convert: Callable[[Dict[str, ElementTree.Element], PageCatalogue, str], None], interval: float = 60.0, polls: Optional[int] = None,
+          options: Optional[ConvertOptions] = None, scope: Optional[Set[str]] = None) -> None:
+    """
+    Poll OneNote every 'interval' seconds and convert the changed pages
+    (see 'select_changes') into a small TIF in the 'outbox' directory, by
+    calling 'convert' with the pages, their catalogue, and the file to
+    write. The TIF is written aside and moved into the outbox when complete.
+    """
+    watcher = HierarchyWatcher(onenote_app)
+    work_dir = os.path.join(outbox, '.work')
+    os.makedirs(work_dir, exist_ok=True)
+    while polls is None or watcher.polls < polls:
+        started = time.monotonic()
+        catalogue = watcher.poll()
+        pages = select_changes(watcher, catalogue, options, scope) if watcher.changed else {}
+        if pages:
+            file_name = f'{datetime.now().strftime("%Y%m%d-%H%M%S")}-{len(pages)}-pages.json'
+            convert(pages, catalogue, os.path.join(work_dir, file_name))
+            if os.path.exists(os.path.join(work_dir, file_name)):
+                os.replace(os.path.join(work_dir, file_name), os.path.join(outbox, file_name))
+                logger.info('%d changed pages written to "%s".', len(pages), file_name)
+        elif 1 == watcher.polls:
+            logger.info('Watching %d pages for changes.', len(watcher.pages))
+        if watcher.deleted:
+            logger.info('%d pages deleted, their nodes are left as they are in Tana.', len(watcher.deleted))
+        if polls is None or watcher.polls < polls:
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
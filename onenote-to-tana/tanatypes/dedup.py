@@ -0,0 +1,131 @@
+# Deduplication of repeated subtrees in a Tana Intermediate File
+
+import hashlib
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from tanatypes.tif import *     # TIF - Tana Intermediate Format
+
+def ref_node(uid: str, target: TanaIntermediateNode) -> TanaIntermediateNode:
+    """
+    Create a node that refers to the 'target' node.
+    """
+    return TanaIntermediateNode(
+        uid=uid,
+        name=f'[[{target.uid}]]',
+        description='',
+        children=[],
+        refs=[target.uid],
+        createdAt=target.createdAt,
+        editedAt=int(time.time() * 1000.0),
+        type=NodeType.NODE
+    )
+
+class Deduplicator():
+    """
+    Emits repeated subtrees (e.g. template headers or checklists) only once:
+    later occurrences are replaced by a node referring to the first one.
+    Subtrees with less than 'min_chars' characters of text are left alone,
+    as are the top-level (page) nodes and fields.
+    Nodes whose name matches one of the 'drop' regular expressions are
+    removed, their children take their place. The summary is left to be
+    recomputed, e.g. by the 'TifValidator'.
+    """
+    def __init__(self, uids, min_chars: int = 32, drop: Optional[List[str]] = None):
+        self.uids = uids    # generator of new uids
+        self.min_chars = min_chars
+        self.drop = [re.compile(pattern) for pattern in drop or []]
+        self.replaced = 0
+        self.dropped = 0
+        self.remapped: Dict[str, str] = {}
+
+    def run(self, tif: TanaIntermediateFile) -> None:
+        if self.drop:
+            self.drop_boilerplate(tif.nodes)
+        keys, sizes = self.subtree_keys(tif.nodes)
+        seen: Dict[str, TanaIntermediateNode] = {}
+        # In document order, so that the first occurrence is kept: the
+        # list holding each node and its index in it, None for top-level
+        stack: List[Tuple[Optional[List[TanaIntermediateNode]], int, TanaIntermediateNode]] = [(None, 0, node) for node in reversed(tif.nodes)]
+        while stack:
+            siblings, index, node = stack.pop()
+            if siblings is not None and node.type != NodeType.FIELD and sizes[id(node)] >= self.min_chars:
+                key = keys[id(node)]
+                if key in seen:
+                    original = seen[key]
+                    siblings[index] = ref_node(str(next(self.uids)), original)
+                    self.replaced += 1
+                    self.remove(node, original)
+                    continue
+                seen[key] = node
+            children = node.children or []
+            stack.extend((children, index, child) for index, child in reversed(list(enumerate(children))))
+        self.fix_refs(tif.nodes)
+
+    def drop_boilerplate(self, nodes: List[TanaIntermediateNode]) -> None:
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            if not node.children:
+                continue
+            children = []
+            pending = list(reversed(node.children))
+            while pending:
+                child = pending.pop()
+                if any(pattern.search(child.name or '') for pattern in self.drop):
+                    # lift the children of the dropped node
+                    pending.extend(reversed(child.children or []))
+                    self.dropped += 1
+                else:
+                    children.append(child)
+            node.children = children
+            stack.extend(children)
+
+    @staticmethod
+    def subtree_keys(nodes: List[TanaIntermediateNode]):
+        """
+        Hash every subtree bottom-up, without recursion. Returns the hashes
+        and the amount of text of every subtree, keyed by the node's id().
+        """
+        keys = {}
+        sizes = {}
+        stack = [(node, False) for node in nodes]
+        while stack:
+            node, visited = stack.pop()
+            children = node.children or []
+            if not visited:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children)
+                continue
+            content = repr((
+                node.type.value if isinstance(node.type, NodeType) else node.type,
+                node.name, node.description, node.mediaUrl, node.codeLanguage,
+                node.supertags, node.todoState,
+                [keys[id(child)] for child in children],
+            ))
+            keys[id(node)] = hashlib.sha1(content.encode('utf-8')).hexdigest()
+            sizes[id(node)] = len(node.name or '') + sum(sizes[id(child)] for child in children)
+        return keys, sizes
+
+    def remove(self, duplicate: TanaIntermediateNode, original: TanaIntermediateNode) -> None:
+        # Both subtrees are identical, remember which uid replaces which
+        stack = [(duplicate, original)]
+        while stack:
+            node, kept = stack.pop()
+            self.remapped[node.uid] = kept.uid
+            stack.extend(zip(node.children or [], kept.children or []))
+
+    def fix_refs(self, nodes: List[TanaIntermediateNode]) -> None:
+        if not self.remapped:
+            return
+        remapped = self.remapped
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            if node.refs and any(ref in remapped for ref in node.refs):
+                for ref in node.refs:
+                    if ref in remapped:
+                        node.name = node.name.replace(f'[[{ref}]]', f'[[{remapped[ref]}]]')
+                node.refs = [remapped.get(ref, ref) for ref in node.refs]
+            stack.extend(node.children or [])
@@ -0,0 +1,91 @@
+# Writing Tana Intermediate Files
+
+import gzip
+import io
+import json
+import lzma
+import sys
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, TextIO
+
+from tanatypes.tif import TanaIntermediateFile
+
+FORMATS = ('pretty', 'compact', 'ndjson')
+COMPRESSIONS = ('gzip', 'xz')
+
+# Bytes collected before they are handed on to the file (or compressor)
+BUFFER_SIZE = 1 << 20
+
+def compression_for(outfile: Optional[str]) -> Optional[str]:
+    """
+    Guess the compression from the file name extension.
+    """
+    if outfile:
+        if outfile.endswith('.gz'):
+            return 'gzip'
+        if outfile.endswith('.xz'):
+            return 'xz'
+    return None
+
+@contextmanager
+def open_output(outfile: Optional[str], compression: Optional[str] = None) -> Iterator[TextIO]:
+    """
+    Open 'outfile' (or stdout) for writing text through a large buffer,
+    optionally through a streaming gzip or xz compressor.
+    """
+    binary = open(outfile, 'wb') if outfile else sys.stdout.buffer
+    if compression == 'gzip':
+        stream = gzip.GzipFile(fileobj=binary, mode='wb')
+    elif compression == 'xz':
+        stream = lzma.LZMAFile(binary, mode='wb')
+    else:
+        stream = binary
+    text = io.TextIOWrapper(stream, encoding='utf-8')
+    try:
+        yield text
+    finally:
+        text.flush()
+        text.detach()
+        if stream is not binary:
+            stream.close()
+        if outfile:
+            binary.close()
+        else:
+            binary.flush()
+
+def write_json(obj: Any, stream: TextIO, indent: Optional[int] = None, separators=None) -> None:
+    """
+    Like 'json.dump', but hands the encoded chunks on in large batches.
+    """
+    chunks = []
+    size = 0
+    for chunk in json.JSONEncoder(indent=indent, separators=separators).iterencode(obj):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= BUFFER_SIZE:
+            stream.write(''.join(chunks))
+            chunks = []
+            size = 0
+    stream.write(''.join(chunks))
+
+def write_tif(tif: TanaIntermediateFile, outfile: Optional[str] = None, format: str = 'pretty', compression: Optional[str] = None) -> None:
+    """
+    Write the Tana Intermediate File to 'outfile', or to stdout.
+    - pretty: indented JSON
+    - compact: JSON without any whitespace
+    - ndjson: one JSON object per line, the first line holds everything
+      but the nodes, each following line one top-level (page) node.
+    """
+    with open_output(outfile, compression or compression_for(outfile)) as stream:
+        if format == 'ndjson':
+            tif_dict = tif.to_dict()
+            nodes = tif_dict.pop('nodes')
+            write_json(tif_dict, stream, separators=(',', ':'))
+            for node in nodes:
+                stream.write('\n')
+                write_json(node, stream, separators=(',', ':'))
+            stream.write('\n')
+        elif format == 'compact':
+            write_json(tif.to_dict(), stream, separators=(',', ':'))
+        else:
+            write_json(tif.to_dict(), stream, indent=3)
@@ -37,6 +37,14 @@ class TanaIntermediateSummary(Tana):
         self.fields = fields
         self.brokenRefs = brokenRefs
 
+    def add(self, other: 'TanaIntermediateSummary') -> None:
+        for key, value in other.__dict__.items():
+            setattr(self, key, getattr(self, key) + value)
+
+    @classmethod
+    def from_dict(cls, summary: dict) -> 'TanaIntermediateSummary':
+        return cls(**summary)
+
 class TanaIntermediateAttribute(Tana):
     def __init__(self, name: str, values: List[str], count: int, dataType: Optional[DataType] = None):
         self.name = name
@@ -66,6 +74,11 @@ class TanaIntermediateNode(Tana):
         self.supertags = supertags
         self.todoState = todoState
 
+    @classmethod
+    def from_dict(cls, node: dict) -> 'TanaIntermediateNode':
+        children = [cls.from_dict(child) for child in node.get('children') or []]
+        return cls(**{**node, 'type': NodeType(node['type']) if node.get('type') else '', 'children': children})
+
     def to_dict(self):
         return {
             **self.__dict__,
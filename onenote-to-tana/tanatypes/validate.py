@@ -0,0 +1,95 @@
+# Validation of a Tana Intermediate File
+
+from collections import Counter
+from typing import List
+
+from tanatypes.tif import *     # TIF - Tana Intermediate Format
+from utilities.logs import logger
+
+class TifValidator():
+    """
+    Walks all nodes once, without recursion, to recompute the summary and
+    the attribute counts from the nodes themselves, and to check that
+    uids are unique and that refs and supertags resolve. Links to OneNote
+    left in node names count as broken refs. Up to 'limit'
+    problems are kept for the report, all of them are counted.
+    """
+    def __init__(self, limit: int = 20):
+        self.limit = limit
+        self.problems: List[str] = []
+        self.problem_count = 0
+
+    def problem(self, message: str) -> None:
+        self.problem_count += 1
+        if len(self.problems) < self.limit:
+            self.problems.append(message)
+
+    def run(self, tif: TanaIntermediateFile) -> TanaIntermediateSummary:
+        """
+        Replace the summary and the attribute counts of 'tif' by the
+        recomputed ones, and return the summary.
+        """
+        supertag_uids = set(supertag.uid if isinstance(supertag, TanaIntermediateSupertag) else supertag['uid'] for supertag in tif.supertags or [])
+        uids = set()
+        refs = []
+        field_counts = Counter()
+        total = 0
+        calendar = 0
+        fields = 0
+        unresolved = 0
+        stack = list(tif.nodes)
+        while stack:
+            node = stack.pop()
+            uid = node.uid
+            if uid in uids:
+                self.problem(f'Duplicate uid {uid}: "{node.name:.40}"')
+            uids.add(uid)
+            node_type = node.type
+            if node_type == NodeType.FIELD:
+                fields += 1
+                field_counts[node.name] += 1
+            else:
+                total += 1
+                if node_type == NodeType.DATE:
+                    calendar += 1
+            if node.refs:
+                refs.append(node)
+            if node.name and '](onenote:' in node.name:
+                unresolved += node.name.count('](onenote:')
+            if node.supertags:
+                for supertag in node.supertags:
+                    if supertag not in supertag_uids:
+                        self.problem(f'Unknown supertag {supertag} of node {uid}')
+            if node.children:
+                stack.extend(node.children)
+
+        broken = unresolved
+        for node in refs:
+            for ref in node.refs:
+                if ref not in uids:
+                    broken += 1
+                    self.problem(f'Broken ref {ref} of node {node.uid}')
+
+        attributes = tif.attributes or []
+        names = set()
+        for attribute in attributes:
+            if isinstance(attribute, TanaIntermediateAttribute):
+                attribute.count = field_counts[attribute.name]
+                names.add(attribute.name)
+            else:
+                attribute['count'] = field_counts[attribute['name']]
+                names.add(attribute['name'])
+        for name in field_counts.keys() - names:
+            self.problem(f'Field "{name:.40}" has no attribute')
+
+        # Fields are counted apart from the nodes, every node
+        # below the top level counts as a leaf node
+        top_level = sum(1 for node in tif.nodes if node.type != NodeType.FIELD)
+        tif.summary = TanaIntermediateSummary(total - top_level, top_level, total, calendar, fields, broken)
+        return tif.summary
+
+    def report(self) -> None:
+        for message in self.problems:
+            logger.warning('TIF: %s', message)
+        if self.problem_count > len(self.problems):
+            logger.warning('TIF: %d more problems.', self.problem_count - len(self.problems))
@@ -0,0 +1,144 @@
+# Completion of names in interactive prompts
+
+import re
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+from prompt_toolkit import prompt
+from prompt_toolkit.application import run_in_terminal
+from prompt_toolkit.completion import Completer, Completion
+from prompt_toolkit.key_binding import KeyBindings
+
+# Indexes kept for the lists of names prompted for last, see 'completion_index'
+MAX_INDEXES = 8
+
+class CompletionIndex():
+    """
+    Ranks the names matching a typed text, ignoring case: names starting
+    with the text first (found by binary search), then names with a word
+    starting with it, names containing it, and last names containing its
+    characters in order (fuzzy). Built once for a list of names; while the
+    text is extended, only the previous matches are searched again.
+    """
+    def __init__(self, names: Iterable[str]):
+        self.names = list(names)
+        self.folded = [name.casefold() for name in self.names]
+        self.order = sorted(range(len(self.names)), key=self.folded.__getitem__)
+        self.keys = [self.folded[i] for i in self.order]
+        self.last_text = None
+        self.last_matches: List[int] = []
+
+    def prefixed(self, text: str) -> List[int]:
+        start = bisect_left(self.keys, text)
+        end = bisect_left(self.keys, text + '\U0010ffff')
+        return self.order[start:end]
+
+    def rank(self, text: str) -> List[str]:
+        text = text.casefold()
+        if not text:
+            return list(self.names)
+        if self.last_text is not None and text.startswith(self.last_text):
+            candidates = self.last_matches
+        else:
+            candidates = range(len(self.names))
+        prefixed = self.prefixed(text)
+        seen = set(prefixed)
+        words, contained, fuzzy = [], [], []
+        subsequence = re.compile('.*?'.join(map(re.escape, text)), re.DOTALL).search
+        folded = self.folded
+        for i in candidates:
+            if i in seen:
+                continue
+            name = folded[i]
+            position = name.find(text)
+            if position > 0:
+                (contained if name[position - 1].isalnum() else words).append(i)
+            elif position < 0 and subsequence(name):
+                fuzzy.append(i)
+        matches = prefixed + words + contained + fuzzy
+        self.last_text = text
+        self.last_matches = sorted(matches)
+        return [self.names[i] for i in matches]
+
+    def page(self, text: str, page: int = 0, page_size: int = 20) -> Tuple[List[str], int]:
+        """
+        Return the 'page'-th page of the ranked names, and the number of all.
+        """
+        names = self.rank(text)
+        return names[page * page_size:(page + 1) * page_size], len(names)
+
+INDEXES: Dict[Tuple[str, ...], CompletionIndex] = {}
+
+def completion_index(names: Iterable[str]) -> CompletionIndex:
+    """
+    The index over 'names', built once for each list of names (i.e. each
+    level of the hierarchy) and reused when prompted for again.
+    """
+    key = tuple(names)
+    index = INDEXES.pop(key, None)
+    if index is None:
+        index = CompletionIndex(key)
+        if len(INDEXES) >= MAX_INDEXES:
+            INDEXES.pop(next(iter(INDEXES)))
+    # The most recently used last
+    INDEXES[key] = index
+    return index
+
+class NamePager():
+    """
+    Pages through the names matching the text typed so far: each call of
+    'next' describes the following page, starting over with the first one
+    once the text changed or all pages were shown.
+    """
+    def __init__(self, index: CompletionIndex, page_size: int = 20):
+        self.index = index
+        self.page_size = page_size
+        self.text = None
+        self.page = 0
+
+    def next(self, text: str) -> str:
+        if text != self.text:
+            self.text = text
+            self.page = 0
+        shown, total = self.index.page(text, self.page, self.page_size)
+        if not shown and self.page:
+            self.page = 0
+            shown, total = self.index.page(text, self.page, self.page_size)
+        first = self.page * self.page_size
+        self.page += 1
+        if not shown:
+            return 'No names match.'
+        more = ', PageDown for more' if first + len(shown) < total else ''
+        return f'{first + 1}-{first + len(shown)} of {total}{more}: {", ".join(shown)}'
+
+class IndexCompleter(Completer):
+    """
+    Completes the text before the cursor with the best ranked names.
+    """
+    def __init__(self, index: CompletionIndex, limit: int = 100):
+        self.index = index
+        self.limit = limit
+
+    def get_completions(self, document, complete_event):
+        text = document.text_before_cursor
+        for name in self.index.rank(text)[:self.limit]:
+            yield Completion(name, start_position=-len(text))
+
+def prompt_name(prompt_str: str, names: Iterable[str], heading: str = None, page_size: int = 20) -> str:
+    """
+    Show the first page of 'names' below 'heading' and prompt for one,
+    completing the input from an index over 'names'. PageDown shows the
+    next page of the names matching the input so far.
+    """
+    index = completion_index(names)
+    pager = NamePager(index, page_size)
+    if heading:
+        print(f'{heading}, {pager.next("")}')
+    bindings = KeyBindings()
+
+    @bindings.add('pagedown')
+    def next_page(event):
+        text = event.current_buffer.text
+        run_in_terminal(lambda: print(pager.next(text)))
+
+    return prompt(prompt_str, completer=IndexCompleter(index), complete_while_typing=True, key_bindings=bindings)
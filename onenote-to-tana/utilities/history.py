@@ -0,0 +1,147 @@
+# Local run history of the conversions
+
+import json
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started TEXT,
+    version TEXT,
+    options TEXT,
+    pages INTEGER DEFAULT 0,
+    failures INTEGER DEFAULT 0,
+    seconds REAL,
+    serialise_seconds REAL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    run_id INTEGER REFERENCES runs(id),
+    page_id TEXT,
+    name TEXT,
+    mht_bytes INTEGER,
+    publish_seconds REAL,
+    extract_seconds REAL,
+    convert_seconds REAL,
+    serialise_seconds REAL,
+    nodes INTEGER,
+    fields INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS pages_by_page ON pages(page_id, run_id);
+"""
+
+def program_version() -> str:
+    """
+    The version in the project's pyproject.toml, or of the installed package.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'pyproject.toml')
+    try:
+        with open(path, encoding='utf-8') as pyproject:
+            match = re.search(r'^version\s*=\s*"([^"]+)"', pyproject.read(), re.MULTILINE)
+            if match:
+                return match.group(1)
+    except OSError:
+        pass
+    try:
+        from importlib.metadata import version
+        return version('onenote-to-tana')
+    except Exception:
+        return 'unknown'
+
+class RunHistory():
+    """
+    Records each run and each page converted by it in an SQLite database
+    at 'path'. Pages are written in batches of 'batch' rows.
+    """
+    def __init__(self, path: str, batch: int = 500):
+        self.path = path
+        self.batch = batch
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.run_id: Optional[int] = None
+        self.rows: List[tuple] = []
+        self.pages = 0
+        self.failures = 0
+        self.started = 0.0
+
+    def start_run(self, options: Dict[str, Any], version: Optional[str] = None) -> int:
+        self.started = time.monotonic()
+        cursor = self.connection.execute('INSERT INTO runs (started, version, options) VALUES (?, ?, ?)',
+                                         (datetime.now().isoformat(timespec='seconds'), version or program_version(), json.dumps(options, default=str)))
+        self.connection.commit()
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def record_page(self, page_id: str, name: str, mht_bytes: int = 0, publish_seconds: float = 0.0, extract_seconds: float = 0.0,
+                    convert_seconds: float = 0.0, serialise_seconds: float = 0.0, nodes: int = 0, fields: int = 0, error: Optional[str] = None) -> None:
+        self.rows.append((self.run_id, page_id, name, mht_bytes, publish_seconds, extract_seconds, convert_seconds, serialise_seconds, nodes, fields, error))
+        self.pages += 1
+        if error:
+            self.failures += 1
+        if len(self.rows) >= self.batch:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.rows:
+            self.connection.executemany('INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', self.rows)
+            self.connection.commit()
+            self.rows = []
+
+    def finish_run(self, serialise_seconds: float = 0.0) -> None:
+        self.flush()
+        self.connection.execute('UPDATE runs SET pages = ?, failures = ?, seconds = ?, serialise_seconds = ? WHERE id = ?',
+                                (self.pages, self.failures, time.monotonic() - self.started, serialise_seconds, self.run_id))
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
+
+def report(path: str, runs: int = 10, slowest: int = 10, factor: float = 1.5) -> None:
+    """
+    Print the throughput of the last 'runs' runs, the 'slowest' pages of
+    the last run, and the pages that got 'factor' times slower to convert
+    from the previous version to the latest one.
+    """
+    connection = sqlite3.connect(path)
+    print(f'Last {runs} runs:')
+    print(f'  {"run":>5} {"started":<20} {"version":<10} {"pages":>7} {"failed":>6} {"pages/s":>8} {"publish":>8} {"extract":>8} {"convert":>8} {"write":>8}')
+    for row in connection.execute("""
+            SELECT runs.id, runs.started, runs.version, runs.pages, runs.failures, runs.seconds, runs.serialise_seconds,
+                   SUM(pages.publish_seconds), SUM(pages.extract_seconds), SUM(pages.convert_seconds)
+            FROM runs LEFT JOIN pages ON pages.run_id = runs.id
+            GROUP BY runs.id ORDER BY runs.id DESC LIMIT ?""", (runs,)):
+        run_id, started, version, pages, failures, seconds, serialise, publish, extract, convert = row
+        rate = pages / seconds if seconds else 0.0
+        print(f'  {run_id:>5} {started:<20} {version:<10} {pages:>7} {failures:>6} {rate:>8.2f} '
+              f'{publish or 0:>7.1f}s {extract or 0:>7.1f}s {convert or 0:>7.1f}s {serialise or 0:>7.1f}s')
+
+    last = connection.execute('SELECT MAX(id) FROM runs').fetchone()[0]
+    if last is not None:
+        print(f'Slowest pages of run {last}:')
+        for name, page_id, mht_bytes, publish, extract, convert in connection.execute("""
+                SELECT name, page_id, mht_bytes, publish_seconds, extract_seconds, convert_seconds FROM pages
+                WHERE run_id = ? ORDER BY publish_seconds + extract_seconds + convert_seconds DESC LIMIT ?""", (last, slowest)):
+            print(f'  {publish + extract + convert:>8.2f}s  {mht_bytes / 1024:>9.0f} KB  {name} {page_id}')
+
+    versions = [row[0] for row in connection.execute('SELECT version FROM runs GROUP BY version ORDER BY MAX(id) DESC LIMIT 2')]
+    if len(versions) == 2:
+        latest, previous = versions
+        print(f'Pages converting {factor}x slower in {latest} than in {previous}:')
+        for name, before, after in connection.execute("""
+                SELECT new.name, old.seconds, new.seconds FROM
+                    (SELECT page_id, MAX(name) AS name, AVG(convert_seconds) AS seconds FROM pages JOIN runs ON runs.id = pages.run_id
+                     WHERE runs.version = ? AND error IS NULL GROUP BY page_id) AS new
+                JOIN
+                    (SELECT page_id, AVG(convert_seconds) AS seconds FROM pages JOIN runs ON runs.id = pages.run_id
+                     WHERE runs.version = ? AND error IS NULL GROUP BY page_id) AS old
+                ON new.page_id = old.page_id
+                WHERE new.seconds > old.seconds * ? AND new.seconds > 0.01
+                ORDER BY new.seconds - old.seconds DESC LIMIT ?""", (latest, previous, factor, slowest)):
+            print(f'  {before:>8.3f}s -> {after:>8.3f}s  {name}')
+    connection.close()
@@ -0,0 +1,109 @@
+# Content-addressed image store
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+# Leading bytes of the image formats OneNote stores
+IMAGE_SIGNATURES = (
+    (b'\x89PNG', 'image/png'),
+    (b'\xff\xd8', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+    (b'BM', 'image/bmp'),
+)
+
+def image_content_type(data: bytes) -> str:
+    """
+    The content type of an image, by its leading bytes.
+    """
+    for signature, content_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    return 'application/octet-stream'
+
+class ImageWriter():
+    """
+    Receives the decoded bytes of one image in chunks. The bytes are
+    hashed while they are written to a temporary file inside the store,
+    and on 'commit' the file is moved to its content-addressed location.
+    The temporary file is removed if writing or committing fails, and by
+    'discard'.
+    """
+    def __init__(self, store: 'ImageStore', extension: str):
+        self.store = store
+        self.extension = extension
+        self.hash = hashlib.sha256()
+        self.size = 0
+        fd, self.temp_path = tempfile.mkstemp(suffix='.part', dir=store.directory)
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, data: bytes) -> None:
+        self.hash.update(data)
+        try:
+            self.file.write(data)
+        except BaseException:
+            self.discard()
+            raise
+        self.size += len(data)
+
+    def commit(self) -> str:
+        """
+        Finish the image and return its media URL.
+        """
+        digest = self.hash.hexdigest()
+        relative_path = f'{digest[:2]}/{digest}{self.extension}'
+        file_path = os.path.join(self.store.directory, relative_path)
+        try:
+            self.file.close()
+            if os.path.exists(file_path):
+                # Same content already stored by an earlier page
+                self.store.deduplicated += 1
+            else:
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                os.replace(self.temp_path, file_path)
+                self.store.stored += 1
+                self.store.bytes_written += self.size
+        finally:
+            self.discard()
+        return self.store.url(relative_path)
+
+    def discard(self) -> None:
+        """
+        Drop the image, if not yet committed.
+        """
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+class ImageStore():
+    """
+    Stores images on disk keyed by the SHA-256 hash of their content,
+    so identical images repeated across pages are stored only once.
+    If 'base_url' is given, media URLs are built from it (e.g., when the
+    store directory is published on a web server), otherwise 'file://'
+    URLs pointing into the store directory are returned.
+    """
+    def __init__(self, directory: str, base_url: Optional[str] = None):
+        self.directory = os.path.abspath(directory)
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.stored = 0
+        self.deduplicated = 0
+        self.bytes_written = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def writer(self, content_type: str) -> ImageWriter:
+        extension = {
+            'image/png': '.png',
+            'image/jpeg': '.jpg',
+            'image/jpg': '.jpg',
+            'image/gif': '.gif',
+            'image/bmp': '.bmp',
+        }.get(content_type, '')
+        return ImageWriter(self, extension)
+
+    def url(self, relative_path: str) -> str:
+        if self.base_url:
+            return f'{self.base_url}/{relative_path}'
+        return Path(self.directory, relative_path).as_uri()
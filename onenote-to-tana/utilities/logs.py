@@ -0,0 +1,78 @@
+# Logging of the conversion diagnostics
+
+import logging
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger('onenote-to-tana')
+
+class Counts():
+    """
+    Formats tag counts, e.g. "<foo> 3x, <ul>/<table> 1x", only when logged.
+    """
+    def __init__(self, counts: Counter):
+        self.counts = counts
+
+    def __str__(self) -> str:
+        return ', '.join(f'{name} {count}x' for name, count in self.counts.most_common())
+
+class PageDiagnostics():
+    """
+    Counts the unsupported tags per page and overall. Instead of a line
+    per occurrence, a single warning per page lists the counts by tag name,
+    for up to 'limit' pages, the overall counts are reported at the end.
+    Single occurrences are logged at debug level only. When 'deferred'
+    (in a worker process), the counts of a page are kept in 'last' to
+    be handed to 'add_page' of the main process instead.
+    """
+    def __init__(self, limit: int = 100):
+        self.limit = limit
+        self.page: Optional[str] = None
+        self.counts = Counter()
+        self.totals = Counter()
+        self.pages = 0
+        self.deferred = False
+        self.last = Counter()
+
+    def begin_page(self, page_name: str) -> None:
+        self.page = page_name
+        self.counts = Counter()
+
+    def unsupported(self, tag, context: str = '') -> None:
+        # A BeautifulSoup tag, or an element of page XML
+        name = f'{context}<{tag.name if hasattr(tag, "name") else tag.tag.rsplit("}", 1)[-1]}>'
+        self.counts[name] += 1
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Unsupported tag %s: %.200s', name, tag)
+
+    def end_page(self) -> None:
+        if self.deferred:
+            self.last = self.counts
+        else:
+            self.add_page(self.page, self.counts)
+        self.counts = Counter()
+
+    def add_page(self, page: str, counts: Counter) -> None:
+        if counts:
+            level = logging.WARNING if self.pages < self.limit else logging.DEBUG
+            logger.log(level, 'Page "%s": unsupported %s', page, Counts(counts),
+                       extra={'page': page, 'unsupported': dict(counts)})
+            if self.pages + 1 == self.limit:
+                logger.warning('Further pages with unsupported tags are only counted.')
+            self.totals.update(counts)
+            self.pages += 1
+
+    def report(self) -> None:
+        if self.totals:
+            logger.warning('%d pages with unsupported tags, overall: %s', self.pages, Counts(self.totals))
+
+diagnostics = PageDiagnostics()
+
+def setup_logging(verbosity: int = 0) -> None:
+    """
+    Log to stderr, so that a TIF written to stdout stays intact.
+    Verbosity -1 only logs warnings, 0 also information (e.g. each page),
+    1 also debug messages (e.g. each unsupported tag).
+    """
+    level = {-1: logging.WARNING, 0: logging.INFO}.get(verbosity, logging.DEBUG)
+    logging.basicConfig(level=level, format='%(message)s')
@@ -0,0 +1,171 @@
+# Microsoft Hypertext Archive (MHT) files, as published by OneNote
+
+import binascii
+import email
+import re
+from email import policy
+from email.parser import BytesHeaderParser, BytesParser
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+from urllib.parse import unquote
+
+from utilities.images import ImageStore
+from utilities.logs import logger
+
+# The table of contents of a section published as a whole
+FRAMESET = re.compile(r'<frameset\b', re.IGNORECASE)
+
+def image_key(reference: str) -> str:
+    """
+    The key of an image reference in the dictionary of images, the same
+    for the 'Content-Location' of the MHT part and the 'src' of the HTML,
+    whether either is URL encoded (e.g. "My%20Page_files/image001.png").
+    """
+    return unquote(reference)
+
+def extract_mht_contents(mht_file: str, image_store: Optional[ImageStore] = None) -> Tuple[str, Dict[str, str]]:
+    """
+    Extract the contents of a Microsoft Hypertext Archive (MHT) file. 
+    MHT files are essentially MIME-encoded files (multipart/related).
+    The file is read line by line: the HTML part is collected and
+    decoded, while image parts are base64-decoded incrementally into
+    the 'image_store', so that large images are never held in memory.
+    Returns the HTML and a dictionary mapping each image reference used
+    in the HTML (e.g. "Page_files/image001.png") to its media URL, or to
+    an empty string when no 'image_store' is given.
+    """
+    html = None
+    images = {}
+    with open(mht_file, 'rb') as f:
+        boundary = _read_mht_header(f, mht_file)
+        if not boundary:
+            # Not multipart, i.e. a single HTML document
+            f.seek(0)
+            msg = email.message_from_binary_file(f, policy=policy.default)
+            return msg.get_content(), images
+
+        for part in _mht_parts(f, boundary, image_store, images):
+            if part['type'] == 'text/html' and html is None:
+                html = _mht_part_content(part)
+    return html, images
+
+def split_mht_pages(mht_file: str, images: Dict[str, str], image_store: Optional[ImageStore] = None) -> Iterator[str]:
+    """
+    Extract the pages of an MHT file holding a whole section, in a single
+    pass like 'extract_mht_contents': yields the HTML of each page, in the
+    order of the file, as soon as it is read, and adds the images of all
+    pages to 'images' (complete once all pages are read). HTML parts that
+    are just a frameset (the section's table of contents) are left out.
+    """
+    with open(mht_file, 'rb') as f:
+        boundary = _read_mht_header(f, mht_file)
+        if not boundary:
+            f.seek(0)
+            msg = email.message_from_binary_file(f, policy=policy.default)
+            yield msg.get_content()
+            return
+
+        for part in _mht_parts(f, boundary, image_store, images):
+            if part['type'] == 'text/html':
+                html = _mht_part_content(part)
+                if not FRAMESET.search(html):
+                    yield html
+
+def _read_mht_header(f: BinaryIO, mht_file: str) -> Optional[str]:
+    """
+    Read the header of the MHT, return its MIME boundary, or None if it
+    is not multipart.
+    """
+    header_lines = []
+    for line in f:
+        if line in (b'\r\n', b'\n'):
+            break
+        header_lines.append(line)
+    msg = BytesHeaderParser(policy=policy.default).parsebytes(b''.join(header_lines))
+    if not header_lines or not msg:
+        logger.error("Error: No email message found in file '%s'.", mht_file)
+        raise email.errors.MessageError
+    if msg.get_content_maintype() != 'multipart':
+        return None
+    return msg.get_boundary()
+
+def _mht_parts(f: BinaryIO, boundary: str, image_store: Optional[ImageStore], images: Dict[str, str]) -> Iterator[Dict]:
+    """
+    Yield the parts of the MHT other than images, the images are stored
+    while they are read and added to 'images'. The image being read when
+    reading fails is discarded.
+    """
+    delimiter = b'--' + boundary.encode('ascii')
+    part = None
+    try:
+        for line in f:
+            if line.startswith(delimiter):
+                if part is not None and _finish_mht_part(part, images):
+                    yield part
+                if line.rstrip() == delimiter + b'--':
+                    part = None
+                    break
+                part = _start_mht_part(f, image_store)
+            elif part is not None:
+                _feed_mht_part(part, line)
+        if part is not None and _finish_mht_part(part, images):
+            yield part
+    finally:
+        if part is not None and part['writer']:
+            part['writer'].discard()
+
+def _start_mht_part(f: BinaryIO, image_store: Optional[ImageStore]) -> Dict:
+    header_lines = []
+    for line in f:
+        if line in (b'\r\n', b'\n'):
+            break
+        header_lines.append(line)
+    header = b''.join(header_lines)
+    headers = BytesHeaderParser(policy=policy.default).parsebytes(header)
+    content_type = headers.get_content_type()
+    location = headers.get('Content-Location', '')
+    # The HTML part references images relative to the page,
+    # e.g. "Page_files/image001.png", see 'image_key'
+    name = image_key('/'.join(location.replace('\\', '/').rsplit('/', 2)[-2:]))
+    part = {'type': content_type, 'name': name, 'header': header, 'body': [], 'writer': None, 'rest': b''}
+    if content_type.startswith('image/'):
+        encoding = headers.get('Content-Transfer-Encoding', '').lower()
+        if image_store and encoding == 'base64':
+            part['writer'] = image_store.writer(content_type)
+    return part
+
+def _feed_mht_part(part: Dict, line: bytes) -> None:
+    if part['type'].startswith('image/'):
+        if part['writer']:
+            # Decode whole base64 quadruples only, keep the rest for later
+            data = part['rest'] + line.strip()
+            cut = len(data) - len(data) % 4
+            part['rest'] = data[cut:]
+            if cut:
+                part['writer'].write(binascii.a2b_base64(data[:cut]))
+    else:
+        part['body'].append(line)
+
+def _finish_mht_part(part: Dict, images: Dict[str, str]) -> bool:
+    """
+    Finish an image part, return False, or return True for any other part.
+    """
+    if not part['type'].startswith('image/'):
+        return True
+    writer = part['writer']
+    part['writer'] = None
+    if writer:
+        try:
+            if part['rest']:
+                writer.write(binascii.a2b_base64(part['rest']))
+        except binascii.Error:
+            writer.discard()
+            images[part['name']] = ''
+            return False
+        images[part['name']] = writer.commit()
+    else:
+        images[part['name']] = ''
+    return False
+
+def _mht_part_content(part: Dict) -> str:
+    msg = BytesParser(policy=policy.default).parsebytes(part['header'] + b'\r\n' + b''.join(part['body']))
+    return msg.get_content()
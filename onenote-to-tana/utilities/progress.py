@@ -0,0 +1,124 @@
+# Progress reporting for long conversions
+
+import logging
+import sys
+import time
+from collections import deque
+from typing import Optional, TextIO
+
+class ProgressReporter():
+    """
+    Reports pages done/remaining, pages and nodes per second over a moving
+    window of 'window' seconds, and the estimated time remaining. Given the
+    estimated work of the pages to do ('expect_work', e.g. the seconds the
+    cost model expects of each), the ETA is the work of the pages not yet
+    done divided by the recent throughput in work per second, so that big
+    pages left to do count for more. Otherwise it is the pages remaining
+    divided by the recent pages per second.
+    On a terminal a progress bar is redrawn in place, otherwise a line of
+    'key=value' pairs is written every 'interval' seconds.
+    Reporting a page costs a few additions unless output is due.
+    """
+    def __init__(self, total: int, stream: Optional[TextIO] = None, interval: Optional[float] = None, window: float = 60.0):
+        self.total = total
+        self.stream = stream or sys.stderr
+        self.tty = self.stream.isatty()
+        self.interval = interval if interval is not None else (0.5 if self.tty else 30.0)
+        self.window = window
+        self.done = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.nodes = 0
+        self.work = None    # estimated work of the pages to do
+        self.work_done = 0.0
+        self.started = time.monotonic()
+        self.last_output = self.started
+        # (time, pages, nodes, bytes, work) samples within the window
+        self.samples = deque([(self.started, 0, 0, 0, 0.0)])
+        self.shown = False
+        self.filter = None
+        if self.tty:
+            # Clear the progress bar before anything is logged
+            self.filter = ClearLineFilter(self)
+            for handler in logging.getLogger().handlers:
+                handler.addFilter(self.filter)
+
+    def page_skipped(self) -> None:
+        """
+        A page that needs no work, e.g. one converted by an earlier run.
+        """
+        self.skipped += 1
+
+    def expect_work(self, work: float) -> None:
+        """
+        The estimated work of all pages to do, in the unit of the 'work'
+        reported with 'page_done'.
+        """
+        self.work = work
+
+    def page_done(self, mht_bytes: int = 0, nodes: int = 0, work: float = 0.0) -> None:
+        self.done += 1
+        self.bytes += mht_bytes
+        self.nodes += nodes
+        self.work_done += work
+        now = time.monotonic()
+        if now - self.last_output >= self.interval:
+            self.samples.append((now, self.done, self.nodes, self.bytes, self.work_done))
+            while len(self.samples) > 2 and now - self.samples[0][0] > self.window:
+                self.samples.popleft()
+            self.last_output = now
+            self.output(now)
+
+    def rates(self, now: float):
+        then, pages, nodes, size, work = self.samples[0]
+        elapsed = max(now - then, 1e-9)
+        return (self.done - pages) / elapsed, (self.nodes - nodes) / elapsed, (self.bytes - size) / elapsed, (self.work_done - work) / elapsed
+
+    def eta(self, now: float) -> Optional[float]:
+        pages_per_second, _, _, work_per_second = self.rates(now)
+        if self.work is not None and work_per_second > 0:
+            return max(0.0, self.work - self.work_done) / work_per_second
+        if pages_per_second > 0:
+            return (self.total - self.skipped - self.done) / pages_per_second
+        return None
+
+    def output(self, now: float) -> None:
+        pages_per_second, nodes_per_second, _, _ = self.rates(now)
+        eta = self.eta(now)
+        finished = self.done + self.skipped
+        if self.tty:
+            width = 30
+            filled = int(width * finished / self.total) if self.total else width
+            eta_str = time.strftime('%H:%M:%S', time.gmtime(eta)) if eta is not None else '--:--:--'
+            self.stream.write(f'\r\x1b[K[{"#" * filled}{"." * (width - filled)}] {finished}/{self.total} pages, '
+                              f'{pages_per_second:.1f} pages/s, {nodes_per_second:.0f} nodes/s, ETA {eta_str}')
+            self.shown = True
+        else:
+            eta_str = f'{eta:.0f}' if eta is not None else ''
+            self.stream.write(f'progress pages_done={finished} pages_total={self.total} pages_remaining={self.total - finished} '
+                              f'pages_per_s={pages_per_second:.2f} nodes_per_s={nodes_per_second:.1f} '
+                              f'mht_bytes={self.bytes} eta_s={eta_str}\n')
+        self.stream.flush()
+
+    def clear(self) -> None:
+        if self.shown:
+            self.stream.write('\r\x1b[K')
+            self.shown = False
+
+    def finish(self) -> None:
+        now = time.monotonic()
+        self.samples = deque([(self.started, 0, 0, 0, 0.0)])
+        self.output(now)
+        if self.tty:
+            self.stream.write('\n')
+            for handler in logging.getLogger().handlers:
+                handler.removeFilter(self.filter)
+
+class ClearLineFilter(logging.Filter):
+    def __init__(self, progress: ProgressReporter):
+        super().__init__()
+        self.progress = progress
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        self.progress.clear()
+        return True
@@ -0,0 +1,111 @@
+# Temporary storage of the published pages
+
+import errno
+import os
+import shutil
+import tempfile
+from typing import Dict, Optional
+
+from utilities.logs import logger
+
+class TempStorage():
+    """
+    Hands out the files pages are published to, within 'directory', and
+    keeps track of the disk space they take until they are released.
+    Pages are published one at a time, and each file is released once
+    parsed, so nothing would ever free room to wait for: a file expected
+    to take the files not yet released above 'quota' bytes is refused
+    right away instead, a file of unknown size once it is written (and
+    it is deleted then). Sizes are known from 'expect' (e.g. the size of
+    the page in an earlier run). With a 'ram_directory' (e.g. a RAM disk),
+    a file expected to fit within what is left of 'ram_quota' bytes goes
+    there, sizes not known guessed as the mean size of a page so far.
+    Files are named after the page ID, so pages sharing a name do not
+    collide. With 'keep' nothing is deleted.
+    """
+    def __init__(self, directory: str, quota: Optional[int] = None, ram_directory: Optional[str] = None, ram_quota: int = 256 * 1024 * 1024, keep: bool = False):
+        self.directory = directory
+        self.quota = quota
+        self.ram_directory = tempfile.mkdtemp(prefix='onenote-to-tana-', dir=ram_directory) if ram_directory else None
+        self.ram_quota = ram_quota
+        self.keep = keep
+        self.sizes: Dict[str, Optional[int]] = {}   # path -> bytes (None until published), of the files not yet released
+        self.expected: Dict[str, int] = {}          # name -> bytes expected
+        self.used = 0
+        self.published_count = 0
+        self.published_bytes = 0
+        self.ram_used = 0
+        self.ram_files = 0
+        self.peak = 0
+
+    def expect(self, name: str, size: int) -> None:
+        """
+        The size the file for 'name' is expected to take.
+        """
+        self.expected[name] = size
+
+    def estimate(self, name: str, pages: int = 1) -> Optional[int]:
+        """
+        The size expected of the file for 'name', holding 'pages' pages:
+        the size known, else a guess from the mean size of a page so far,
+        None if nothing is published yet.
+        """
+        if name in self.expected:
+            return self.expected[name]
+        return self.published_bytes * pages // self.published_count if self.published_count else None
+
+    def acquire(self, name: str, expected: Optional[int] = None, pages: int = 1) -> str:
+        """
+        Return the path of a new file for 'name', holding 'pages' pages and
+        known to take 'expected' bytes (by default the size from 'expect').
+        Raises an OSError (ENOSPC) if it is known not to fit within the
+        quota. A guessed size only decides on the RAM directory, so that a
+        large page does not get all the pages after it refused.
+        """
+        if expected is None:
+            expected = self.expected.get(name)
+        if self.quota and expected is not None and self.used + expected > self.quota:
+            raise OSError(errno.ENOSPC, f'{expected:,} bytes expected to be published, {self.used:,} of the quota of {self.quota:,} bytes taken', name)
+        size = expected if expected is not None else self.estimate(name, pages)
+        if self.ram_directory and size is not None and self.ram_used + size <= self.ram_quota:
+            path = os.path.join(self.ram_directory, f'{name}.mht')
+        else:
+            path = os.path.join(self.directory, f'{name}.mht')
+        self.sizes[path] = None
+        return path
+
+    def published(self, path: str, pages: int = 1) -> None:
+        """
+        Account for the size of the file at 'path' once it is written,
+        holding 'pages' pages. Raises an OSError (ENOSPC) if it takes the
+        files not yet released above the quota, the file is to be released.
+        """
+        size = os.path.getsize(path)
+        self.sizes[path] = size
+        self.used += size
+        self.published_count += pages
+        self.published_bytes += size
+        if self.ram_directory and path.startswith(self.ram_directory):
+            self.ram_used += size
+            self.ram_files += 1
+        self.peak = max(self.peak, self.used)
+        if self.quota and self.used > self.quota:
+            raise OSError(errno.ENOSPC, f'{size:,} bytes published, {self.used:,} bytes taken, over the quota of {self.quota:,} bytes', path)
+
+    def release(self, path: str) -> None:
+        """
+        Delete the file at 'path' (unless kept) and free its space.
+        """
+        size = self.sizes.pop(path, 0) or 0     # None if publishing failed
+        self.used -= size
+        if self.ram_directory and path.startswith(self.ram_directory):
+            self.ram_used -= size
+        if not self.keep:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.debug('Could not remove "%s": %r', path, e)
+
+    def cleanup(self) -> None:
+        if self.ram_directory:
+            shutil.rmtree(self.ram_directory, ignore_errors=True)
@@ -1,12 +1,11 @@
 # Utility functions
 
-import email
+import fnmatch
+import gc
 import re
-from email import policy
 from datetime import datetime, timezone
-from xml.etree import ElementTree
 from string import printable
-from typing import Dict, Tuple
+from typing import Callable, Dict
 
 # ISO 8601 date and time common format
 def iso8601(date_string: str) -> datetime:
@@ -36,6 +35,38 @@ def date_in_milliseconds(date_iso8601: str) -> int:
     return int(timestamp * 1000.0)
 
 
+class BulkGC():
+    """
+    Garbage collector tuning for converting many pages in one run.
+    Objects that survive the pages (the converted nodes) are moved out of
+    the collector's reach every 'every' pages with 'page_done', so the
+    collections triggered by the next pages do not have to traverse
+    everything converted so far. The garbage of these pages is collected
+    in full before the survivors are frozen, as frozen objects are never
+    collected. Only the objects created since the last freeze are
+    traversed to do so.
+    """
+    def __init__(self, threshold: int = 50000, every: int = 20):
+        self.threshold = threshold
+        self.every = every
+        self.pages = 0
+        self.thresholds = gc.get_threshold()
+
+    def start(self) -> None:
+        gc.collect()
+        gc.freeze()
+        gc.set_threshold(self.threshold, *self.thresholds[1:])
+
+    def page_done(self) -> None:
+        self.pages += 1
+        if self.pages % self.every == 0:
+            gc.collect()
+            gc.freeze()
+
+    def stop(self) -> None:
+        gc.set_threshold(*self.thresholds)
+        gc.unfreeze()
+
 def safe_str(name: str) -> str:
     """
     Takes a string parameter 'name' and returns a new string where
@@ -66,60 +97,27 @@ def check_substring_in_keys(dictionary: Dict, substring: str) -> Dict:
     """
     return {key: dictionary[key] for key in dictionary if substring in key}
 
-def extract_mht_contents(mht_file: str) -> Tuple[str, Dict[str, str]]:
+def is_glob(selector: str) -> bool:
+    return any(c in selector for c in '*?[')
+
+def selector_matcher(selector: str) -> Callable[[str], bool]:
     """
-    Extract the contents of a Microsoft Hypertext Archive (MHT) file. 
-    The function takes an MHT file as input and opens it in binary mode.
-    It then reads the file as an email message, since MHT files are 
-    essentially MIME-encoded files.
+    Return a function that tells whether a name matches 'selector'.
+    A selector starting with 're:' is a regular expression searched in
+    the name, a selector containing any of '*?[' is a glob pattern the
+    whole name has to match, any other selector is a substring.
+    All selectors are case sensitive.
     """
+    if selector.startswith('re:'):
+        return re.compile(selector[3:]).search
+    if is_glob(selector):
+        return re.compile(fnmatch.translate(selector)).match
+    return lambda name: selector in name
 
-    with open(mht_file, 'rb') as f:
-        msg = email.message_from_binary_file(f, policy=policy.default)
-
-    if not msg:
-        print(f"Error: No email message found in file '{mht_file}'.")
-        raise email.errors.MessageError
-
-    html = None
-    xml = None
-    images = {}
-    for part in msg.walk():
-        content_type = part.get_content_type()
-        # print(f'part type = {content_type}')
-        if content_type == 'text/html':
-            html = part.get_content()
-        # in case of multipart/related, a text/xml should describe the additional parts
-        elif content_type == "image/png" or content_type == "image/jpeg":
-            # image = part.get_content() # decode, ready to store on filesystem
-            # image = part.get_payload(decode=False) # raw MIME image data
-            pass
-        elif content_type == "text/xml":
-            xml = part.get_content()
-
-    if xml is not None:
-        # print(f'xml = {xml}')
-        # Parse the XML string
-        root = ElementTree.fromstring(xml)
-        # Define the namespace
-        namespaces = {'o': 'urn:schemas-microsoft-com:office:office'} 
-        # Find the 'HRef' attribute of 'o:MainFile' element
-        main_file = root.find('o:MainFile', namespaces)
-        main_path = main_file.attrib['HRef']
-        # Split the path into components
-        components = main_path.split('/')
-        # The last component is the filename with extension
-        filename_with_extension = components[-1]
-        # Split the filename into name and extension
-        fname, _ = filename_with_extension.rsplit('.', 1)
-        fname += '_files'
-        # 'fname' should now hold the path used as reference in the
-        # HTML part, e.g., for images
-        for file in root.findall('o:File', namespaces):
-            file_path = file.attrib['HRef']
-            if file_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-                image_name = f'{fname}/{file_path}'
-                for part in msg.walk():
-                    if part.get_content_type() in ["image/png", "image/jpg", "image/jpeg"]:
-                        images[image_name] = part.get_payload(decode=False)
-    return html, images
+def select_in_keys(dictionary: Dict, selector: str) -> Dict:
+    """
+    Like 'check_substring_in_keys', but 'selector' may also be a glob
+    pattern or regular expression (see 'selector_matcher').
+    """
+    matches = selector_matcher(selector)
+    return {key: dictionary[key] for key in dictionary if matches(key)}
@@ -0,0 +1,108 @@
+# A stand-in for the OneNote app, for the tests
+
+import os
+import shutil
+from typing import Dict, List, Optional
+from xml.etree import ElementTree
+
+from onenote.onenote import HierarchyScope
+
+NAMESPACE = 'http://schemas.microsoft.com/office/onenote/2013/onenote'
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+# Elements by depth in the hierarchy, section groups are at the depth of
+# the sections they hold
+DEPTHS = {'Notebook': 1, 'SectionGroup': 2, 'Section': 2, 'Page': 3}
+SCOPE_DEPTHS = {HierarchyScope.hsNotebooks: 1, HierarchyScope.hsSections: 2, HierarchyScope.hsPages: 3}
+
+ElementTree.register_namespace('one', NAMESPACE)
+
+def element(tag: str, **attributes: str) -> ElementTree.Element:
+    return ElementTree.Element(f'{{{NAMESPACE}}}{tag}', {key: value for key, value in attributes.items() if value is not None})
+
+class FakeApp():
+    """
+    Serves 'GetHierarchy' from an in-memory hierarchy built with 'notebook',
+    'section', and 'page', like the OneNote app does for each scope. Pages
+    are published from the MHT files in 'published' (page or section ID ->
+    path), pages without one as a minimal MHT, and their XML is served from
+    'contents'. All calls are recorded in 'calls'.
+    """
+    def __init__(self):
+        self.root = element('Notebooks')
+        self.elements: Dict[str, ElementTree.Element] = {}
+        self.published: Dict[str, str] = {}
+        self.contents: Dict[str, str] = {}
+        self.binaries: Dict[str, str] = {}     # callback ID -> base64
+        self.calls: List[tuple] = []
+
+    def add(self, parent: Optional[str], tag: str, id: str, name: str, modified: str = '2024-01-01T10:00:00.000Z', **attributes: str) -> ElementTree.Element:
+        child = element(tag, ID=id, name=name, lastModifiedTime=modified, **attributes)
+        (self.elements[parent] if parent else self.root).append(child)
+        self.elements[id] = child
+        return child
+
+    def notebook(self, id: str, name: str, **attributes: str) -> ElementTree.Element:
+        return self.add(None, 'Notebook', id, name, **attributes)
+
+    def section(self, parent: str, id: str, name: str, **attributes: str) -> ElementTree.Element:
+        return self.add(parent, 'Section', id, name, **attributes)
+
+    def page(self, section: str, id: str, name: str, created: str = '2024-01-01T09:00:00.000Z', **attributes: str) -> ElementTree.Element:
+        return self.add(section, 'Page', id, name, dateTime=created, **attributes)
+
+    def parent(self, id: str) -> Optional[ElementTree.Element]:
+        for parent in self.root.iter():
+            if self.elements.get(id) in list(parent):
+                return parent
+        return None
+
+    def touch(self, id: str, modified: str) -> None:
+        """
+        Modify an element, and with it all elements it is within.
+        """
+        while id in self.elements:
+            self.elements[id].set('lastModifiedTime', modified)
+            id = self.parent(id).get('ID')
+
+    def remove(self, id: str, modified: str) -> None:
+        parent = self.parent(id)
+        parent.remove(self.elements.pop(id))
+        self.touch(parent.get('ID'), modified)
+
+    def copy(self, source: ElementTree.Element, depth: int, max_depth: int) -> ElementTree.Element:
+        target = ElementTree.Element(source.tag, source.attrib)
+        for child in source:
+            child_depth = DEPTHS[child.tag.rsplit('}', 1)[-1]]
+            if child_depth <= max_depth and (depth < max_depth or child_depth == depth):
+                target.append(self.copy(child, child_depth, max_depth))
+        return target
+
+    def GetHierarchy(self, start: str, scope: int, xml: str = "") -> str:
+        self.calls.append(('GetHierarchy', start, int(scope)))
+        source = self.elements[start] if start else self.root
+        depth = DEPTHS[source.tag.rsplit('}', 1)[-1]] if start else 0
+        if int(scope) == HierarchyScope.hsChildren:
+            max_depth = depth + 1
+        elif int(scope) == HierarchyScope.hsSelf:
+            max_depth = depth
+        else:
+            max_depth = SCOPE_DEPTHS[HierarchyScope(int(scope))]
+        return ElementTree.tostring(self.copy(source, depth, max_depth), encoding='unicode')
+
+    def Publish(self, id: str, path: str, format: int, xml: str = "") -> None:
+        self.calls.append(('Publish', id))
+        if id in self.published:
+            shutil.copyfile(self.published[id], path)
+            return
+        html = f'<html><body><p>{self.elements[id].get("name")}</p><p>Monday, 1 January 2024</p><p>09:00</p><p>Text</p></body></html>'
+        with open(path, 'w', encoding='utf-8', newline='') as mht_file:
+            mht_file.write('MIME-Version: 1.0\r\nContent-Type: multipart/related; boundary="B"\r\n\r\n'
+                           f'--B\r\nContent-Location: file:///C:/page.htm\r\nContent-Type: text/html; charset="utf-8"\r\n\r\n{html}\r\n--B--\r\n')
+
+    def GetPageContent(self, id: str, xml: str, page_info: int, schema: int) -> str:
+        self.calls.append(('GetPageContent', id))
+        return self.contents[id]
+
+    def GetBinaryPageContent(self, id: str, callback_id: str) -> str:
+        self.calls.append(('GetBinaryPageContent', id, callback_id))
+        return self.binaries[callback_id]
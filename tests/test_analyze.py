@@ -0,0 +1,47 @@
+# Profiling the pages, with pages that fail
+
+import os
+
+from fakeapp import FakeApp
+from onenote import analyze
+from onenote.analyze import analyze_pages_all
+from onenote.catalogue import PageCatalogue
+from onenote.onenote import ConvertOptions
+
+def make_app() -> FakeApp:
+    app = FakeApp()
+    app.notebook('{N1}', 'Work')
+    app.section('{N1}', '{S1}', 'Notes')
+    app.page('{S1}', '{P1}', 'Meeting')
+    app.page('{S1}', '{P2}', 'Broken')
+    app.page('{S1}', '{P3}', 'Plan')
+    # Publishing the page fails
+    app.published['{P2}'] = os.path.join(os.path.dirname(__file__), 'fixtures', 'missing.mht')
+    return app
+
+def analyze_app(app: FakeApp, workers: int) -> None:
+    catalogue = PageCatalogue.from_hierarchy(app)
+    analyze_pages_all(app, catalogue.labelled(catalogue.ids), ConvertOptions(workers=workers, bulk=False), catalogue=catalogue)
+
+def test_failed_pages_are_reported(capsys, monkeypatch):
+    profile_page = analyze.profile_page
+
+    def failing_profile_page(page_id, name, *args):
+        if name == 'Plan':
+            raise ValueError('cannot profile')
+        return profile_page(page_id, name, *args)
+
+    monkeypatch.setattr(analyze, 'profile_page', failing_profile_page)
+    analyze_app(make_app(), 1)
+    report = capsys.readouterr().out
+    assert report.startswith('Analysed 1 pages')
+    assert ', 2 pages failed.' in report
+    assert 'Work/Notes/Broken: FileNotFoundError' in report
+    assert "Work/Notes/Plan: ValueError('cannot profile')" in report
+
+def test_failed_pages_are_reported_with_workers(capsys):
+    analyze_app(make_app(), 2)
+    report = capsys.readouterr().out
+    assert report.startswith('Analysed 2 pages')
+    assert ', 1 pages failed.' in report
+    assert 'Work/Notes/Broken: FileNotFoundError' in report
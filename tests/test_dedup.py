@@ -0,0 +1,59 @@
+# Repeated subtrees emitted once, boilerplate dropped
+
+from itertools import count
+
+from tanatypes.dedup import Deduplicator
+from tanatypes.tif import NodeType, TanaIntermediateFile, TanaIntermediateNode, TanaIntermediateSummary
+from tanatypes.validate import TifValidator
+
+CHECKLIST = 'Check the doors, the windows, and the lights'
+
+def node(uid: str, name: str, *children: TanaIntermediateNode, refs: list = None) -> TanaIntermediateNode:
+    return TanaIntermediateNode(uid, name, '', list(children), refs, 1, 1, NodeType.NODE)
+
+def checklist(uid: str) -> TanaIntermediateNode:
+    return node(uid, CHECKLIST, node(f'{uid}.1', 'Doors'), node(f'{uid}.2', 'Windows'))
+
+def make_tif(*nodes: TanaIntermediateNode) -> TanaIntermediateFile:
+    return TanaIntermediateFile(TanaIntermediateSummary(0, 0, 0, 0, 0, 0), list(nodes))
+
+def test_first_occurrence_in_document_order_is_kept():
+    # The first checklist is deeper in the first branch than the second
+    # checklist in the second branch
+    tif = make_tif(node('page', 'Page',
+                        node('first', 'First', node('morning', 'Morning', checklist('a'))),
+                        node('second', 'Second', checklist('b'))))
+    deduplicator = Deduplicator(count(100))
+    deduplicator.run(tif)
+    first, second = tif.nodes[0].children
+    assert first.children[0].children[0].uid == 'a'
+    assert second.children[0].refs == ['a'] and second.children[0].name == '[[a]]'
+    assert deduplicator.replaced == 1
+    # Each repeat across pages refers to the first page's
+    tif = make_tif(node('page1', 'One', checklist('a')), node('page2', 'Two', checklist('b')), node('page3', 'Three', checklist('c')))
+    Deduplicator(count(100)).run(tif)
+    assert [page.children[0].refs for page in tif.nodes] == [None, ['a'], ['a']]
+
+def test_small_subtrees_and_pages_are_left_alone():
+    tif = make_tif(node('page1', 'One', node('x', 'Short')), node('page2', 'One', node('y', 'Short')))
+    deduplicator = Deduplicator(count(100), min_chars=32)
+    deduplicator.run(tif)
+    assert deduplicator.replaced == 0
+    assert [page.children[0].uid for page in tif.nodes] == ['x', 'y']
+
+def test_refs_into_a_removed_subtree_are_remapped():
+    link = node('link', '[[b.2]]', refs=['b.2'])
+    tif = make_tif(node('page1', 'One', checklist('a')), node('page2', 'Two', checklist('b'), link))
+    Deduplicator(count(100)).run(tif)
+    assert link.refs == ['a.2'] and link.name == '[[a.2]]'
+
+def test_summary_is_recomputed_by_the_validator():
+    tif = make_tif(node('page1', 'One', checklist('a')), node('page2', 'Two', checklist('b'), node('footer', 'Created with OneNote.', node('note', 'Note'))))
+    deduplicator = Deduplicator(count(100), drop=[r'^Created with OneNote\.$'])
+    deduplicator.run(tif)
+    assert deduplicator.dropped == 1
+    assert [child.name for child in tif.nodes[1].children] == ['[[a]]', 'Note']
+    # The summary is not touched, the validator counts the nodes left
+    assert tif.summary.totalNodes == 0
+    summary = TifValidator().run(tif)
+    assert (summary.topLevelNodes, summary.totalNodes, summary.brokenRefs) == (2, 7, 0)
@@ -0,0 +1,47 @@
+# Page filters on the attributes of the hierarchy
+
+from xml.etree import ElementTree
+
+from onenote.filters import PageFilter, hierarchy_time
+
+def page(name: str, created: str = '2024-01-01T09:00:00.000Z', modified: str = '2024-01-01T09:00:00.000Z', level: str = None) -> ElementTree.Element:
+    element = ElementTree.Element('Page', name=name, dateTime=created, lastModifiedTime=modified)
+    if level:
+        element.set('pageLevel', level)
+    return element
+
+def test_hierarchy_time():
+    assert hierarchy_time('2024-03-01') == '2024-03-01T00:00:00.000Z'
+    assert hierarchy_time('2024-03-01T10:30:00+02:00') == '2024-03-01T08:30:00.000Z'
+    assert hierarchy_time('2024-03-01T10:30:00Z') == '2024-03-01T10:30:00.000Z'
+
+def test_dates_since_inclusive_before_exclusive():
+    march = page('March', created='2024-03-01T00:00:00.000Z', modified='2024-06-15T12:00:00.000Z')
+    assert PageFilter(created_since=hierarchy_time('2024-03-01')).matches(march)
+    assert not PageFilter(created_since=hierarchy_time('2024-03-02')).matches(march)
+    assert PageFilter(created_before=hierarchy_time('2024-03-02')).matches(march)
+    assert not PageFilter(created_before=hierarchy_time('2024-03-01')).matches(march)
+    assert PageFilter(modified_since=hierarchy_time('2024-06-01'), modified_before=hierarchy_time('2024-07-01')).matches(march)
+    assert not PageFilter(modified_since=hierarchy_time('2024-06-16')).matches(march)
+    assert not PageFilter(modified_before=hierarchy_time('2024-06-15T12:00:00Z')).matches(march)
+
+def test_max_level():
+    top, sub, subsub = page('Top'), page('Sub', level='2'), page('Subsub', level='3')
+    assert [PageFilter(max_level=1).matches(element) for element in (top, sub, subsub)] == [True, False, False]
+    assert [PageFilter(max_level=2).matches(element) for element in (top, sub, subsub)] == [True, True, False]
+    assert [PageFilter().matches(element) for element in (top, sub, subsub)] == [True, True, True]
+
+def test_paths_and_exclude():
+    meeting = page('Meeting')
+    assert PageFilter(paths=['Work/Notes']).matches(meeting, 'Work/Notes')
+    assert not PageFilter(paths=['Home']).matches(meeting, 'Work/Notes')
+    # Globs match the whole path, regular expressions anywhere
+    assert PageFilter(paths=['Work/*/Meeting']).matches(meeting, 'Work/Projects/Notes')
+    assert not PageFilter(paths=['Work/*']).matches(meeting, 'Home/Work')
+    assert PageFilter(paths=['re:^Work/.*/Meet']).matches(meeting, 'Work/Projects/Notes')
+    # Excluding wins over selecting
+    assert not PageFilter(paths=['Work'], exclude=['Archive']).matches(meeting, 'Work/Archive')
+    assert PageFilter(paths=['Work'], exclude=['Archive']).matches(meeting, 'Work/Notes')
+    # Without the section path, the page name alone
+    assert PageFilter(exclude=['Plan']).matches(meeting)
+    assert not PageFilter(exclude=['Meet*']).matches(meeting)
@@ -0,0 +1,51 @@
+# Page fragments written by separate runs, assembled into one TIF
+
+from onenote.convert import convert_page, supertag_tbl
+from onenote.fragments import FragmentStore, assemble_fragments, read_fragments
+from onenote.onenote import OneNotePageData
+
+ALPHA = '{AAAAAAAA-0000-4000-8000-000000000001}{1}{E1}'
+GAMMA = '{CCCCCCCC-0000-4000-8000-000000000003}{1}{E1}'
+BETA = '{BBBBBBBB-0000-4000-8000-000000000002}{1}{E1}'
+LINK = 'onenote:Notes.one#Beta&section-id={D1E2F3A4-B5C6-4D7E-8F90-A1B2C3D4E5F6}&page-id={BBBBBBBB-0000-4000-8000-000000000002}&end'
+TABLE = '<table><tr><td>Name</td><td>Value</td></tr><tr><td>Size</td><td>42</td></tr></table>'
+
+def fragment(page_id: str, title: str, order: int, *paragraphs: str, table: str = '', parent_id: str = None):
+    body = ''.join(f'<p>{paragraph}</p>' for paragraph in (title, 'Monday, January 1, 2024', '9:00 AM') + paragraphs)
+    page_data = OneNotePageData('Work', 'Notes', title, '2024-01-01T09:00:00.000Z', '2024-01-01T09:00:00.000Z', parent_id is not None,
+                                f'<html><body><div>{body}{table}</div></body></html>', {}, page_id)
+    page_fragment = convert_page(page_data)
+    page_fragment.order = order
+    page_fragment.parent_id = parent_id
+    return page_fragment
+
+def test_fragments_of_two_runs_assemble_with_links_and_subpages(tmp_path):
+    first_run = FragmentStore(str(tmp_path / 'first'))
+    first_run.write(fragment(ALPHA, 'Alpha', 0, 'Intro', f'<a href="{LINK}">see Beta</a>'))
+    first_run.write(fragment(GAMMA, 'Gamma', 1, 'Details', parent_id=ALPHA))
+    second_run = FragmentStore(str(tmp_path / 'second'))
+    second_run.write(fragment(BETA, 'Beta', 2, 'Numbers', table=TABLE))
+    # The other run had a uid of its own for the table supertag
+    path = second_run.path(BETA)
+    with open(path, encoding='utf-8') as fragment_file:
+        text = fragment_file.read()
+    assert supertag_tbl.uid in text
+    with open(path, 'w', encoding='utf-8') as fragment_file:
+        fragment_file.write(text.replace(supertag_tbl.uid, 'other-run-table'))
+
+    fragments = list(read_fragments([first_run.directory, second_run.directory]))
+    assert [page_fragment.page_id for page_fragment in fragments] == [ALPHA, GAMMA, BETA]
+    tif = assemble_fragments(fragments, [supertag_tbl])
+
+    alpha, beta = tif.nodes
+    assert (alpha.name, beta.name) == ('Alpha', 'Beta')
+    # The subpage is attached to the last child of its superpage
+    intro, link = alpha.children
+    assert [node.name for node in link.children] == ['Gamma']
+    # The link read back from the fragment resolves to the page of the other run
+    assert link.name == f'[see Beta]([[{beta.uid}]])' and link.refs == [beta.uid]
+    assert tif.summary.brokenRefs == 0
+    # The table supertag of both runs is one
+    table = beta.children[-1]
+    assert table.supertags == [supertag_tbl.uid]
+    assert [supertag.name for supertag in tif.supertags] == [supertag_tbl.name]
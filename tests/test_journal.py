@@ -0,0 +1,73 @@
+# Resuming an interrupted run from its journal
+
+import json
+import os
+
+from fakeapp import FIXTURES, FakeApp
+from onenote.catalogue import PageCatalogue
+from onenote.convert import convert_pages_all
+from onenote.fragments import Journal
+from onenote.onenote import ConvertOptions
+from tanatypes.tif import TanaIntermediateSupertag
+from utilities.utils import safe_str
+
+def make_app() -> FakeApp:
+    app = FakeApp()
+    app.notebook('{N1}', 'Work')
+    app.section('{N1}', '{S1}', 'Notes')
+    app.page('{S1}', '{P1}', 'Meeting')
+    app.page('{S1}', '{P2}', 'Plan')
+    app.page('{S1}', '{P3}', 'Broken')
+    # Publishing the page fails
+    app.published['{P3}'] = os.path.join(FIXTURES, 'missing.mht')
+    return app
+
+def convert(app: FakeApp, outfile: str, resume: bool) -> list:
+    """
+    Convert all pages, return the pages published.
+    """
+    catalogue = PageCatalogue.from_hierarchy(app)
+    app.calls.clear()
+    convert_pages_all(app, catalogue.labelled(catalogue.ids), ConvertOptions(outfile, resume=resume, bulk=False), catalogue)
+    return [call[1] for call in app.calls if call[0] == 'Publish']
+
+def test_interrupted_journal_is_resumed(tmp_path):
+    app = make_app()
+    outfile = str(tmp_path / 'out.json')
+    journal_path = f'{outfile}.journal'
+    # The failed page is published again for the quarantine
+    assert convert(app, outfile, False) == ['{P1}', '{P2}', '{P3}', '{P3}']
+    assert os.listdir(f'{outfile}.quarantine') == [f'{safe_str("{P3}")}.txt']
+    journal = Journal(journal_path, [], resume=True)
+    journal.close()
+    assert list(journal.fragments) == ['{P1}', '{P2}'] and list(journal.failures) == ['{P3}']
+
+    # Interrupted while writing the last entry
+    with open(journal_path, 'rb') as journal_file:
+        lines = journal_file.readlines()
+    with open(journal_path, 'wb') as journal_file:
+        journal_file.writelines(lines[:-1])
+        journal_file.write(lines[-1][:len(lines[-1]) // 2])
+
+    # The first entry of the resumed run is journaled on a line of its own
+    assert convert(app, outfile, True) == ['{P3}', '{P3}']
+    journal = Journal(journal_path, [], resume=True)
+    journal.close()
+    assert list(journal.fragments) == ['{P1}', '{P2}'] and list(journal.failures) == ['{P3}']
+
+    # Once no page fails, the output is complete and the journal removed
+    del app.published['{P3}']
+    assert convert(app, outfile, True) == ['{P3}']
+    assert not os.path.exists(journal_path)
+    with open(outfile, encoding='utf-8') as tif_file:
+        assert [node['name'] for node in json.load(tif_file)['nodes']] == ['Meeting', 'Plan', 'Broken']
+
+def test_journaled_supertags_are_returned_not_applied(tmp_path):
+    journal_path = str(tmp_path / 'out.json.journal')
+    journal = Journal(journal_path, [TanaIntermediateSupertag('111', 'Table')])
+    journal.close()
+    supertag = TanaIntermediateSupertag('222', 'Table')
+    journal = Journal(journal_path, [supertag], resume=True)
+    journal.close()
+    assert journal.supertag_uids == {'Table': '111'}
+    assert supertag.uid == '222'
@@ -0,0 +1,55 @@
+# Links to a page and to a heading, with either engine
+
+import os
+
+from fakeapp import FIXTURES
+from onenote.convert import convert_page
+from onenote.links import LinkIndex
+from onenote.onenote import OneNotePageData
+
+TARGET_ID = '{8B1A0C3E-5D2F-4F6A-9C7B-1E2D3F4A5B6C}{1}{E19551201234567890123456789012345678901}'
+SOURCE_ID = '{9C2B1D4F-6E3A-4A7B-8D8C-2F3E4A5B6C7D}{1}{E19551201234567890123456789012345678902}'
+TARGET = 'section-id={D1E2F3A4-B5C6-4D7E-8F90-A1B2C3D4E5F6}&page-id={8B1A0C3E-5D2F-4F6A-9C7B-1E2D3F4A5B6C}'
+PAGE_LINK = f'onenote:Notes.one#Project%20kickoff&{TARGET}&end'
+HEADING_LINK = f'onenote:Notes.one#Project%20kickoff&{TARGET}&object-id={{11111111-2222-4333-8444-555555555555}}&21&end'
+HEADING_ONLY_LINK = 'onenote:Notes.one#Project%20kickoff&object-id={11111111-2222-4333-8444-555555555555}&21&end'
+
+def html_page(title: str, *paragraphs: str) -> str:
+    body = ''.join(f'<p>{paragraph}</p>' for paragraph in (title, 'Monday, January 1, 2024', '9:00 AM') + paragraphs)
+    return f'<html><body><div>{body}</div></body></html>'
+
+def source_page() -> OneNotePageData:
+    html = html_page('Links', f'<a href="{PAGE_LINK}">kickoff</a>', f'<a href="{HEADING_LINK}">goals</a>',
+                     f'<a href="{HEADING_ONLY_LINK}">goals alone</a>')
+    return OneNotePageData('Work', 'Notes', 'Links', '2024-01-01T09:00:00.000Z', '2024-01-01T09:00:00.000Z', False, html, {}, SOURCE_ID)
+
+def target_page(engine: str) -> OneNotePageData:
+    if engine == 'xml':
+        with open(os.path.join(FIXTURES, 'page.xml'), encoding='utf-8') as xml_file:
+            xml_string = xml_file.read()
+        return OneNotePageData('Work', 'Notes', 'Project kickoff', '2024-01-01T09:00:00.000Z', '2024-01-02T10:00:00.000Z', False,
+                               None, {}, TARGET_ID, xml_string=xml_string)
+    html = html_page('Project kickoff', 'Goals', 'Write the plan')
+    return OneNotePageData('Work', 'Notes', 'Project kickoff', '2024-01-01T09:00:00.000Z', '2024-01-02T10:00:00.000Z', False, html, {}, TARGET_ID)
+
+def resolve(engine: str) -> tuple:
+    index = LinkIndex()
+    source = convert_page(source_page())
+    target = convert_page(target_page(engine))
+    for fragment in (source, target):
+        index.add(fragment.anchors, fragment.links)
+    broken = index.resolve()
+    return [node.refs for node in source.nodes[0].children], target.nodes[0], broken
+
+def test_links_with_the_mht_engine():
+    # The published HTML does not identify the headings: links to a
+    # heading resolve to its page, if they name the page
+    refs, page, broken = resolve('mht')
+    assert refs == [[page.uid], [page.uid], []]
+    assert broken == 1
+
+def test_links_with_the_xml_engine():
+    refs, page, broken = resolve('xml')
+    goals = page.children[0]
+    assert refs == [[page.uid], [goals.uid], [goals.uid]]
+    assert broken == 0
@@ -0,0 +1,113 @@
+# Splitting a section published as a whole, against its pages published alone
+
+import os
+
+from fakeapp import FIXTURES, FakeApp
+from onenote import bulk as bulk_module
+from onenote.bulk import BulkPublisher
+from onenote.catalogue import PageCatalogue
+from onenote.convert import convert_page
+from onenote.onenote import OneNotePageData
+from onenote.pages import process_page
+from tanatypes.tif import NodeType
+from utilities.images import ImageStore
+from utilities.mht import extract_mht_contents, split_mht_pages
+
+PAGES = [('{P1}', 'Meeting'), ('{P2}', 'Plan'), ('{P3}', 'Old notes')]
+
+def fixture(name: str) -> str:
+    return os.path.join(FIXTURES, name)
+
+def shape(node) -> tuple:
+    """
+    A node without its uids and times, to compare conversions. Images are
+    numbered within the MHT, so they are compared by their media URL only.
+    """
+    return (node.name if node.type != NodeType.IMAGE else None, node.description, node.type, node.mediaUrl, node.todoState, [shape(child) for child in node.children or []])
+
+def media_urls(shapes: list) -> list:
+    return [url for _, _, _, url, _, children in shapes for url in ([url] if url else []) + media_urls(children)]
+
+def converted(html: str, images: dict) -> list:
+    page_data = OneNotePageData('Work', 'Notes', '', '2024-01-01T09:00:00.000Z', '2024-01-01T09:00:00.000Z', False, html, images)
+    return [shape(node) for node in convert_page(page_data).nodes]
+
+def make_app() -> FakeApp:
+    app = FakeApp()
+    app.notebook('{N1}', 'Work')
+    app.section('{N1}', '{S1}', 'Notes')
+    for index, (page_id, name) in enumerate(PAGES, 1):
+        app.page('{S1}', page_id, name)
+        app.published[page_id] = fixture(f'page{index}.mht')
+    app.published['{S1}'] = fixture('section.mht')
+    return app
+
+def test_split_matches_pages_published_alone(tmp_path):
+    image_store = ImageStore(str(tmp_path / 'images'))
+    images = {}
+    htmls = list(split_mht_pages(fixture('section.mht'), images, image_store))
+    # The table of contents is left out
+    assert len(htmls) == len(PAGES)
+    assert sorted(images) == ['Notes_files/image001.png', 'Notes_files/image002.png']
+    for index, html in enumerate(htmls, 1):
+        page_html, page_images = extract_mht_contents(fixture(f'page{index}.mht'), image_store)
+        assert converted(html, images) == converted(page_html, page_images)
+        assert len(media_urls(converted(html, images))) == len(page_images)
+    # The images of the section are those of the pages
+    assert image_store.stored == 2 and image_store.deduplicated == 2
+
+def test_bulk_publisher_matches_process_page(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_module, 'BULK_MIN_PAGES', len(PAGES))
+    app = make_app()
+    catalogue = PageCatalogue.from_hierarchy(app)
+    image_store = ImageStore(str(tmp_path / 'images'))
+    pages = [catalogue[page_id].page for page_id, _ in PAGES]
+    # No pending HTML in memory, all of it goes to files
+    bulk = BulkPublisher(app, str(tmp_path), catalogue, pages, image_store, pending_bytes=0)
+    app.calls.clear()
+    bulk_pages = [bulk.publish(page) for page in pages]
+    assert app.calls == [('Publish', '{S1}')]
+    assert not bulk.pending and not bulk.spilled and bulk.pending_used == 0
+    assert sorted(os.listdir(tmp_path)) == ['images']
+    for page, page_data in zip(pages, bulk_pages):
+        alone = process_page(app, str(tmp_path), page, image_store, catalogue)
+        assert (page_data.pageName, page_data.createdAt, page_data.mhtSize) == (alone.pageName, alone.createdAt, len(page_data.html_string.encode('utf-8')))
+        assert converted(page_data.html_string, page_data.images) == converted(alone.html_string, alone.images)
+
+def test_pending_pages_within_the_bound(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_module, 'BULK_MIN_PAGES', len(PAGES))
+    app = make_app()
+    catalogue = PageCatalogue.from_hierarchy(app)
+    pages = [catalogue[page_id].page for page_id, _ in PAGES]
+    html_bytes = [len(html.encode('utf-8')) for html in split_mht_pages(fixture('section.mht'), {})]
+    bulk = BulkPublisher(app, str(tmp_path), catalogue, pages, pending_bytes=html_bytes[1])
+    first = bulk.publish(pages[0])
+    # The second page fits in memory, the third does not
+    assert list(bulk.pending) == ['{P2}', '{P3}'] and list(bulk.spilled) == ['{P3}']
+    assert bulk.pending_used == html_bytes[1]
+    rest = [bulk.publish(page) for page in pages[1:]]
+    assert [len(page_data.html_string.encode('utf-8')) for page_data in [first] + rest] == html_bytes
+    assert not os.listdir(tmp_path)
+
+def test_pages_are_matched_by_title(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_module, 'BULK_MIN_PAGES', len(PAGES))
+    app = FakeApp()
+    app.notebook('{N1}', 'Work')
+    app.section('{N1}', '{S1}', 'Notes')
+    # The hierarchy lists the pages in another order than the section's
+    # MHT, and a page the MHT does not hold
+    for page_id, name in [('{P2}', 'Plan'), ('{P4}', 'Agenda'), ('{P1}', 'Meeting'), ('{P3}', 'Old notes')]:
+        app.page('{S1}', page_id, name)
+    app.published['{S1}'] = fixture('section.mht')
+    catalogue = PageCatalogue.from_hierarchy(app)
+    pages = [catalogue[page_id].page for page_id in catalogue.ids]
+    bulk = BulkPublisher(app, str(tmp_path), catalogue, pages)
+    app.calls.clear()
+    bulk_pages = {page.get('ID'): bulk.publish(page) for page in pages}
+    # The page not matched is published alone
+    assert app.calls == [('Publish', '{S1}'), ('Publish', '{P4}')]
+    htmls = list(split_mht_pages(fixture('section.mht'), {}))
+    for index, (page_id, name) in enumerate(PAGES):
+        assert bulk_pages[page_id].pageName == name
+        assert bulk_pages[page_id].html_string == htmls[index]
+    assert bulk_pages['{P4}'].pageName == 'Agenda'
@@ -0,0 +1,70 @@
+# Conversion of a page from its saved OneNote page XML
+
+import os
+
+from fakeapp import FIXTURES
+from onenote.convert import convert_page
+from onenote.links import LinkIndex
+from onenote.onenote import OneNotePageData
+from tanatypes.tif import NodeType
+
+PAGE_ID = '{8B1A0C3E-5D2F-4F6A-9C7B-1E2D3F4A5B6C}{1}{E19551201234567890123456789012345678901}'
+IMAGE = '{C0FFEE00-0000-4000-8000-000000000001}{1}{B0}'
+
+def convert_fixture():
+    with open(os.path.join(FIXTURES, 'page.xml'), encoding='utf-8') as xml_file:
+        xml_string = xml_file.read()
+    page_data = OneNotePageData('Work', 'Notes', 'Project kickoff', '2024-01-01T09:00:00.000Z', '2024-01-02T10:00:00.000Z', False,
+                                None, {IMAGE: 'https://example.com/images/kickoff.png'}, PAGE_ID, xml_string=xml_string)
+    return convert_page(page_data)
+
+def names(nodes) -> list:
+    return [node.name for node in nodes]
+
+def test_title_and_headings():
+    fragment = convert_fixture()
+    assert len(fragment.nodes) == 1
+    page = fragment.nodes[0]
+    assert page.name == 'Project <b>kickoff</b>'
+    assert page.description.startswith('Monday, 01 January 2024')
+    # The outline elements following a heading become its children
+    assert names(page.children) == ['Goals', 'Schedule', 'image001.png']
+    goals, schedule, _ = page.children
+    assert names(goals.children) == ['Write the plan', 'Book a room', 'Budget is fixed']
+    assert schedule.children[-1].name.startswith('See [the goals](onenote:')
+
+def test_indentation_and_tags():
+    fragment = convert_fixture()
+    plan, room, budget = fragment.nodes[0].children[0].children
+    assert names(plan.children) == ['Ask <i>the team</i>']
+    assert (plan.todoState, room.todoState, budget.todoState) == ('todo', 'done', None)
+    important = next(supertag for supertag in fragment.supertags if supertag['name'] == 'Important')
+    assert budget.supertags == [important['uid']]
+    assert plan.supertags is None
+
+def test_table_and_image():
+    fragment = convert_fixture()
+    page = fragment.nodes[0]
+    table = page.children[1].children[0]
+    table_supertag = next(supertag for supertag in fragment.supertags if supertag['uid'] in (table.supertags or []))
+    assert table_supertag['name'].startswith('Table')
+    assert names(table.children) == ['1']
+    assert table.children[0].children[0].type == NodeType.FIELD
+    assert names(table.children[0].children[0].children) == ['<b>Kickoff</b>']
+    assert [attribute['name'] for attribute in fragment.attributes] == ['Task']
+    image = page.children[2]
+    assert image.type == NodeType.IMAGE
+    assert image.mediaUrl == 'https://example.com/images/kickoff.png'
+
+def test_links_resolve_to_headings():
+    fragment = convert_fixture()
+    page = fragment.nodes[0]
+    goals = page.children[0]
+    assert fragment.anchors['{8B1A0C3E-5D2F-4F6A-9C7B-1E2D3F4A5B6C}'] == page.uid
+    assert fragment.anchors['{11111111-2222-4333-8444-555555555555}&21'] == goals.uid
+    index = LinkIndex()
+    index.add(fragment.anchors, fragment.links)
+    assert index.resolve() == 0
+    link = page.children[1].children[-1]
+    assert link.name == f'See [the goals]([[{goals.uid}]])'
+    assert link.refs == [goals.uid]
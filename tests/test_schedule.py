@@ -0,0 +1,64 @@
+# Longest processing time first, and the conversion in worker processes
+
+import json
+from xml.etree import ElementTree
+
+from onenote.convert import convert_in_workers
+from onenote.onenote import OneNotePageData
+from onenote.schedule import CostModel, lpt_order, makespan
+
+def test_lpt_order_keeps_ties_in_order():
+    costs = {'a': 1.0, 'b': 3.0, 'c': 1.0, 'd': 2.0, 'e': 3.0}
+    assert lpt_order(list(costs), costs.get) == ['b', 'e', 'd', 'a', 'c']
+
+def test_makespan():
+    assert makespan([], 2) == 0.0
+    assert makespan([1.0, 1.0, 1.0, 1.0], 2) == 2.0
+    # A big job last holds up the end, first it does not
+    assert makespan([1.0, 1.0, 1.0, 1.0, 4.0], 2) == 6.0
+    assert makespan(sorted([1.0, 1.0, 1.0, 1.0, 4.0], reverse=True), 2) == 4.0
+    assert makespan([2.0, 3.0], 4) == 3.0
+
+def test_cost_model_estimates(tmp_path):
+    path = tmp_path / 'stats.json'
+    path.write_text(json.dumps({'{P1}': [2.0, 1000], '{P2}': [1.0, 3000]}), encoding='utf-8')
+    cost_model = CostModel(str(path))
+    assert cost_model.estimate(ElementTree.Element('Page', ID='{P1}')) == 2.0
+    # Unknown pages by their size, else the mean time
+    assert cost_model.estimate(ElementTree.Element('Page', ID='{P9}'), 500) == 500 * 3.0 / 4000
+    assert cost_model.estimate(ElementTree.Element('Page', ID='{P9}')) == 1.5
+    assert (cost_model.mht_bytes('{P2}'), cost_model.mht_bytes('{P9}')) == (3000, None)
+
+def test_convert_in_two_workers(tmp_path):
+    pages = [ElementTree.Element('Page', ID=f'{{P{index}}}', name=f'Page {index}') for index in range(1, 6)]
+    path = tmp_path / 'stats.json'
+    path.write_text(json.dumps({'{P4}': [9.0, 100], '{P2}': [5.0, 100], '{P5}': [0.1, 100]}), encoding='utf-8')
+    published = []
+    done = {}
+    failed = []
+
+    def publish(page):
+        published.append(page.get('ID'))
+        if page.get('ID') == '{P3}':
+            raise OSError('Publish failed')
+        body = ''.join(f'<p>{text}</p>' for text in (page.get('name'), 'Monday, January 1, 2024', '9:00 AM', 'Text'))
+        return OneNotePageData('Work', 'Notes', page.get('name'), '2024-01-01T09:00:00.000Z', '2024-01-01T09:00:00.000Z', False,
+                               f'<html><body><div>{body}</div></body></html>', {}, page.get('ID'), len(body))
+
+    def page_done(page, page_data, fragment, seconds):
+        # Only a copy of the page data without its contents is kept
+        assert page_data.html_string is None
+        done[page.get('ID')] = fragment
+
+    def page_failed(page, error, page_data=None):
+        failed.append((page.get('ID'), str(error), page_data))
+
+    convert_in_workers(pages, 2, publish, CostModel(str(path)), None, 'plain', page_done, page_failed)
+    # Longest estimated first, unknown pages taking the mean time
+    assert published == ['{P4}', '{P2}', '{P1}', '{P3}', '{P5}']
+    assert failed == [('{P3}', 'Publish failed', None)]
+    assert sorted(done) == ['{P1}', '{P2}', '{P4}', '{P5}']
+    assert [done[page_id].nodes[0].name for page_id in sorted(done)] == ['Page 1', 'Page 2', 'Page 4', 'Page 5']
+    # The workers hand out distinct uids
+    uids = [node.uid for fragment in done.values() for node in fragment.nodes + fragment.nodes[0].children]
+    assert len(set(uids)) == len(uids)
@@ -0,0 +1,73 @@
+# Selection of pages by notebook, section, and page
+
+from xml.etree import ElementTree
+
+from fakeapp import FakeApp
+from onenote.catalogue import PageCatalogue
+from onenote.notebooks import find_notebooks
+from onenote.onenote import HierarchyScope
+from onenote.pages import find_pages, get_pages
+from onenote.sections import find_sections, get_sections
+
+def make_app() -> FakeApp:
+    """
+    Two notebooks with a "Notes" section each. "Meeting" is the name of
+    two pages in one section and of one more in another notebook.
+    """
+    app = FakeApp()
+    app.notebook('{N1}', 'Work')
+    app.section('{N1}', '{S1}', 'Notes')
+    app.page('{S1}', '{P1}', 'Meeting')
+    app.page('{S1}', '{P2}', 'Meeting')
+    app.page('{S1}', '{P3}', 'Plan')
+    app.section('{N1}', '{S2}', 'Archive')
+    app.page('{S2}', '{P4}', 'Old')
+    app.notebook('{N2}', 'Home')
+    app.section('{N2}', '{S3}', 'Notes')
+    app.page('{S3}', '{P5}', 'Meeting')
+    return app
+
+def page_ids(pages: dict) -> list:
+    return [page.get('ID') for page in pages.values()]
+
+def notebooks_of(app: FakeApp) -> ElementTree.Element:
+    return ElementTree.fromstring(app.GetHierarchy('', HierarchyScope.hsNotebooks))
+
+def test_find_notebooks_keeps_pages_sharing_a_name():
+    app = make_app()
+    pages, notebooks = find_notebooks(app, notebooks_of(app), '')
+    assert list(notebooks) == ['Work', 'Home']
+    assert page_ids(pages) == ['{P1}', '{P2}', '{P3}', '{P4}', '{P5}']
+    assert len(set(pages)) == 5
+    assert 'Plan' in pages
+
+def test_find_notebooks_uses_a_single_hierarchy_call():
+    app = make_app()
+    elements = notebooks_of(app)
+    app.calls.clear()
+    pages, _ = find_notebooks(app, elements, 'Work')
+    assert page_ids(pages) == ['{P1}', '{P2}', '{P3}', '{P4}']
+    assert app.calls == [('GetHierarchy', '', HierarchyScope.hsPages)]
+
+def test_find_sections_keeps_sections_and_pages_sharing_a_name():
+    app = make_app()
+    catalogue = PageCatalogue.from_hierarchy(app)
+    notebooks = {notebook.get('name'): notebook for notebook in notebooks_of(app)}
+    pages, sections = find_sections(app, notebooks, 'Notes', catalogue)
+    assert [section.get('ID') for section in sections.values()] == ['{S1}', '{S3}']
+    assert page_ids(pages) == ['{P1}', '{P2}', '{P3}', '{P5}']
+
+def test_find_pages_keeps_pages_sharing_a_name():
+    app = make_app()
+    pages = find_pages(app, notebooks_of(app), ['Meeting'])
+    assert page_ids(pages) == ['{P1}', '{P2}', '{P5}']
+    assert 'Meeting (Home/Notes)' in pages
+
+def test_interactive_selection_keeps_pages_sharing_a_name():
+    app = make_app()
+    notebooks = {notebook.get('name'): notebook for notebook in notebooks_of(app)}
+    sections = get_sections(app, notebooks)
+    assert list(sections) == ['Notes (Work)', 'Archive', 'Notes (Home)']
+    pages = get_pages(app, sections.values())
+    assert page_ids(pages) == ['{P1}', '{P2}', '{P3}', '{P4}', '{P5}']
+    assert len(set(pages)) == 5
@@ -0,0 +1,95 @@
+# Accounting of the space taken by the published pages
+
+import errno
+import json
+import os
+
+import pytest
+
+from fakeapp import FakeApp
+from onenote.catalogue import PageCatalogue
+from onenote.convert import convert_pages_all
+from onenote.onenote import ConvertOptions
+from utilities.storage import TempStorage
+from utilities.utils import safe_str
+
+def publish(storage: TempStorage, name: str, size: int, expected: int = None) -> str:
+    path = storage.acquire(name, expected)
+    with open(path, 'wb') as mht_file:
+        mht_file.write(b'x' * size)
+    storage.published(path)
+    return path
+
+def test_known_size_over_the_quota_fails_at_once(tmp_path):
+    storage = TempStorage(str(tmp_path), quota=1000)
+    storage.expect('big', 1500)
+    with pytest.raises(OSError) as raised:
+        storage.acquire('big')
+    assert raised.value.errno == errno.ENOSPC
+    storage.expect('small', 300)
+    small = publish(storage, 'small', 300)
+    storage.release(small)
+    assert storage.used == 0 and storage.peak == 300
+    assert not os.listdir(tmp_path)
+
+def test_unknown_size_over_the_quota_fails_once_written(tmp_path):
+    storage = TempStorage(str(tmp_path), quota=1000)
+    path = storage.acquire('big')
+    with open(path, 'wb') as mht_file:
+        mht_file.write(b'x' * 1500)
+    with pytest.raises(OSError) as raised:
+        storage.published(path)
+    assert raised.value.errno == errno.ENOSPC
+    storage.release(path)
+    assert storage.used == 0 and not os.listdir(tmp_path)
+
+def test_large_page_does_not_refuse_the_pages_after_it(tmp_path):
+    storage = TempStorage(str(tmp_path), quota=1000)
+    path = storage.acquire('big')
+    with open(path, 'wb') as mht_file:
+        mht_file.write(b'x' * 1500)
+    with pytest.raises(OSError):
+        storage.published(path)
+    storage.release(path)
+    # The mean size so far is above the quota, but only a guess
+    for name in ('a', 'b', 'c'):
+        storage.release(publish(storage, name, 300))
+    assert storage.published_count == 4 and storage.used == 0
+
+def test_ram_directory_by_expected_size(tmp_path):
+    ram = tmp_path / 'ram'
+    ram.mkdir()
+    storage = TempStorage(str(tmp_path), ram_directory=str(ram), ram_quota=1000)
+    # Nothing is known of the first page
+    assert storage.acquire('unknown').startswith(str(tmp_path / 'unknown'))
+    storage.expect('big', 2000)
+    assert not storage.acquire('big').startswith(storage.ram_directory)
+    fits = publish(storage, 'fits', 800, expected=800)
+    assert fits.startswith(storage.ram_directory)
+    assert not storage.acquire('more', 400).startswith(storage.ram_directory)
+    # Of unknown size, guessed as the mean size so far
+    assert not storage.acquire('guess').startswith(storage.ram_directory)
+    storage.release(fits)
+    assert storage.acquire('more', 400).startswith(storage.ram_directory)
+    assert storage.acquire('guess').startswith(storage.ram_directory)
+    storage.cleanup()
+    assert not os.listdir(ram)
+
+def test_refused_page_is_not_published_again(tmp_path):
+    app = FakeApp()
+    app.notebook('{N1}', 'Work')
+    app.section('{N1}', '{S1}', 'Notes')
+    app.page('{S1}', '{P1}', 'Meeting')
+    app.page('{S1}', '{P2}', 'Scan')
+    app.page('{S1}', '{P3}', 'Plan')
+    large = tmp_path / 'large.mht'
+    large.write_bytes(b'x' * (2 * 1024 * 1024))
+    app.published['{P2}'] = str(large)
+    catalogue = PageCatalogue.from_hierarchy(app)
+    outfile = str(tmp_path / 'out.json')
+    convert_pages_all(app, catalogue.labelled(catalogue.ids), ConvertOptions(outfile, temp_quota_mb=1, temp_dir=str(tmp_path), bulk=False), catalogue)
+    assert [call for call in app.calls if call[0] == 'Publish'] == [('Publish', '{P1}'), ('Publish', '{P2}'), ('Publish', '{P3}')]
+    quarantine = os.listdir(f'{outfile}.quarantine')
+    assert quarantine == [f'{safe_str("{P2}")}.txt']
+    with open(outfile, encoding='utf-8') as tif_file:
+        assert [node['name'] for node in json.load(tif_file)['nodes']] == ['Meeting', 'Plan']
@@ -0,0 +1,47 @@
+# The summary recomputed from the nodes, and the problems found
+
+import logging
+
+from tanatypes.tif import NodeType, TanaIntermediateAttribute, TanaIntermediateFile, TanaIntermediateNode, TanaIntermediateSummary, TanaIntermediateSupertag
+from tanatypes.validate import TifValidator
+
+def node(uid: str, name: str, *children: TanaIntermediateNode, type: NodeType = NodeType.NODE, **attributes) -> TanaIntermediateNode:
+    return TanaIntermediateNode(uid, name, '', list(children), createdAt=1, editedAt=1, type=type, **attributes)
+
+def make_tif() -> TanaIntermediateFile:
+    page = node('page', 'Page',
+                node('task', 'Task', node('status', 'Status', node('open', 'Open'), type=NodeType.FIELD)),
+                node('date', '2024-01-01', type=NodeType.DATE),
+                node('ref', '[[task]]', refs=['task']),
+                node('gone', '[[missing]]', refs=['missing']),
+                node('link', 'See [Plan](onenote:Notes.one#Plan&page-id={P2}&end)'),
+                node('tagged', 'Tagged', supertags=['tbl', 'unknown']))
+    other = node('other', 'Other', node('status', 'Status', type=NodeType.FIELD), node('priority', 'Priority', type=NodeType.FIELD))
+    # The summary handed in is off, it is replaced
+    return TanaIntermediateFile(TanaIntermediateSummary(99, 99, 99, 99, 99, 99), [page, other],
+                                [TanaIntermediateAttribute('Status', [], 0), {'name': 'Location', 'values': [], 'count': 5}],
+                                [TanaIntermediateSupertag('tbl', 'Table')])
+
+def test_summary_is_recomputed():
+    tif = make_tif()
+    summary = TifValidator().run(tif)
+    assert tif.summary is summary
+    # Fields are counted apart from the nodes
+    assert (summary.topLevelNodes, summary.totalNodes, summary.leafNodes) == (2, 9, 7)
+    assert (summary.calendarNodes, summary.fields) == (1, 3)
+    # A ref to a missing node and a link left to OneNote
+    assert summary.brokenRefs == 2
+    assert [attribute.count if isinstance(attribute, TanaIntermediateAttribute) else attribute['count'] for attribute in tif.attributes] == [2, 0]
+
+def test_problems_are_reported(caplog):
+    validator = TifValidator()
+    validator.run(make_tif())
+    assert sorted(validator.problems) == ['Broken ref missing of node gone', 'Duplicate uid status: "Status"',
+                                          'Field "Priority" has no attribute', 'Unknown supertag unknown of node tagged']
+    # Beyond the limit problems are only counted
+    validator = TifValidator(limit=3)
+    validator.run(make_tif())
+    assert (len(validator.problems), validator.problem_count) == (3, 4)
+    with caplog.at_level(logging.WARNING, logger='onenote-to-tana'):
+        validator.report()
+    assert [record.getMessage() for record in caplog.records][-1] == 'TIF: 1 more problems.'
@@ -0,0 +1,98 @@
+# Finding the changed pages by their lastModifiedTime
+
+from fakeapp import FakeApp
+from onenote.filters import PageFilter
+from onenote.onenote import ConvertOptions, HierarchyScope
+from onenote.watch import HierarchyWatcher, select_changes
+
+def make_app() -> FakeApp:
+    app = FakeApp()
+    app.notebook('{N1}', 'Work')
+    app.section('{N1}', '{S1}', 'Notes')
+    app.page('{S1}', '{P1}', 'Meeting')
+    app.page('{S1}', '{P2}', 'Plan')
+    app.section('{N1}', '{S2}', 'Archive')
+    app.page('{S2}', '{P3}', 'Old')
+    app.notebook('{N2}', 'Home')
+    app.section('{N2}', '{S3}', 'Garden')
+    app.page('{S3}', '{P4}', 'Seeds')
+    return app
+
+def hierarchy_calls(app: FakeApp) -> list:
+    calls = [(start, scope) for name, start, scope in app.calls if name == 'GetHierarchy']
+    app.calls.clear()
+    return calls
+
+def test_first_poll_takes_stock():
+    app = make_app()
+    watcher = HierarchyWatcher(app)
+    catalogue = watcher.poll()
+    assert watcher.changed == [] and watcher.deleted == []
+    assert list(catalogue.ids) == ['{P1}', '{P2}', '{P3}', '{P4}']
+    assert hierarchy_calls(app) == [('', HierarchyScope.hsNotebooks),
+                                    ('{N1}', HierarchyScope.hsSections), ('{S1}', HierarchyScope.hsPages), ('{S2}', HierarchyScope.hsPages),
+                                    ('{N2}', HierarchyScope.hsSections), ('{S3}', HierarchyScope.hsPages)]
+
+def test_unchanged_notebooks_are_not_drilled_into():
+    app = make_app()
+    watcher = HierarchyWatcher(app)
+    watcher.poll()
+    app.calls.clear()
+    catalogue = watcher.poll()
+    assert watcher.changed == [] and len(catalogue) == 0
+    assert hierarchy_calls(app) == [('', HierarchyScope.hsNotebooks)]
+
+def test_changed_added_and_deleted_pages():
+    app = make_app()
+    watcher = HierarchyWatcher(app)
+    watcher.poll()
+    app.calls.clear()
+    app.touch('{P1}', '2024-01-02T10:00:00.000Z')
+    app.page('{S1}', '{P5}', 'Agenda')
+    app.touch('{P5}', '2024-01-02T10:00:00.000Z')
+    app.remove('{P2}', '2024-01-02T10:00:00.000Z')
+    catalogue = watcher.poll()
+    assert watcher.changed == ['{P1}', '{P5}']
+    assert watcher.deleted == ['{P2}']
+    assert '{P2}' not in watcher.pages
+    # Only the changed notebook and section are fetched
+    assert hierarchy_calls(app) == [('', HierarchyScope.hsNotebooks), ('{N1}', HierarchyScope.hsSections), ('{S1}', HierarchyScope.hsPages)]
+    assert catalogue['{P5}'].section.get('ID') == '{S1}'
+    assert watcher.poll() is not None and watcher.changed == [] and watcher.deleted == []
+
+def test_deleted_section_reports_its_pages():
+    app = make_app()
+    watcher = HierarchyWatcher(app)
+    watcher.poll()
+    app.remove('{S2}', '2024-01-02T10:00:00.000Z')
+    watcher.poll()
+    assert watcher.changed == [] and watcher.deleted == ['{P3}']
+    assert '{P3}' not in watcher.pages and '{S2}' not in watcher.sections
+
+def poll_changes(app: FakeApp) -> tuple:
+    watcher = HierarchyWatcher(app)
+    watcher.poll()
+    for page_id in ('{P1}', '{P3}', '{P4}'):
+        app.touch(page_id, '2024-01-02T10:00:00.000Z')
+    return watcher, watcher.poll()
+
+def test_changes_within_the_narrowed_scope():
+    watcher, catalogue = poll_changes(make_app())
+    assert list(select_changes(watcher, catalogue)) == ['{P1}', '{P3}', '{P4}']
+    assert list(select_changes(watcher, catalogue, scope={'{N1}'})) == ['{P1}', '{P3}']
+    assert list(select_changes(watcher, catalogue, scope={'{S2}', '{P4}'})) == ['{P3}', '{P4}']
+
+def test_changes_pass_the_filters():
+    watcher, catalogue = poll_changes(make_app())
+    options = ConvertOptions(page_filter=PageFilter(exclude=['Work/Archive']))
+    assert list(select_changes(watcher, catalogue, options)) == ['{P1}', '{P4}']
+
+def test_changed_subpage_brings_its_superpage():
+    app = make_app()
+    app.page('{S1}', '{P6}', 'Minutes', isSubPage='true', pageLevel='2')
+    watcher = HierarchyWatcher(app)
+    watcher.poll()
+    app.touch('{P6}', '2024-01-02T10:00:00.000Z')
+    catalogue = watcher.poll()
+    assert watcher.changed == ['{P6}']
+    assert list(select_changes(watcher, catalogue)) == ['{P2}', '{P6}']